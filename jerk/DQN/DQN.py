@@ -1,61 +1,114 @@
 
-import torch, random
+import torch, random, copy
 from torch import tensor
 import torch.nn as nn
 import torch.optim as optim
-import pandas as pd 
-import numpy as np 
-import matplotlib.pyplot as plt
 from typing import Tuple
 from pathlib import Path
 
 from .network import DQN_Network
-from .memory import Memory
+from .memory import Memory, PrioritizedMemory
+from .inference import InferenceNetwork
 from .util import Transition, device
+from profiler import Profiler
+from metrics import MetricSeries, write_metrics
+from writer import AsyncWriter, submit_write
+
+LOSS_WINDOW_SIZE = 1000   # lossの推移の移動平均を何回の学習でとるか
 
 if device == torch.device("cuda") :
     torch.set_default_tensor_type('torch.cuda.FloatTensor')
 
 class DQN : 
     def __init__(self, init_data : dict[str, any]) : 
-        self.state_dimension = len(init_data["state_columns"])
-        self.action_dimension = len(init_data["jerk_cand"])
+        self.init_policy(init_data)
 
-        self.max_episode = init_data["max_episode"]
-        self.jerk_cand = init_data["jerk_cand"]
-        self.network = DQN_Network(self.state_dimension, self.action_dimension, False, 0)
         self.target_network = DQN_Network(self.state_dimension, self.action_dimension, True, init_data["target_learning_rate"])
-        self.state_columns = init_data["state_columns"]
         self.batch_size = init_data["batch_size"]
         self.gamma = init_data["gamma"]
         self.model_path : Path = init_data["model_path"]
+        self.plot = init_data.get("plot", True)   # write_resultでグラフを描画するか
+
+        # 学習のスケジュール
+        self.train_frequency = init_data.get("train_frequency", 1)   # 何ステップ毎に学習するか
+        self.gradient_steps = init_data.get("gradient_steps", 1)   # 1回の学習で何回パラメータを更新するか
+        self.learning_starts = init_data.get("learning_starts", None)   # memoryがこの数を超えたら学習を始める
+        if self.learning_starts == None : 
+            self.learning_starts = self.batch_size * 10
 
-        self.memory = Memory({
-            "buffer_size" : init_data["buffer_size"]
-        })
+        # 優先度付き経験再生（経験の選び方と損失の重みが変わる）
+        self.prioritized_replay = init_data.get("prioritized_replay", False)
+        self.priority_beta = init_data.get("priority_beta", 0.4)   # 重要度サンプリングの補正の強さの初期値（max_episodeで1にする）
+        if self.prioritized_replay : 
+            self.memory = PrioritizedMemory({
+                "buffer_size" : init_data["buffer_size"], 
+                "state_dimension" : self.state_dimension, 
+                "priority_alpha" : init_data.get("priority_alpha", 0.6), 
+                "priority_epsilon" : init_data.get("priority_epsilon", 1e-6)
+            })
+        else : 
+            self.memory = Memory({
+                "buffer_size" : init_data["buffer_size"], 
+                "state_dimension" : self.state_dimension
+            })
 
         # target_networkの初期値をnetworkと一致させる
         self.target_network.inititalize_target(self.network)
 
         self.optimizer = optim.Adam(self.network.parameters(), lr=init_data["learning_rate"], amsgrad=True)
 
-        self.pos_episode = 1
+        self.loss_series = MetricSeries(LOSS_WINDOW_SIZE)   # lossの推移（全ての値は持たない）
+        self.writer : AsyncWriter = None   # 設定されていればwrite_resultの書き出しを別スレッドで行う
 
-        self.loss_list = []
 
+    # 行動選択に使うもの（network、推論用のコピー、epsilonのスケジュール）を作る
+    # 並列実行のworker（RolloutDQN）はこれだけを作り、target_network・optimizer・memoryは持たない
+    def init_policy(self, init_data : dict[str, any]) -> None : 
+        self.state_dimension = len(init_data["state_columns"])
+        self.action_dimension = len(init_data["jerk_cand"])
 
+        self.max_episode = init_data["max_episode"]
+        self.jerk_cand = init_data["jerk_cand"]
+        self.network = DQN_Network(self.state_dimension, self.action_dimension, False, 0)
+        self.state_columns = init_data["state_columns"]
+        self.profiler = Profiler(init_data.get("profile", False))   # optimizeの各処理の時間を計測する
+
+        # 行動選択に推論用のコピー（低精度・量子化・compile）を使う場合
+        # 重みはupdate_targetと同じタイミングで写す（sync_inference_network）
+        self.inference_network = None
+        inference_dtype = init_data.get("inference_dtype", "float32")
+        inference_compile_mode = init_data.get("inference_compile_mode", None)
+        if inference_dtype != "float32" or inference_compile_mode != None : 
+            self.inference_network = InferenceNetwork(self.network, inference_dtype, inference_compile_mode, init_data.get("inference_sync_interval", 1))
+
+        self.env_step_count = 0
+        self.pos_episode = 1
+
+
+    # シミュレーションの1ステップ毎に呼ばれる
     def optimize(self) : 
-        if self.batch_size * 10 >= len(self.memory) : 
+        self.env_step_count += 1
+        if self.env_step_count % self.train_frequency != 0 : 
             return 
-         
-        transitions = self.memory.sample(self.batch_size)
-        batch = Transition(*zip(*transitions))
-        non_final_mask = torch.tensor(tuple(map(lambda s: s is not None, 
-                                                batch.next_state)), device=device, dtype=torch.bool)
-        non_final_next_states = torch.cat([s for s in batch.next_state if s is not None])
-        state_batch = torch.cat(batch.state)
-        action_batch = torch.cat(batch.action)
-        reward_batch = torch.cat(batch.reward)
+        if self.learning_starts >= len(self.memory) or self.batch_size > len(self.memory) : 
+            return 
+        
+        for _ in range(self.gradient_steps) : 
+            self.optimize_once()
+
+
+    def optimize_once(self) : 
+        self.profiler.start()
+        if self.prioritized_replay : 
+            batch, weight, index = self.memory.sample_with_weight(self.batch_size, self.calculate_priority_beta())
+        else : 
+            batch : Transition = self.memory.sample(self.batch_size)
+        non_final_mask = ~batch.done
+        non_final_next_states = batch.next_state[non_final_mask]
+        state_batch = batch.state
+        action_batch = batch.action
+        reward_batch = batch.reward
+        self.profiler.lap("optimize.sample")
 
         state_action_values = self.network.forward(state_batch).gather(1, action_batch)
 
@@ -64,17 +117,41 @@ class DQN :
             next_state_values[non_final_mask] = self.target_network.forward(non_final_next_states).max(1)[0]
         expected_state_action_values = (next_state_values * self.gamma) + reward_batch
 
-        criterion = nn.SmoothL1Loss()   # Huber損失、大きな誤差に対して鈍感
-        loss = criterion(state_action_values, expected_state_action_values.unsqueeze(1))
-        self.loss_list.append(loss.item())
+        if self.prioritized_replay : 
+            # 経験毎のHuber損失に重要度サンプリングの重みを掛け、TD誤差で優先度を更新する
+            criterion = nn.SmoothL1Loss(reduction="none")
+            loss = (criterion(state_action_values, expected_state_action_values.unsqueeze(1)).squeeze(1) * weight).mean()
+            td_error = state_action_values.detach().squeeze(1) - expected_state_action_values
+            self.memory.update_priority(index, td_error.cpu().numpy())
+        else : 
+            criterion = nn.SmoothL1Loss()   # Huber損失、大きな誤差に対して鈍感
+            loss = criterion(state_action_values, expected_state_action_values.unsqueeze(1))
+        self.loss_series.add(loss.item())
+        self.profiler.lap("optimize.forward")
 
         self.optimizer.zero_grad()
         loss.backward()
         torch.nn.utils.clip_grad_value_(self.network.parameters(), 100)   # clip 大きなパラメータ更新が起きるのを防ぐ
         self.optimizer.step()
+        self.profiler.lap("optimize.backward")
 
         # targetを更新
         self.target_network.update_target(self.network)
+        self.sync_inference_network()
+        self.profiler.lap("optimize.update_target")
+
+
+    # networkの重みが変わったときに呼ぶ（推論用のコピーは次の行動選択の前に更新される）
+    def sync_inference_network(self, force : bool = False) -> None : 
+        if self.inference_network != None : 
+            self.inference_network.request_sync(force)
+
+
+    # 行動選択に使うQ値
+    def forward_action(self, state_tensor : tensor) -> tensor : 
+        if self.inference_network != None : 
+            return self.inference_network.forward(state_tensor)
+        return self.network.forward(state_tensor)
 
     # epsilon-greedy
     def decide_action(self, state : dict[str, any]) -> int : 
@@ -82,44 +159,74 @@ class DQN :
             return random.randint(0, 1000) % self.action_dimension
         else : 
             with torch.no_grad() : 
-                state_tensor = tensor([state[col] for col in self.state_columns], device=device, dtype=torch.float32)
-                action = torch.argmax(self.network.forward(state_tensor))
+                state_tensor = tensor(self.get_state_row(state), device=device, dtype=torch.float32)
+                action = torch.argmax(self.forward_action(state_tensor))
                 return action.item()
+
+
+    # 複数の状態（1行が1台分）に対してまとめてepsilon-greedyを行う
+    # 乱数の使い方はdecide_actionを行の順に呼んだ場合と同じ
+    # pos_episode_listを渡すと行毎にそのエピソードのepsilonを使う
+    def decide_action_batch(self, state_matrix : list[list[float]], pos_episode_list : list[int] = None) -> list[int] : 
+        epsilon = self.calculate_epsilon()
+        action_list = []
+        greedy_index_list = []
+        for index in range(len(state_matrix)) : 
+            if pos_episode_list != None : 
+                epsilon = self.calculate_epsilon(pos_episode_list[index])
+            if random.uniform(0, 1) <= epsilon : 
+                action_list.append(random.randint(0, 1000) % self.action_dimension)
+            else : 
+                action_list.append(None)
+                greedy_index_list.append(index)
+
+        if len(greedy_index_list) > 0 : 
+            with torch.no_grad() : 
+                state_tensor = tensor([state_matrix[index] for index in greedy_index_list], device=device, dtype=torch.float32)
+                greedy_action_list = torch.argmax(self.forward_action(state_tensor), dim=1).tolist()
+            for index, action in zip(greedy_index_list, greedy_action_list) : 
+                action_list[index] = action
+
+        return action_list
+
+
+    def get_state_row(self, state : dict[str, any]) -> list[float] : 
+        return [state[col] for col in self.state_columns]
         
 
-    def calculate_epsilon(self) : 
+    def calculate_epsilon(self, pos_episode : int = None) : 
+        if pos_episode == None : 
+            pos_episode = self.pos_episode
         half_episode = self.max_episode // 2
-        if self.pos_episode < half_episode : 
-            epsilon = (half_episode - self.pos_episode) / half_episode * 0.4 + 0.1 
+        if pos_episode < half_episode : 
+            epsilon = (half_episode - pos_episode) / half_episode * 0.4 + 0.1 
         else : 
-            epsilon = (self.max_episode - self.pos_episode) / half_episode * 0.1
+            epsilon = (self.max_episode - pos_episode) / half_episode * 0.1
         return epsilon
     
 
+    # 重要度サンプリングの補正の強さ（epsilonと同じくエピソードで決まり、max_episodeで1になる）
+    def calculate_priority_beta(self) -> float : 
+        return min(1.0, self.priority_beta + (1.0 - self.priority_beta) * self.pos_episode / self.max_episode)
+
+
     def push_experience(self, state : dict[str, any], action, next_state : dict[str, any], reward, is_goal) : 
         # next_stateのみ特別扱い
         if is_goal : 
             next_state = None 
         else : 
-            next_state = tensor([[next_state[col] for col in self.state_columns]], device=device)
+            next_state = self.get_state_row(next_state)
         
-        self.memory.push(
-            tensor([[state[col] for col in self.state_columns]], device=device), 
-            tensor([[action]], device=device), 
-            next_state, 
-            tensor([reward], device=device)
-        )
+        self.memory.push(self.get_state_row(state), action, next_state, reward)
 
 
     def get_eval_state(self) -> None : 
-        transitions = self.memory.sample(self.batch_size)
-        batch = Transition(*zip(*transitions))
-        non_final_mask = torch.tensor(tuple(map(lambda s: s is not None, 
-                                                batch.next_state)), device=device, dtype=torch.bool)
-        non_final_next_states = torch.cat([s for s in batch.next_state if s is not None])
-        state_batch = torch.cat(batch.state)
-        action_batch = torch.cat(batch.action)
-        reward_batch = torch.cat(batch.reward)
+        batch : Transition = self.memory.sample(self.batch_size)
+        non_final_mask = ~batch.done
+        non_final_next_states = batch.next_state[non_final_mask]
+        state_batch = batch.state
+        action_batch = batch.action
+        reward_batch = batch.reward
 
         state_action_values = self.network.forward(state_batch).gather(1, action_batch)
 
@@ -129,33 +236,44 @@ class DQN :
         expected_state_action_values = (next_state_values * self.gamma) + reward_batch
 
     
+    # 学習の状態（network, target_network, optimizer, 学習の回数）の複製（memoryはMemory::saveで書き出す）
+    # 書き出しを別スレッドで行っても、学習を続けて変わらないようにする
+    def get_checkpoint(self) -> dict[str, any] : 
+        return {
+            "network" : {key : value.clone() for key, value in self.network.state_dict().items()}, 
+            "target_network" : {key : value.clone() for key, value in self.target_network.state_dict().items()}, 
+            "optimizer" : copy.deepcopy(self.optimizer.state_dict()), 
+            "env_step_count" : self.env_step_count, 
+            "pos_episode" : self.pos_episode, 
+            "loss_series" : copy.deepcopy(self.loss_series)
+        }
+
+
+    def load_checkpoint(self, path : Path) -> None : 
+        checkpoint = torch.load(path.joinpath("dqn.pth"), map_location=device, weights_only=False)
+        self.network.load_state_dict(checkpoint["network"])
+        self.target_network.load_state_dict(checkpoint["target_network"])
+        self.optimizer.load_state_dict(checkpoint["optimizer"])
+        self.env_step_count = checkpoint["env_step_count"]
+        self.pos_episode = checkpoint["pos_episode"]
+        self.loss_series = checkpoint["loss_series"]
+        self.memory.load(path.joinpath("memory"))
+        self.sync_inference_network(force=True)
+
+
+    # 書き出す内容はここで複製し、ファイルへの書き出しとグラフの描画はwriterで行う
     def write_result(self) -> None : 
         # DQNを保存
-        torch.save(self.network, self.model_path.joinpath("model_weight.pth"))
-
-        # lossのグラフを描画
-        normalized_loss_list = self.get_normalize_list(self.loss_list)
-        if len(normalized_loss_list) >= 2 : 
-            time_list = [i for i in range(len(normalized_loss_list))]
-            plt.plot(time_list, normalized_loss_list)
-            plt.xlabel("opt times", fontsize = 14)
-            plt.ylabel("loss", fontsize = 14)
-            plt.xticks(fontsize = 12)
-            plt.yticks(fontsize = 12)
-            plt.yscale("log")
-            plt.grid()
-            plt.savefig(self.model_path.joinpath("loss.png"), bbox_inches="tight")
-            plt.clf()
+        submit_write(self.writer, "model", torch.save, copy.deepcopy(self.network), self.model_path.joinpath("model_weight.pth"))
 
-    
-    # 移動平均を計算
-    def get_normalize_list(self, target_list : list[float], size = 1000) -> list[float] : 
-        ret = []
-        pos_sum = sum(target_list[: size])
-        for i in range(len(target_list) - size) : 
-            pos_sum = pos_sum - target_list[i] + target_list[i + size]
-            ret.append(pos_sum / size)
-        return ret
+        # lossの推移を書き出す
+        metrics_path = self.model_path.joinpath("metrics.json")
+        submit_write(self.writer, "metrics", write_metrics, metrics_path, {"loss" : self.loss_series.to_dict()})
+
+        if self.plot == False : 
+            return
+        from report import plot_metrics   # matplotlibは描画するときだけ読み込む
+        submit_write(self.writer, "plot", plot_metrics, metrics_path)
     
 
 
@@ -0,0 +1,105 @@
+import copy
+import torch
+import torch.nn as nn
+from torch import tensor
+
+from .network import DQN_Network
+
+
+INFERENCE_DTYPE_LIST = ["float32", "float16", "bfloat16", "int8"]
+INFERENCE_COMPILE_MODE_LIST = [None, "script", "compile"]
+
+
+# 行動選択だけに使う、学習するnetworkの推論用のコピー
+# dtype   : float32, float16, bfloat16, int8（Linearの重みをint8に動的量子化）
+# compile_mode : None, "script"（TorchScriptのtrace）, "compile"（torch.compile）
+# networkが更新されたらrequest_syncを呼び、sync_interval回毎に次の推論の前に重みを写す
+# （int8は写すたびに量子化し直し、作ってあるモジュールの重みを置き換える。torch.compileしたモジュールだけは作り直す）
+class InferenceNetwork : 
+    def __init__(self, network : DQN_Network, dtype : str = "float32", compile_mode : str = None, sync_interval : int = 1) -> None:
+        assert dtype in INFERENCE_DTYPE_LIST, "unknown inference dtype : " + str(dtype)
+        assert compile_mode in INFERENCE_COMPILE_MODE_LIST, "unknown inference compile mode : " + str(compile_mode)
+        self.network = network
+        self.dtype = dtype
+        self.compile_mode = compile_mode
+        self.sync_interval = sync_interval
+
+        # int8の動的量子化は入力をfloat32のまま受け取る
+        self.input_dtype = torch.float32 if dtype in ["float32", "int8"] else getattr(torch, dtype)
+
+        self.copy_network : nn.Module = None   # 重みを写す先
+        self.module : nn.Module = None   # 推論に使う（compileしない場合はcopy_networkと同じ）
+        self.request_count = 0
+        self.stale = True
+        self.sync_count = 0
+
+
+    # forceなら回数に関わらず次の推論の前に写す（重みを読み込んだ場合など）
+    def request_sync(self, force : bool = False) -> None : 
+        self.request_count += 1
+        if force or self.request_count % self.sync_interval == 0 : 
+            self.stale = True
+
+
+    def sync(self) -> None : 
+        with torch.no_grad() : 
+            if self.module == None or (self.dtype == "int8" and self.compile_mode == "compile") : 
+                self.build()
+            elif self.dtype == "int8" : 
+                self.quantize()
+            else : 
+                # traceしたモジュール、torch.compileしたモジュールはcopy_networkの重みをそのまま使う
+                for copy_param, param in zip(self.copy_network.parameters(), self.network.parameters()) : 
+                    copy_param.copy_(param)
+        self.stale = False
+        self.sync_count += 1
+
+
+    # networkのLinearの重みをint8に量子化し（quantize_dynamicと同じ値）、copy_networkの重みを置き換える
+    # traceしたモジュールは重みを別に持つので、そちらも置き換える
+    def quantize(self) -> None : 
+        module_list = [self.copy_network] if self.module is self.copy_network else [self.copy_network, self.module]
+        for name, linear in self.network.named_children() : 
+            if isinstance(linear, nn.Linear) == False : 
+                continue
+            weight = linear.weight.detach().float()
+            observer = torch.ao.quantization.default_dynamic_qconfig.weight()
+            observer(weight)
+            scale, zero_point = observer.calculate_qparams()
+            weight = torch.quantize_per_tensor(weight, float(scale), int(zero_point), torch.qint8)
+            bias = None if linear.bias is None else linear.bias.detach().clone()
+            for module in module_list : 
+                getattr(module, name)._packed_params.set_weight_bias(weight, bias)
+
+
+    def build(self) -> None : 
+        copy_network = copy.deepcopy(self.network).eval()
+        for param in copy_network.parameters() : 
+            param.requires_grad_(False)
+        if self.dtype == "int8" : 
+            copy_network = torch.ao.quantization.quantize_dynamic(copy_network, {nn.Linear}, dtype=torch.qint8)
+        else : 
+            copy_network = copy_network.to(self.input_dtype)
+        self.copy_network = copy_network
+
+        if self.compile_mode == "script" : 
+            example = torch.zeros(1, self.network.fc1.in_features, dtype=self.input_dtype)
+            self.module = torch.jit.trace(copy_network, example)
+        elif self.compile_mode == "compile" : 
+            self.module = torch.compile(copy_network)
+        else : 
+            self.module = copy_network
+
+
+    # 入力・出力はfloat32（1行でも複数行でもよい）
+    def forward(self, x : tensor) -> tensor : 
+        if self.stale : 
+            self.sync()
+        with torch.no_grad() : 
+            if x.dim() == 1 : 
+                return self.module(x.unsqueeze(0).to(self.input_dtype))[0].float()
+            return self.module(x.to(self.input_dtype)).float()
+
+
+    def __call__(self, x : tensor) -> tensor : 
+        return self.forward(x)
@@ -1,21 +1,165 @@
+import random, json
+from pathlib import Path
+import numpy as np
+import torch
 
-from collections import deque
-import random
+from .util import Transition, device
+from .sum_tree import SumTree
 
-from .util import Transition 
+MEMORY_ARRAY_NAME_LIST = ["state", "action", "next_state", "reward", "done"]   # save, loadする配列
 
+
+# 固定長の配列に経験を書き込むリングバッファ
 class Memory(object):
     def __init__(self, init_data : dict[str, any]):
-        self.memory = deque([], maxlen=init_data["buffer_size"])
+        self.buffer_size = init_data["buffer_size"]
+        state_dimension = init_data["state_dimension"]
+
+        self.state = np.zeros((self.buffer_size, state_dimension), dtype=np.float32)
+        self.action = np.zeros(self.buffer_size, dtype=np.int64)
+        self.next_state = np.zeros((self.buffer_size, state_dimension), dtype=np.float32)
+        self.reward = np.zeros(self.buffer_size, dtype=np.float32)
+        self.done = np.zeros(self.buffer_size, dtype=bool)   # next_stateが存在しない（終端）
+
+        self.cursor = 0   # 次に書き込む位置
+        self.size = 0
+
+    # next_stateがNoneのときは終端として扱う
+    def push(self, state : list[float], action : int, next_state : list[float], reward : float):
+        index = self.cursor
+        self.state[index] = state
+        self.action[index] = action
+        self.reward[index] = reward
+        if next_state is None : 
+            self.next_state[index] = 0
+            self.done[index] = True
+        else : 
+            self.next_state[index] = next_state
+            self.done[index] = False
+
+        self.cursor = (self.cursor + 1) % self.buffer_size
+        self.size = min(self.size + 1, self.buffer_size)
+
+    # 複数の経験をまとめて書き込む（各引数は1行が1経験の配列）
+    def push_batch(self, state : np.ndarray, action : np.ndarray, next_state : np.ndarray, reward : np.ndarray, done : np.ndarray):
+        size = len(action)
+        if size > self.buffer_size : 
+            state, action, next_state, reward, done = state[-self.buffer_size :], action[-self.buffer_size :], \
+                next_state[-self.buffer_size :], reward[-self.buffer_size :], done[-self.buffer_size :]
+            size = self.buffer_size
 
-    def push(self, *args):
-        self.memory.append(Transition(*args))
+        index = (self.cursor + np.arange(size)) % self.buffer_size
+        self.state[index] = state
+        self.action[index] = action
+        self.next_state[index] = np.where(done[:, None], 0, next_state)
+        self.reward[index] = reward
+        self.done[index] = done
 
-    def sample(self, batch_size):
-        return random.sample(self.memory, batch_size)
+        self.cursor = (self.cursor + size) % self.buffer_size
+        self.size = min(self.size + size, self.buffer_size)
+
+    def sample(self, batch_size) -> Transition:
+        # 古い順に並べたときの番号で選ぶ（dequeからrandom.sampleした場合と同じ経験が選ばれる）
+        order = np.array(random.sample(range(self.size), batch_size))
+        return self.get_batch(self.get_index(order))
     
-    def get_all(self) : 
-        return self.memory[:]
+    def get_all(self) -> Transition: 
+        return self.get_batch(self.get_index(np.arange(self.size)))
+
+    # 古い順の番号を配列上の位置に変換する
+    def get_index(self, order : np.ndarray) -> np.ndarray : 
+        start = self.cursor if self.size == self.buffer_size else 0
+        return (start + order) % self.buffer_size
+
+    def get_batch(self, index : np.ndarray) -> Transition : 
+        return Transition(
+            torch.from_numpy(self.state[index]).to(device), 
+            torch.from_numpy(self.action[index]).unsqueeze(1).to(device), 
+            torch.from_numpy(self.next_state[index]).to(device), 
+            torch.from_numpy(self.reward[index]).to(device), 
+            torch.from_numpy(self.done[index]).to(device)
+        )
 
     def __len__(self):
-        return len(self.memory)
\ No newline at end of file
+        return self.size
+
+    # 配列を.npyに書き出す（読み込みはmmapで行うので、大きなmemoryでもすぐに終わる）
+    def save(self, path : Path):
+        path.mkdir(parents=True, exist_ok=True)
+        for name in MEMORY_ARRAY_NAME_LIST : 
+            np.save(path.joinpath(name + ".npy"), getattr(self, name))
+        with open(path.joinpath("memory.json"), "w") as f : 
+            json.dump({"cursor" : self.cursor, "size" : self.size}, f)
+
+    # 配列はファイルをcopy-on-writeでmmapしたものを使う（書き込んだページだけがメモリに複製される）
+    # 読み込んだファイルは上書きせず、次のsaveは別のディレクトリに書き出すこと
+    def load(self, path : Path):
+        for name in MEMORY_ARRAY_NAME_LIST : 
+            array = np.load(path.joinpath(name + ".npy"), mmap_mode="c")
+            assert array.shape == getattr(self, name).shape, "memory shape mismatch : " + name + " " + str(array.shape)
+            setattr(self, name, array)
+        with open(path.joinpath("memory.json"), "r") as f : 
+            meta = json.load(f)
+        self.cursor = meta["cursor"]
+        self.size = meta["size"]
+
+
+# 優先度付き経験再生（Prioritized Experience Replay）
+# 経験をTD誤差の大きさ^alphaに比例した確率で選び、偏りは重要度サンプリングの重みで補正する
+# 優先度はSumTreeに持つ（位置はMemoryの配列上の位置と同じ）
+class PrioritizedMemory(Memory):
+    def __init__(self, init_data : dict[str, any]):
+        super().__init__(init_data)
+        self.alpha = init_data.get("priority_alpha", 0.6)   # 0なら一様に選ぶ
+        self.epsilon = init_data.get("priority_epsilon", 1e-6)   # TD誤差が0の経験も選ばれるようにする
+        self.tree = SumTree(self.buffer_size)
+        self.max_priority = 1.0   # 新しい経験は今までの最大の優先度で書き込み、一度は選ばれやすくする
+
+    def push(self, state : list[float], action : int, next_state : list[float], reward : float):
+        self.tree.update_one(self.cursor, self.max_priority)
+        super().push(state, action, next_state, reward)
+
+    def push_batch(self, state : np.ndarray, action : np.ndarray, next_state : np.ndarray, reward : np.ndarray, done : np.ndarray):
+        size = min(len(action), self.buffer_size)
+        index = (self.cursor + np.arange(size)) % self.buffer_size
+        self.tree.update(index, np.full(size, self.max_priority))
+        super().push_batch(state, action, next_state, reward, done)
+
+    # 優先度に比例してbatch_size個を選び、経験・重要度サンプリングの重み・配列上の位置を返す
+    # 優先度の合計をbatch_size等分した区間から1つずつ選ぶ
+    def sample_with_weight(self, batch_size : int, beta : float) -> tuple[Transition, torch.Tensor, np.ndarray]:
+        total = self.tree.total()
+        segment = total / batch_size
+        value = (np.arange(batch_size) + np.random.uniform(0, 1, batch_size)) * segment
+        index = self.tree.find(np.minimum(value, np.nextafter(total, 0)))
+
+        # 重みは一様に選んだ場合との確率の比の-beta乗（batch内の最大で割って1以下にする）
+        probability = self.tree.get(index) / total
+        weight = (self.size * probability) ** (-beta)
+        weight /= weight.max()
+        return self.get_batch(index), torch.from_numpy(weight.astype(np.float32)).to(device), index
+
+    # 学習で求めたTD誤差で優先度を更新する
+    def update_priority(self, index : np.ndarray, td_error : np.ndarray):
+        priority = (np.abs(td_error) + self.epsilon) ** self.alpha
+        self.tree.update(index, priority)
+        self.max_priority = max(self.max_priority, float(priority.max()))
+
+    def save(self, path : Path):
+        super().save(path)
+        np.save(path.joinpath("priority.npy"), self.tree.tree)
+        with open(path.joinpath("priority.json"), "w") as f : 
+            json.dump({"max_priority" : self.max_priority}, f)
+
+    def load(self, path : Path):
+        super().load(path)
+        # 優先度付きでない学習のmemoryを読み込んだ場合は、全ての経験を同じ優先度にする
+        if path.joinpath("priority.npy").exists() == False : 
+            if self.size > 0 : 
+                self.tree.update(self.get_index(np.arange(self.size)), np.full(self.size, self.max_priority))
+            return
+        tree = np.load(path.joinpath("priority.npy"), mmap_mode="c")
+        assert tree.shape == self.tree.tree.shape, "priority shape mismatch : " + str(tree.shape)
+        self.tree.tree = tree
+        with open(path.joinpath("priority.json"), "r") as f : 
+            self.max_priority = json.load(f)["max_priority"]
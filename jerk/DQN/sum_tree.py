@@ -0,0 +1,60 @@
+import numpy as np
+
+
+# 各要素の優先度を葉に、子の和を親に持つ完全二分木（配列で表す、根は1番、nodeの子は2 * node, 2 * node + 1）
+# 優先度の更新と、優先度に比例した要素の選択がO(log N)で行える
+class SumTree : 
+    def __init__(self, capacity : int) -> None:
+        self.capacity = capacity
+        self.leaf_start = 1   # 葉の数（capacity以上の2の累乗）、葉はtree[leaf_start :]
+        while self.leaf_start < capacity : 
+            self.leaf_start *= 2
+        self.tree = np.zeros(2 * self.leaf_start, dtype=np.float64)
+
+
+    def total(self) -> float : 
+        return float(self.tree[1])
+
+
+    def get(self, index : np.ndarray) -> np.ndarray : 
+        return self.tree[index + self.leaf_start]
+
+
+    # 1要素の更新（経験を1つ書き込むたびに呼ぶので、numpyの配列演算を使わない）
+    def update_one(self, index : int, priority : float) -> None : 
+        tree = self.tree
+        node = index + self.leaf_start
+        tree[node] = priority
+        node //= 2
+        while node >= 1 : 
+            tree[node] = tree[2 * node] + tree[2 * node + 1]
+            node //= 2
+
+
+    # 複数要素の更新（同じindexがあれば後の値になる）
+    # 葉は全て同じ深さにあるので、1段ずつ親をまとめて計算し直す
+    def update(self, index : np.ndarray, priority : np.ndarray) -> None : 
+        tree = self.tree
+        node = np.asarray(index, dtype=np.int64) + self.leaf_start
+        tree[node] = priority
+        node = np.unique(node // 2)
+        while node[0] >= 1 : 
+            tree[node] = tree[2 * node] + tree[2 * node + 1]
+            if node[0] == 1 : 
+                break
+            node = np.unique(node // 2)
+
+
+    # 各valueについて、葉の優先度を並べた累積和でvalueの位置にある要素を返す（valueは0以上total未満）
+    def find(self, value : np.ndarray) -> np.ndarray : 
+        tree = self.tree
+        value = np.array(value, dtype=np.float64)
+        node = np.ones(len(value), dtype=np.int64)
+        while node[0] < self.leaf_start : 
+            left = 2 * node
+            left_value = tree[left]
+            # 丸め誤差で優先度0の要素（まだ書き込まれていない位置）を選ばないようにする
+            go_right = (value >= left_value) & (tree[left + 1] > 0)
+            value = np.where(go_right, value - left_value, value)
+            node = np.where(go_right, left + 1, left)
+        return node - self.leaf_start
@@ -1,6 +1,7 @@
 from collections import namedtuple
 import torch
 
+# Memoryから取り出した経験のバッチ（各要素はbatch_size行のtensor）
 Transition = namedtuple('Transition', 
-                        ('state', 'action', 'next_state', 'reward'))
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
\ No newline at end of file
+                        ('state', 'action', 'next_state', 'reward', 'done'))
+device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
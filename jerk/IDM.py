@@ -5,6 +5,7 @@ if TYPE_CHECKING:
     from .vehicle import Vehicle
 
 import math
+import numpy as np
 
 
 T = 1.5   # safe time headway
@@ -13,19 +14,110 @@ b = 1.67  # 減速度最大値
 d = 4     # acceleration exponent 
 s0 = 2    # 距離最小値
 
+# 車毎のIDMのパラメータ（vehicle_init_data["idm_parameter"]、省略したものは上の値、v0は車のlimit_velocity）
+IDM_PARAMETER_NAME_LIST = ["v0", "T", "a", "b", "d", "s0"]
+DEFAULT_IDM_PARAMETER = {"T" : T, "a" : a, "b" : b, "d" : d, "s0" : s0}
+
+
+# IDM_PARAMETER_NAME_LISTの順に並べたtuple（Vehicle::idm_parameter）
+def get_idm_parameter(idm_parameter : dict[str, float], limit_velocity : float) -> tuple[float, ...] : 
+    idm_parameter = {"v0" : limit_velocity} | DEFAULT_IDM_PARAMETER | (idm_parameter or {})
+    return tuple(idm_parameter[name] for name in IDM_PARAMETER_NAME_LIST)
+
+
 def get_jerk_by_IDM(vehicle : Vehicle) -> float : 
-    v0 = vehicle.limit_velocity   # 希望速度
-    v = vehicle.state["velocity"]
-    dv = vehicle.state["velocity"] - vehicle.state["front_vehicle_velocity"]
-    s = vehicle.state["front_vehicle_distance"]
-    prev_accel = vehicle.state["accel"]
-    delta_t = vehicle.simulator.delta_t
-    s_star = s0 + v * T + v * dv / (2 * math.sqrt(a * b))
-    next_accel = a * (1 - (v / v0) ** d - (s_star / s) ** 2)
+    return vehicle.simulator.idm_controller.get_jerk(vehicle)
+
+
+# 1つのSimulatorのIDMの車のjerkを求める（Simulator::idm_controller）
+# get_jerk_listは配列でまとめて求めるが、get_jerk（1台ずつ）と同じ演算を同じ順で行うので値は一致する
+# （numpyのpowは最後の桁がPythonの**と異なることがあるので使わない。calculate_powerを参照）
+# パラメータの配列は、車のパラメータが前のステップと変わったとき（車の出入り）だけ作り直す
+class IDMController : 
+    def __init__(self, delta_t : float) -> None:
+        self.delta_t = delta_t
+        self.parameter_list : list[tuple[float, ...]] = []
+        self.parameter_array = np.zeros((len(IDM_PARAMETER_NAME_LIST), 0))   # [パラメータ, 車]
+        self.exponent_index_list : list[tuple[float, any]] = []   # (d, dがその値の車の位置)
+
+
+    def get_jerk(self, vehicle : Vehicle) -> float : 
+        v0, T, a, b, d, s0 = vehicle.idm_parameter
+        v = vehicle.state["velocity"]
+        dv = vehicle.state["velocity"] - vehicle.state["front_vehicle_velocity"]
+        s = vehicle.state["front_vehicle_distance"]
+        prev_accel = vehicle.state["accel"]
+        s_star = s0 + v * T + v * dv / (2 * math.sqrt(a * b))
+        distance_ratio = s_star / s
+        next_accel = a * (1 - calculate_power(v / v0, d) - distance_ratio * distance_ratio)
+        jerk = (next_accel - prev_accel) / self.delta_t   # 得られた加速度をjerkに変換
+        return jerk
+
+
+    def get_jerk_list(self, vehicle_list : list[Vehicle]) -> list[float] : 
+        parameter_list = [vehicle.idm_parameter for vehicle in vehicle_list]
+        if parameter_list != self.parameter_list : 
+            self.parameter_list = parameter_list
+            self.parameter_array = np.ascontiguousarray(np.array(parameter_list, dtype=np.float64).reshape(-1, len(IDM_PARAMETER_NAME_LIST)).T)
+
+            # dが全ての車で同じとき（通常）は配列をそのまま使う
+            d_list = [parameter[IDM_PARAMETER_NAME_LIST.index("d")] for parameter in parameter_list]
+            d_set = set(d_list)
+            if len(d_set) == 1 : 
+                self.exponent_index_list = [(d_list[0], slice(None))]
+            else : 
+                d_array = np.array(d_list, dtype=np.float64)
+                self.exponent_index_list = [(d, np.flatnonzero(d_array == d)) for d in d_set]
+
+        state_list = []
+        for vehicle in vehicle_list : 
+            state = vehicle.state
+            state_list += (state.velocity, state.front_vehicle_velocity, state.front_vehicle_distance, state.accel)
+        v, front_v, s, prev_accel = np.ascontiguousarray(np.array(state_list, dtype=np.float64).reshape(-1, 4).T)
+        v0, T, a, b, _, s0 = self.parameter_array
+        return calculate_jerk_by_IDM(v, v - front_v, s, prev_accel, self.delta_t, v0, T, a, b, s0, self.exponent_index_list).tolist()
+
+
+# IDMController::get_jerkと同じ式を配列で計算する（dはexponent_index_listで渡す）
+def calculate_jerk_by_IDM(v : np.ndarray, dv : np.ndarray, s : np.ndarray, prev_accel : np.ndarray, delta_t : float, 
+                          v0 : np.ndarray, T : np.ndarray, a : np.ndarray, b : np.ndarray, s0 : np.ndarray, 
+                          exponent_index_list : list[tuple[float, any]]) -> np.ndarray : 
+    s_star = s0 + v * T + v * dv / (2 * np.sqrt(a * b))
+    distance_ratio = s_star / s
+    next_accel = a * (1 - calculate_power_array(v / v0, exponent_index_list) - distance_ratio * distance_ratio)
     jerk = (next_accel - prev_accel) / delta_t   # 得られた加速度をjerkに変換
     return jerk
 
 
+def is_integer_exponent(d : float) -> bool : 
+    return float(d).is_integer() and d >= 0
+
+
+# x ** d（配列でも1台ずつでも同じ値になるように、四則演算とmath.powだけで計算する）
+# 整数のdは左から順に掛け、それ以外はmath.powを使う
+def calculate_power(x : float, d : float) -> float : 
+    if is_integer_exponent(d) : 
+        power = 1.0
+        for _ in range(int(d)) : 
+            power *= x
+        return power
+    return math.pow(x, d)
+
+
+def calculate_power_array(x : np.ndarray, exponent_index_list : list[tuple[float, any]]) -> np.ndarray : 
+    power = np.empty_like(x)
+    for d, index in exponent_index_list : 
+        pos_x = x[index]
+        if is_integer_exponent(d) : 
+            pos_power = np.ones_like(pos_x)
+            for _ in range(int(d)) : 
+                pos_power *= pos_x
+        else : 
+            pos_power = np.array([math.pow(value, d) for value in pos_x.tolist()], dtype=np.float64)
+        power[index] = pos_power
+    return power
+
+
 def get_proper_front_vehicle_distance(vehicle : Vehicle) -> float : 
     return vehicle.state["velocity"] * 1.26
     """
@@ -0,0 +1,58 @@
+import subprocess, sys, json, statistics, argparse
+from pathlib import Path
+
+from const import ROOT_DIR
+
+# シミュレーションと学習に必要なモジュールだけを読み込んだときの起動時間を測る
+# matplotlib, pandasが読み込まれていないことも確認する
+CORE_IMPORT = "import world, simulator, parallel, vec_simulator, DQN.DQN"
+CHECK_CODE = CORE_IMPORT + "; import sys; print(','.join(m for m in ['matplotlib', 'pandas'] if m in sys.modules))"
+TIME_CODE = "import time; t = time.perf_counter(); " + CORE_IMPORT + "; print(time.perf_counter() - t)"
+
+
+def run_python(code : str, *options : str) -> subprocess.CompletedProcess : 
+    return subprocess.run([sys.executable, *options, "-c", code], cwd=ROOT_DIR, capture_output=True, text=True, check=True)
+
+
+# python -X importtimeの出力から、パッケージ毎の累積時間が大きいものを取り出す
+def get_slow_package_list(size : int = 10) -> list[tuple[str, float]] : 
+    stderr = run_python(CORE_IMPORT, "-X", "importtime").stderr
+    package_dict : dict[str, float] = {}
+    for line in stderr.splitlines() : 
+        if line.startswith("import time:") == False or line.count("|") != 2 : 
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit() == False : 
+            continue
+        package = name.strip().split(".")[0]
+        package_dict[package] = max(package_dict.get(package, 0), int(cumulative) / 1e6)
+    return sorted(package_dict.items(), key=lambda x : x[1], reverse=True)[: size]
+
+
+def main() : 
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", type=str, default=None, help="結果を保存するjsonのパス")
+    args = parser.parse_args()
+
+    loaded_module = run_python(CHECK_CODE).stdout.strip()
+    time_list = [float(run_python(TIME_CODE).stdout) for _ in range(args.repeat)]
+    result = {
+        "import_time_median" : statistics.median(time_list), 
+        "import_time_list" : time_list, 
+        "heavy_module_loaded" : loaded_module.split(",") if loaded_module != "" else [], 
+        "slow_package_list" : get_slow_package_list()
+    }
+
+    print("import time (median of " + str(args.repeat) + ") : " + str(round(result["import_time_median"], 3)) + " s")
+    print("matplotlib/pandas loaded : " + str(result["heavy_module_loaded"]))
+    for name, second in result["slow_package_list"] : 
+        print("  " + name.ljust(32) + str(round(second, 3)) + " s")
+
+    if args.output != None : 
+        with open(args.output, "w") as f : 
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__" : 
+    main()
@@ -0,0 +1,390 @@
+import subprocess, sys, json, time, random, resource, tempfile, argparse
+from pathlib import Path
+from types import SimpleNamespace
+import numpy as np
+import torch
+
+from const import ROOT_DIR
+from logger import TotalLogger
+from world import World
+from profiler import merge_profile
+from DQN.DQN import DQN
+from DQN.memory import Memory, PrioritizedMemory
+from IDM import IDMController, get_idm_parameter
+from state import State
+from util import exit_failure
+
+# 乱数を固定したシナリオでシミュレーションと学習の速度を測る
+# 各シナリオは別プロセスで実行し、ピークメモリが他のシナリオの影響を受けないようにする
+# 結果をjsonに保存しておき、--compareで前の版の結果と比べる
+# 最後に行動選択に使うnetworkの種類（INFERENCE_CASE_DICT）毎の1回の行動選択の時間を測る
+SCENARIO_DICT = {
+    "single" : {"limit_step_count" : 500, "step_size" : 3000},   # main.pyと同じ（1レーンに2台）
+    "corridor" : {"limit_step_count" : 500, "step_size" : 1000},   # 100台
+    "grid" : {"limit_step_count" : 300, "step_size" : 300},   # 信号のある格子に1000台
+    "grid_od" : {"limit_step_count" : 300, "step_size" : 300}   # gridと同じで、経路はODからRouterで求める
+}
+
+
+def get_init_data(scenario : str, result_path : Path, vectorize : bool) -> dict[str, any] : 
+    return {
+        "scenario" : scenario, 
+        "delta_t" : 0.1, 
+        "state_columns" : ["accel", "velocity", "distance_intersection", "front_vehicle_velocity", "front_vehicle_distance", "proper_front_vehicle_distance"], 
+        "result_path" : result_path, 
+        "episode_dir" : result_path.joinpath("episode"), 
+        "sim_path" : result_path.joinpath("sim"), 
+        "learning_rate" : 0.0001, 
+        "target_learning_rate" : 0.005, 
+        "buffer_size" : 10000, 
+        "jerk_cand" : [-1, 0, 1], 
+        "batch_size" : 128, 
+        "gamma" : 0.995, 
+        "max_episode" : 5000, 
+        "log_interval" : 10, 
+        "log_csv" : False, 
+        "limit_velocity" : 15, 
+        "limit_accel" : 1, 
+        "limit_brake" : -3, 
+        "limit_step_count" : SCENARIO_DICT[scenario]["limit_step_count"], 
+        "vectorize" : vectorize, 
+        "plot" : False, 
+        "profile" : True
+    }
+
+
+def set_seed(seed : int) -> None : 
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+
+# ピークメモリ[MB]（linuxではru_maxrssはKB）
+def get_peak_rss() -> float : 
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# step_sizeステップ分のエピソードを実行する（エピソードが終わったら次のエピソードを始める）
+def run_scenario(scenario : str, step_size : int, seed : int, vectorize : bool) -> dict[str, any] : 
+    set_seed(seed)
+    with tempfile.TemporaryDirectory() as temp_dir : 
+        result_path = Path(temp_dir)
+        init_data = get_init_data(scenario, result_path, vectorize)
+        total_logger = TotalLogger(init_data["sim_path"], False)
+        dqn = DQN({
+            "state_columns" : init_data["state_columns"], 
+            "buffer_size" : init_data["buffer_size"], 
+            "learning_rate" : init_data["learning_rate"], 
+            "target_learning_rate" : init_data["target_learning_rate"], 
+            "jerk_cand" : init_data["jerk_cand"], 
+            "batch_size" : init_data["batch_size"], 
+            "gamma" : init_data["gamma"], 
+            "max_episode" : init_data["max_episode"], 
+            "model_path" : result_path, 
+            "plot" : False, 
+            "profile" : True
+        })
+
+        start_time = time.perf_counter()
+        world = World(init_data, total_logger, dqn)
+        setup_time = time.perf_counter() - start_time
+
+        step_count = 0
+        vehicle_step_count = 0
+        pos_episode = 0
+        start_time = time.perf_counter()
+        while step_count < step_size : 
+            pos_episode += 1
+            dqn.pos_episode = pos_episode
+            simulator = world.reset(pos_episode)
+            while simulator.simulation_end_flag == False and step_count < step_size : 
+                vehicle_step_count += sum(1 for vehicle in simulator.vehicle_dict.values() if vehicle.is_goal == False)
+                simulator.increment()
+                step_count += 1
+            simulator.episode_logger.write_log()
+            simulator.register_profile()
+            total_logger.finish_episode(pos_episode)
+        total_time = time.perf_counter() - start_time
+
+    profile = merge_profile(list(total_logger.profile_record.values()))
+    optimize_time = profile["optimize"]["time"]
+    gradient_step_count = profile.get("optimize.backward", {"count" : 0})["count"]
+    return {
+        "scenario" : scenario, 
+        "vehicle_size" : len(simulator.vehicle_dict), 
+        "step_size" : step_count, 
+        "episode_size" : pos_episode, 
+        "setup_time" : setup_time, 
+        "total_time" : total_time, 
+        "step_per_second" : step_count / total_time, 
+        "vehicle_step_per_second" : vehicle_step_count / total_time, 
+        "simulator_step_per_second" : step_count / (total_time - optimize_time),   # dqn.optimizeを除いた速度
+        "optimize_call_per_second" : gradient_step_count / optimize_time if gradient_step_count > 0 else 0, 
+        "gradient_step_size" : gradient_step_count, 
+        "peak_rss" : get_peak_rss(), 
+        "profile" : profile
+    }
+
+
+# Lane::update, Memory::sample, PrioritizedMemory::sample_with_weight, IDMController::get_jerk_listだけの速度を測る
+def run_micro(seed : int) -> dict[str, any] : 
+    set_seed(seed)
+    result = {}
+
+    # 1000台を配置した格子の全レーンをupdateする
+    with tempfile.TemporaryDirectory() as temp_dir : 
+        init_data = get_init_data("grid", Path(temp_dir), False)
+        init_data["profile"] = False
+        dqn = DQN({
+            "state_columns" : init_data["state_columns"], 
+            "buffer_size" : 1, 
+            "learning_rate" : init_data["learning_rate"], 
+            "target_learning_rate" : init_data["target_learning_rate"], 
+            "jerk_cand" : init_data["jerk_cand"], 
+            "batch_size" : 1, 
+            "gamma" : init_data["gamma"], 
+            "max_episode" : init_data["max_episode"], 
+            "model_path" : Path(temp_dir), 
+            "plot" : False
+        })
+        simulator = World(init_data, TotalLogger(init_data["sim_path"], False), dqn).reset(1)
+        lane_list = list(simulator.lane_dict.values())
+        repeat = 200
+        start_time = time.perf_counter()
+        for _ in range(repeat) : 
+            for lane in lane_list : 
+                lane.update()
+        result["lane_update_per_second"] = repeat * len(lane_list) / (time.perf_counter() - start_time)
+
+    # 満杯のmemoryからbatch_size分を取り出す
+    buffer_size, state_dimension, batch_size = 10000, len(init_data["state_columns"]), 128
+    memory = Memory({"buffer_size" : buffer_size, "state_dimension" : state_dimension})
+    memory.push_batch(
+        np.random.rand(buffer_size, state_dimension).astype(np.float32), 
+        np.random.randint(0, 3, buffer_size), 
+        np.random.rand(buffer_size, state_dimension).astype(np.float32), 
+        np.random.rand(buffer_size).astype(np.float32), 
+        np.random.rand(buffer_size) < 0.01
+    )
+    repeat = 2000
+    start_time = time.perf_counter()
+    for _ in range(repeat) : 
+        memory.sample(batch_size)
+    result["memory_sample_per_second"] = repeat / (time.perf_counter() - start_time)
+
+    # 優先度付き経験再生では、取り出した経験の優先度の更新までを含める
+    memory = PrioritizedMemory({"buffer_size" : buffer_size, "state_dimension" : state_dimension})
+    memory.push_batch(
+        np.random.rand(buffer_size, state_dimension).astype(np.float32), 
+        np.random.randint(0, 3, buffer_size), 
+        np.random.rand(buffer_size, state_dimension).astype(np.float32), 
+        np.random.rand(buffer_size).astype(np.float32), 
+        np.random.rand(buffer_size) < 0.01
+    )
+    start_time = time.perf_counter()
+    for _ in range(repeat) : 
+        _, _, index = memory.sample_with_weight(batch_size, 0.4)
+        memory.update_priority(index, np.random.rand(batch_size))
+    result["prioritized_memory_sample_per_second"] = repeat / (time.perf_counter() - start_time)
+
+    # 1000台のIDMの車のjerkをまとめて求める（1台ずつ求めた値と一致することも確かめる）
+    vehicle_list = make_idm_vehicle_list(1000)
+    idm_controller = IDMController(0.1)
+    if idm_controller.get_jerk_list(vehicle_list) != [idm_controller.get_jerk(vehicle) for vehicle in vehicle_list] : 
+        exit_failure("IDMController::get_jerk_list differs from IDMController::get_jerk")
+    repeat = 200
+    start_time = time.perf_counter()
+    for _ in range(repeat) : 
+        idm_controller.get_jerk_list(vehicle_list)
+    result["idm_jerk_list_per_second"] = repeat / (time.perf_counter() - start_time)
+    return result
+
+
+# IDMの計算に使う値（idm_parameter, state）だけを持つ車（3台に1台はパラメータを変える）
+def make_idm_vehicle_list(vehicle_size : int) -> list[SimpleNamespace] : 
+    vehicle_list = []
+    for index in range(vehicle_size) : 
+        state = State()
+        state.velocity = np.random.uniform(0, 20)
+        state.front_vehicle_velocity = np.random.uniform(0, 20)
+        state.front_vehicle_distance = np.random.uniform(0.5, 1000)
+        state.accel = np.random.uniform(-3, 1)
+        idm_parameter = {} if index % 3 != 0 else {"T" : np.random.uniform(1, 2), "d" : float(np.random.choice([2, 3.5, 4]))}
+        vehicle_list.append(SimpleNamespace(state=state, idm_parameter=get_idm_parameter(idm_parameter, 15)))
+    return vehicle_list
+
+
+# 行動選択に使うnetworkの種類毎に、1回の行動選択の時間[us]を測る
+INFERENCE_CASE_DICT = {
+    "eager" : ("float32", None),   # 推論用のコピーを使わない
+    "script" : ("float32", "script"), 
+    "compile" : ("float32", "compile"), 
+    "float16" : ("float16", None), 
+    "bfloat16" : ("bfloat16", "script"), 
+    "int8" : ("int8", "script")
+}
+
+
+def run_inference(seed : int) -> dict[str, any] : 
+    result = {}
+    state_columns = get_init_data("single", Path("."), False)["state_columns"]
+    state_matrix = np.random.RandomState(seed).rand(1000, len(state_columns)).tolist()
+    state_list = [dict(zip(state_columns, state_row)) for state_row in state_matrix]
+    eager_q = None
+    for case, (inference_dtype, inference_compile_mode) in INFERENCE_CASE_DICT.items() : 
+        set_seed(seed)
+        dqn = DQN({
+            "state_columns" : state_columns, 
+            "buffer_size" : 1, 
+            "learning_rate" : 0.0001, 
+            "target_learning_rate" : 0.005, 
+            "jerk_cand" : [-1, 0, 1], 
+            "batch_size" : 1, 
+            "gamma" : 0.995, 
+            "max_episode" : 5000, 
+            "model_path" : Path("."), 
+            "plot" : False, 
+            "inference_dtype" : inference_dtype, 
+            "inference_compile_mode" : inference_compile_mode
+        })
+        dqn.pos_episode = dqn.max_episode   # epsilon = 0（常にnetworkで決める）
+
+        # 最初の呼び出し（trace, compile）は含めない
+        for state in state_list[: 10] : 
+            dqn.decide_action(state)
+        dqn.decide_action_batch(state_matrix[: 64])
+
+        start_time = time.perf_counter()
+        for state in state_list : 
+            dqn.decide_action(state)
+        single_latency = (time.perf_counter() - start_time) / len(state_list) * 1e6
+
+        repeat = 100
+        start_time = time.perf_counter()
+        for _ in range(repeat) : 
+            dqn.decide_action_batch(state_matrix[: 64])
+        batch_latency = (time.perf_counter() - start_time) / (repeat * 64) * 1e6
+
+        # 重みを写す時間（次の行動選択の中で行われる）
+        sync_latency = 0
+        if dqn.inference_network != None : 
+            start_time = time.perf_counter()
+            for _ in range(repeat) : 
+                dqn.sync_inference_network(force=True)
+                dqn.inference_network.sync()
+            sync_latency = (time.perf_counter() - start_time) / repeat * 1e6
+
+        # float32のnetworkとの差
+        with torch.no_grad() : 
+            q = dqn.forward_action(torch.tensor(state_matrix, dtype=torch.float32))
+        if eager_q is None : 
+            eager_q = q
+        result[case] = {
+            "single_latency" : single_latency, 
+            "batch_latency" : batch_latency, 
+            "sync_latency" : sync_latency, 
+            "max_q_error" : (q - eager_q).abs().max().item(), 
+            "action_agreement" : (q.argmax(1) == eager_q.argmax(1)).float().mean().item()
+        }
+    return result
+
+
+def print_inference(inference_result : dict[str, any]) -> None : 
+    print()
+    print("inference".ljust(10) + "single[us]".rjust(12) + "batch64[us]".rjust(12) + "sync[us]".rjust(12) + "max q error".rjust(14) + "agreement".rjust(11))
+    for case, case_result in inference_result.items() : 
+        print(case.ljust(10) + ("%.1f" % case_result["single_latency"]).rjust(12) + 
+              ("%.2f" % case_result["batch_latency"]).rjust(12) + 
+              ("%.1f" % case_result["sync_latency"]).rjust(12) + 
+              ("%.2e" % case_result["max_q_error"]).rjust(14) + 
+              ("%.3f" % case_result["action_agreement"]).rjust(11))
+
+
+# 子プロセスで実行し、最後の行のjsonを受け取る
+def run_child(*option : str) -> dict[str, any] : 
+    stdout = subprocess.run([sys.executable, __file__, *option], cwd=ROOT_DIR, capture_output=True, text=True, check=True).stdout
+    return json.loads(stdout.strip().splitlines()[-1])
+
+
+def print_comparison(result : dict[str, any], prev_result : dict[str, any]) -> None : 
+    print()
+    print("compare with previous result (new / old)")
+    for name, scenario_result in result["scenario"].items() : 
+        prev_scenario_result = prev_result["scenario"].get(name)
+        if prev_scenario_result == None : 
+            continue
+        if prev_scenario_result["step_size"] != scenario_result["step_size"] : 
+            print("  " + name + " : step_size differs (" + str(scenario_result["step_size"]) + " / " + str(prev_scenario_result["step_size"]) + ")")
+        for key in ["step_per_second", "vehicle_step_per_second", "simulator_step_per_second", "optimize_call_per_second"] : 
+            if scenario_result[key] > 0 and prev_scenario_result.get(key, 0) > 0 : 
+                print("  " + (name + "." + key).ljust(40) + ("%.2f" % (scenario_result[key] / prev_scenario_result[key])).rjust(8))
+    for key, value in result["micro"].items() : 
+        if prev_result["micro"].get(key, 0) > 0 : 
+            print("  " + ("micro." + key).ljust(40) + ("%.2f" % (value / prev_result["micro"][key])).rjust(8))
+    # latencyは小さい方が速い
+    for case, case_result in result.get("inference", {}).items() : 
+        prev_case_result = prev_result.get("inference", {}).get(case)
+        if prev_case_result == None : 
+            continue
+        for key in ["single_latency", "batch_latency"] : 
+            print("  " + ("inference." + case + "." + key).ljust(40) + ("%.2f" % (case_result[key] / prev_case_result[key])).rjust(8))
+
+
+def main() : 
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenario", type=str, nargs="+", default=list(SCENARIO_DICT.keys()), choices=list(SCENARIO_DICT.keys()))
+    parser.add_argument("--step-scale", type=float, default=1.0, help="各シナリオのステップ数を何倍にするか")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--vectorize", action="store_true", help="VehicleEngineで運動を計算する")
+    parser.add_argument("--output", type=str, default=None, help="結果を保存するjsonのパス")
+    parser.add_argument("--compare", type=str, default=None, help="比較する前の結果のjsonのパス")
+    parser.add_argument("--child", type=str, default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--step-size", type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # 子プロセス
+    if args.child == "micro" : 
+        print(json.dumps(run_micro(args.seed)))
+        return
+    elif args.child == "inference" : 
+        print(json.dumps(run_inference(args.seed)))
+        return
+    elif args.child != None : 
+        print(json.dumps(run_scenario(args.child, args.step_size, args.seed, args.vectorize)))
+        return
+
+    result = {"seed" : args.seed, "vectorize" : args.vectorize, "scenario" : {}}
+    print("scenario".ljust(10) + "vehicle".rjust(8) + "step/s".rjust(12) + "vehicle-step/s".rjust(16) +
+          "sim step/s".rjust(12) + "optimize/s".rjust(12) + "peak RSS[MB]".rjust(14))
+    for scenario in args.scenario : 
+        step_size = max(1, int(SCENARIO_DICT[scenario]["step_size"] * args.step_scale))
+        option_list = ["--child", scenario, "--step-size", str(step_size), "--seed", str(args.seed)]
+        if args.vectorize : 
+            option_list.append("--vectorize")
+        scenario_result = run_child(*option_list)
+        result["scenario"][scenario] = scenario_result
+        print(scenario.ljust(10) + str(scenario_result["vehicle_size"]).rjust(8) +
+              ("%.1f" % scenario_result["step_per_second"]).rjust(12) +
+              ("%.1f" % scenario_result["vehicle_step_per_second"]).rjust(16) +
+              ("%.1f" % scenario_result["simulator_step_per_second"]).rjust(12) +
+              ("%.1f" % scenario_result["optimize_call_per_second"]).rjust(12) +
+              ("%.1f" % scenario_result["peak_rss"]).rjust(14))
+
+    result["micro"] = run_child("--child", "micro", "--seed", str(args.seed))
+    for key, value in result["micro"].items() : 
+        print(key.ljust(28) + ("%.1f" % value).rjust(12))
+
+    result["inference"] = run_child("--child", "inference", "--seed", str(args.seed))
+    print_inference(result["inference"])
+
+    if args.output != None : 
+        with open(args.output, "w") as f : 
+            json.dump(result, f, indent=2)
+
+    if args.compare != None : 
+        with open(args.compare, "r") as f : 
+            print_comparison(result, json.load(f))
+
+
+if __name__ == "__main__" : 
+    main()
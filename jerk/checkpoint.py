@@ -0,0 +1,71 @@
+import random, shutil, copy
+from pathlib import Path
+import numpy as np
+import torch
+
+from logger import TotalLogger
+from DQN.DQN import DQN
+from writer import submit_write
+
+
+# 学習を途中から再開するためのチェックポイント
+# path/checkpoint.pth : 次に始めるエピソード, 乱数の状態, TotalLoggerの集計
+# path/dqn.pth        : network, target_network, optimizerなど（DQN::get_checkpoint）
+# path/memory/*.npy   : memoryの配列（再開時はmmapで読み込む）
+# memoryの配列は大きいので複製せずにこの場で書き出し、残り（小さいもの）は複製してtotal_loggerのwriterで書き出す
+def save_checkpoint(path : Path, dqn : DQN, total_logger : TotalLogger, next_episode : int) -> None : 
+    # 前のチェックポイントの書き出し（同じpath.tmpを使う）が終わるまで待つ
+    if total_logger.writer != None : 
+        total_logger.writer.flush()
+
+    temp_path = get_temp_path(path)
+    if temp_path.exists() : 
+        shutil.rmtree(temp_path)
+    temp_path.mkdir(parents=True)
+    dqn.memory.save(temp_path.joinpath("memory"))
+
+    dqn_checkpoint = dqn.get_checkpoint()
+    checkpoint = copy.deepcopy({
+        "next_episode" : next_episode, 
+        "random_state" : random.getstate(), 
+        "numpy_random_state" : np.random.get_state(), 
+        "torch_random_state" : torch.get_rng_state(), 
+        "total_logger" : total_logger.get_checkpoint()
+    })
+    submit_write(total_logger.writer, "checkpoint", write_checkpoint, path, dqn_checkpoint, checkpoint)
+
+
+# 一度別のディレクトリ（path.tmp）に書き出してから置き換えるので、書き出しの途中で止まっても前のチェックポイントが残る
+# （読み込んだmemoryのファイルは上書きされず、置き換え後もmmapしたまま使える）
+def write_checkpoint(path : Path, dqn_checkpoint : dict[str, any], checkpoint : dict[str, any]) -> None : 
+    temp_path = get_temp_path(path)
+    torch.save(dqn_checkpoint, temp_path.joinpath("dqn.pth"))
+    torch.save(checkpoint, temp_path.joinpath("checkpoint.pth"))
+
+    if path.exists() : 
+        shutil.rmtree(path)
+    temp_path.rename(path)
+
+
+# チェックポイントを読み込み、次に始めるエピソードを返す（チェックポイントがなければ1）
+def load_checkpoint(path : Path, dqn : DQN, total_logger : TotalLogger) -> int : 
+    # 置き換えの途中で止まった場合はpath.tmpが完全なチェックポイント（checkpoint.pthは最後に書き出す）
+    if path.exists() == False : 
+        path = get_temp_path(path)
+        if path.joinpath("checkpoint.pth").exists() == False : 
+            return 1
+
+    checkpoint = torch.load(path.joinpath("checkpoint.pth"), weights_only=False)
+    dqn.load_checkpoint(path)
+    random.setstate(checkpoint["random_state"])
+    np.random.set_state(checkpoint["numpy_random_state"])
+    torch.set_rng_state(checkpoint["torch_random_state"])
+
+    # 再開するエピソード以降の記録（並列実行で先に終わっていたエピソード）は、もう一度実行するので捨てる
+    next_episode = checkpoint["next_episode"]
+    total_logger.load_checkpoint(checkpoint["total_logger"], next_episode)
+    return next_episode
+
+
+def get_temp_path(path : Path) -> Path : 
+    return path.with_name(path.name + ".tmp")
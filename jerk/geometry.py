@@ -0,0 +1,179 @@
+import math
+import numpy as np
+
+from network import RoadNetwork
+from util import calculate_euclidean_distance
+
+
+DEFAULT_CELL_SIZE = 150   # 空間ハッシュの1マスの大きさ[m]
+
+
+# intersectionの座標とlaneの線分を空間ハッシュ（cell_size四方のマス -> 番号）で持つ
+# RoadNetworkの配列からnumpyでまとめて作る（get_geometry_indexでRoadNetwork毎に1つだけ作り、Simulatorの間で共有する）
+# マスはintersectionがある範囲の中で番号（key）を振り、keyの順に並べた配列とsearchsortedで引く
+# 座標は(y, x)の順（Intersection::get_placeと同じ）
+class GeometryIndex : 
+    def __init__(self, network : RoadNetwork, cell_size : float = DEFAULT_CELL_SIZE) -> None:
+        self.network = network
+        self.cell_size = cell_size
+
+        # intersectionがあるマスの範囲 (min_y, min_x, max_y, max_x)
+        intersection_cell_y = np.floor(network.intersection_y / cell_size).astype(np.int64)
+        intersection_cell_x = np.floor(network.intersection_x / cell_size).astype(np.int64)
+        self.cell_range = None
+        if len(intersection_cell_y) > 0 : 
+            self.cell_range = (int(intersection_cell_y.min()), int(intersection_cell_x.min()), 
+                               int(intersection_cell_y.max()), int(intersection_cell_x.max()))
+            self.cell_width = self.cell_range[3] - self.cell_range[1] + 1
+
+        # マス -> intersectionの位置
+        self.intersection_cell_key, self.intersection_cell_value = make_cell_table(
+            self.get_cell_key(intersection_cell_y, intersection_cell_x), np.arange(len(intersection_cell_y)))
+
+        # laneの線分（laneの両端はintersectionなので、外接矩形は必ずintersectionのマスの範囲に入る）
+        self.lane_y1 = network.intersection_y[network.lane_from_index].astype(np.float64)
+        self.lane_x1 = network.intersection_x[network.lane_from_index].astype(np.float64)
+        self.lane_y2 = network.intersection_y[network.lane_to_index].astype(np.float64)
+        self.lane_x2 = network.intersection_x[network.lane_to_index].astype(np.float64)
+
+        # 線分の外接矩形が重なるマスに登録する（実際の道路網のレーンは短いので、マスの数は少ない）
+        # 各laneのマスの数だけ位置を繰り返し、矩形の中の何番目かからマスを求める
+        cell_y1 = np.floor(np.minimum(self.lane_y1, self.lane_y2) / cell_size).astype(np.int64)
+        cell_x1 = np.floor(np.minimum(self.lane_x1, self.lane_x2) / cell_size).astype(np.int64)
+        cell_y2 = np.floor(np.maximum(self.lane_y1, self.lane_y2) / cell_size).astype(np.int64)
+        cell_x2 = np.floor(np.maximum(self.lane_x1, self.lane_x2) / cell_size).astype(np.int64)
+        width = cell_x2 - cell_x1 + 1
+        count = (cell_y2 - cell_y1 + 1) * width
+        lane_index = np.repeat(np.arange(len(count)), count)
+        offset = np.arange(len(lane_index)) - np.repeat(np.cumsum(count) - count, count)
+        self.lane_cell_key, self.lane_cell_value = make_cell_table(
+            self.get_cell_key(cell_y1[lane_index] + offset // width[lane_index], cell_x1[lane_index] + offset % width[lane_index]), lane_index)
+
+
+    def get_cell(self, y : float, x : float) -> tuple[int, int] : 
+        return (math.floor(y / self.cell_size), math.floor(x / self.cell_size))
+
+
+    # マス（配列でもよい）の番号（範囲の外のマスは使わない）
+    def get_cell_key(self, cell_y : any, cell_x : any) -> any : 
+        if self.cell_range == None : 
+            return cell_y
+        return (cell_y - self.cell_range[0]) * self.cell_width + (cell_x - self.cell_range[1])
+
+
+    def is_in_cell_range(self, cell : tuple[int, int]) -> bool : 
+        min_y, min_x, max_y, max_x = self.cell_range
+        return min_y <= cell[0] <= max_y and min_x <= cell[1] <= max_x
+
+
+    # マスにあるintersectionの位置のリスト
+    def get_cell_intersection_index_list(self, cell : tuple[int, int]) -> list[int] : 
+        if self.is_in_cell_range(cell) == False : 
+            return []
+        return get_cell_value(self.intersection_cell_key, self.intersection_cell_value, self.get_cell_key(*cell))
+
+
+    def get_intersection_place(self, intersection_index : int) -> tuple[float, float] : 
+        return (self.network.intersection_y[intersection_index].item(), self.network.intersection_x[intersection_index].item())
+
+
+    def get_lane_segment(self, lane_number : int) -> tuple[float, float, float, float] : 
+        index = int(self.network.get_lane_index(lane_number))
+        return (self.lane_y1[index].item(), self.lane_x1[index].item(), self.lane_y2[index].item(), self.lane_x2[index].item())
+
+
+    def get_lane_length(self, lane_number : int) -> float : 
+        return self.network.lane_length[int(self.network.get_lane_index(lane_number))].item()
+
+
+    def get_intersection_distance(self, intersection_number_1 : int, intersection_number_2 : int) -> float : 
+        return calculate_euclidean_distance(self.get_intersection_place(int(self.network.get_intersection_index(intersection_number_1))), 
+                                            self.get_intersection_place(int(self.network.get_intersection_index(intersection_number_2))))
+
+
+    # lane上でlane_placeだけ進んだ点の座標
+    def get_lane_place(self, lane_number : int, lane_place : float) -> tuple[float, float] : 
+        y1, x1, y2, x2 = self.get_lane_segment(lane_number)
+        length = self.get_lane_length(lane_number)
+        ratio = min(max(lane_place / length, 0), 1) if length > 0 else 0
+        return (y1 + (y2 - y1) * ratio, x1 + (x2 - x1) * ratio)
+
+
+    # 点からlaneの線分までの距離
+    def get_lane_distance(self, lane_number : int, place : tuple[float, float]) -> float : 
+        y1, x1, y2, x2 = self.get_lane_segment(lane_number)
+        y, x = place
+        dy, dx = y2 - y1, x2 - x1
+        square_length = dy * dy + dx * dx
+        ratio = 0 if square_length == 0 else min(max(((y - y1) * dy + (x - x1) * dx) / square_length, 0), 1)
+        return math.hypot(y - (y1 + dy * ratio), x - (x1 + dx * ratio))
+
+
+    # placeを中心にring個外側のマス（ring == 0なら中心のマスだけ）
+    def get_ring_cell_list(self, center_cell : tuple[int, int], ring : int) -> list[tuple[int, int]] : 
+        cell_y, cell_x = center_cell
+        if ring == 0 : 
+            return [center_cell]
+        cell_list = []
+        for offset in range(-ring, ring + 1) : 
+            cell_list.append((cell_y - ring, cell_x + offset))
+            cell_list.append((cell_y + ring, cell_x + offset))
+        for offset in range(-ring + 1, ring) : 
+            cell_list.append((cell_y + offset, cell_x - ring))
+            cell_list.append((cell_y + offset, cell_x + ring))
+        return cell_list
+
+
+    # placeに最も近いintersectionの番号と距離を返す
+    # 中心のマスから外側へ順に探し、見つかった距離より外側のマスが遠くなったら終える
+    def find_nearest_intersection(self, place : tuple[float, float]) -> tuple[int, float] : 
+        if self.cell_range == None : 
+            return (None, math.inf)
+
+        center_cell = self.get_cell(*place)
+        min_y, min_x, max_y, max_x = self.cell_range
+        max_ring = max(abs(min_y - center_cell[0]), abs(max_y - center_cell[0]), abs(min_x - center_cell[1]), abs(max_x - center_cell[1]))
+        nearest_index, nearest_distance = None, math.inf
+        for ring in range(max_ring + 1) : 
+            # ring個外側のマスの点は中心から少なくとも(ring - 1) * cell_size離れている
+            if nearest_distance <= (ring - 1) * self.cell_size : 
+                break
+            for cell in self.get_ring_cell_list(center_cell, ring) : 
+                for intersection_index in self.get_cell_intersection_index_list(cell) : 
+                    distance = calculate_euclidean_distance(place, self.get_intersection_place(intersection_index))
+                    if distance < nearest_distance : 
+                        nearest_index, nearest_distance = intersection_index, distance
+        return (int(self.network.intersection_number[nearest_index]), nearest_distance)
+
+
+    # placeから半径radius以内を通るlaneの番号のリスト
+    def find_lane_list_in_radius(self, place : tuple[float, float], radius : float) -> list[int] : 
+        if self.cell_range == None : 
+            return []
+        y, x = place
+        min_y, min_x, max_y, max_x = self.cell_range
+        cell_y1, cell_x1 = self.get_cell(y - radius, x - radius)
+        cell_y2, cell_x2 = self.get_cell(y + radius, x + radius)
+        lane_index_set = set()
+        for cell_y in range(max(cell_y1, min_y), min(cell_y2, max_y) + 1) : 
+            for cell_x in range(max(cell_x1, min_x), min(cell_x2, max_x) + 1) : 
+                lane_index_set.update(get_cell_value(self.lane_cell_key, self.lane_cell_value, self.get_cell_key(cell_y, cell_x)))
+        lane_number_list = self.network.lane_number[sorted(lane_index_set)].tolist()
+        return [lane_number for lane_number in lane_number_list if self.get_lane_distance(lane_number, place) <= radius]
+
+
+# マスの番号順に並べた（番号, 値）の配列
+def make_cell_table(cell_key : np.ndarray, value : np.ndarray) -> tuple[np.ndarray, np.ndarray] : 
+    order = np.argsort(cell_key, kind="stable")
+    return (np.asarray(cell_key, dtype=np.int64)[order], np.asarray(value, dtype=np.int64)[order])
+
+
+def get_cell_value(cell_key : np.ndarray, value : np.ndarray, key : int) -> list[int] : 
+    return value[np.searchsorted(cell_key, key, side="left") : np.searchsorted(cell_key, key, side="right")].tolist()
+
+
+# RoadNetwork毎（cell_size毎）に1つだけ作る（VecSimulatorの各worldなど、同じ道路網のSimulatorで共有する）
+def get_geometry_index(network : RoadNetwork, cell_size : float = DEFAULT_CELL_SIZE) -> GeometryIndex : 
+    if cell_size not in network.geometry_index_dict : 
+        network.geometry_index_dict[cell_size] = GeometryIndex(network, cell_size)
+    return network.geometry_index_dict[cell_size]
@@ -13,46 +13,130 @@ class Lane :
         self.number = init_data["number"]
         self.from_intersection_number = init_data["from_intersection_number"]
         self.to_intersection_number = init_data["to_intersection_number"]
-        self.on_vehicle_list = []
+
+        # レーン上の車を前から順番に双方向リストで持つ
+        self.head : Vehicle = None   # 先頭の車
+        self.tail : Vehicle = None   # 最後尾の車
+        self.front_dict : dict[int, Vehicle] = {}   # vehicle_number -> 一つ前の車
+        self.back_dict : dict[int, Vehicle] = {}   # vehicle_number -> 一つ後ろの車
 
         self.simulator = simulator
 
-        self.length = self.simulator.get_intersection_distance(self.from_intersection_number, 
-                                                               self.to_intersection_number)
+        # 長さはRoadNetworkで計算済み（init_dataになければgeometryに登録された長さを使う）
+        if "length" in init_data : 
+            self.length = init_data["length"]
+        else : 
+            self.length = self.simulator.get_geometry().get_lane_length(self.number)
+
+
+    # レーン上の車を全て取り除く（エピソードの開始時）
+    def clear(self) -> None : 
+        self.head = None
+        self.tail = None
+        self.front_dict = {}
+        self.back_dict = {}
+
+
+    def __len__(self) -> int : 
+        return len(self.front_dict)
+
+
+    # 車がレーンに入る
+    def enter(self, vehicle : Vehicle) -> None : 
+        if vehicle.number in self.front_dict : 
+            exit_failure("already entered vehicle in Lane::enter")
+        
+        # 後ろから見ていき、自分より前にいる車の後ろに入る
+        front_vehicle = self.tail
+        while front_vehicle != None and front_vehicle.lane_place < vehicle.lane_place : 
+            front_vehicle = self.front_dict[front_vehicle.number]
+        self.link(vehicle, front_vehicle)
+
+        if len(self) == 1 : 
+            self.simulator.leader_finder.notify_occupancy_change(self.number)
+
 
+    # 車がレーンから出る
+    def leave(self, vehicle : Vehicle) -> None : 
+        if vehicle.number not in self.front_dict : 
+            exit_failure("not found vehicle_number in Lane::leave")
+        self.unlink(vehicle)
 
-    def update(self, vehicle_dict : dict[str, Vehicle]) : 
-        # このレーンの上にいる車を登録する
-        self.on_vehicle_list = [vehicle for vehicle in vehicle_dict.values() if self.number == vehicle.lane_number]
+        if len(self) == 0 : 
+            self.simulator.leader_finder.notify_occupancy_change(self.number)
+
+
+    def update(self) -> None : 
+        # レーン内での追い越しはほとんど起きないので、順番が崩れた車だけを前に移動する（挿入ソート）
+        if self.head == None : 
+            return 
         
-        # 前から順番に並び替える
-        self.on_vehicle_list = sorted(self.on_vehicle_list, key=lambda vehicle: vehicle.lane_place, reverse=True)
+        vehicle = self.back_dict[self.head.number]
+        while vehicle != None : 
+            back_vehicle = self.back_dict[vehicle.number]
+            front_vehicle = self.front_dict[vehicle.number]
+            if front_vehicle.lane_place < vehicle.lane_place : 
+                self.unlink(vehicle)
+                while front_vehicle != None and front_vehicle.lane_place < vehicle.lane_place : 
+                    front_vehicle = self.front_dict[front_vehicle.number]
+                self.link(vehicle, front_vehicle)
+            vehicle = back_vehicle
+
+
+    # vehicleをfront_vehicleのすぐ後ろに繋ぐ（front_vehicleがNoneなら先頭）
+    def link(self, vehicle : Vehicle, front_vehicle : Vehicle) -> None : 
+        back_vehicle = self.head if front_vehicle == None else self.back_dict[front_vehicle.number]
+        self.front_dict[vehicle.number] = front_vehicle
+        self.back_dict[vehicle.number] = back_vehicle
+        if front_vehicle == None : 
+            self.head = vehicle
+        else : 
+            self.back_dict[front_vehicle.number] = vehicle
+        if back_vehicle == None : 
+            self.tail = vehicle
+        else : 
+            self.front_dict[back_vehicle.number] = vehicle
+
+
+    def unlink(self, vehicle : Vehicle) -> None : 
+        front_vehicle = self.front_dict.pop(vehicle.number)
+        back_vehicle = self.back_dict.pop(vehicle.number)
+        if front_vehicle == None : 
+            self.head = back_vehicle
+        else : 
+            self.back_dict[front_vehicle.number] = back_vehicle
+        if back_vehicle == None : 
+            self.tail = front_vehicle
+        else : 
+            self.front_dict[back_vehicle.number] = front_vehicle
 
 
     # lane上でvehicle_numberの前にいるvehicleの番号を取得する
     def get_front_vehicle_number(self, vehicle_number : int) -> int : 
-        my_vehicle_index = None
-        # 対象が先頭の時はNoneを返す
-        for i, vehicle in enumerate(self.on_vehicle_list) :
-            if vehicle.number == vehicle_number : 
-                my_vehicle_index = i 
-        
-        if my_vehicle_index == None : 
+        if vehicle_number not in self.front_dict : 
             exit_failure("not found vehicle_nubmer in Lane::get_fron_vehicle_number")
         
         # 自分が先頭の時はNoneを返す
-        if my_vehicle_index == 0 : 
+        front_vehicle = self.front_dict[vehicle_number]
+        if front_vehicle == None : 
             return None
         else : 
-            return self.on_vehicle_list[i - 1].number
+            return front_vehicle.number
         
 
     # レーンの一番後ろにいる車の番号を取得する
     def get_back_vehicle_number(self) -> int :
-        if len(self.on_vehicle_list) == 0 : 
+        if self.tail == None : 
             return None 
         else : 
-            return self.on_vehicle_list[-1].number  
-           
-                
+            return self.tail.number  
+    
 
+    # 前から順番に車の番号を取得する
+    def get_vehicle_number_list(self) -> list[int] : 
+        vehicle_number_list = []
+        vehicle = self.head
+        while vehicle != None : 
+            vehicle_number_list.append(vehicle.number)
+            vehicle = self.back_dict[vehicle.number]
+        return vehicle_number_list
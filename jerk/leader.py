@@ -0,0 +1,75 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from .simulator import Simulator
+    from .vehicle import Vehicle
+
+
+# 自分のレーンに前の車がいないときに、経路上の先のレーンから前の車を探す
+# 「どのレーンに前の車がいたか」をキャッシュしておき、
+# 自分から前の車のレーンまでのどれかのレーンが空↔非空に変わるまではキャッシュを使う
+# キャッシュを作るときにその間のレーンに車を登録しておき、レーンが変わったら登録された車のキャッシュだけを消す
+class LeaderFinder : 
+    def __init__(self, simulator : Simulator) -> None:
+        self.simulator = simulator
+
+        self.cache_dict : dict[int, int] = {}   # vehicle_number -> 前の車がいるroute_index（いなければNone）
+        self.subscriber_dict : dict[int, set[int]] = {}   # lane_number -> そのレーンを含むキャッシュを持つvehicle_number
+
+
+    # 車に紐づくキャッシュを消す
+    def clear(self) -> None : 
+        self.cache_dict = {}
+        self.subscriber_dict = {}
+
+
+    # 取り除かれた車のキャッシュを消す（登録はレーンが変わったときに消える）
+    def forget(self, vehicle_number : int) -> None : 
+        self.cache_dict.pop(vehicle_number, None)
+
+
+    # レーンが空↔非空に変わったときにLaneから呼ばれる
+    def notify_occupancy_change(self, lane_number : int) -> None : 
+        cache_dict = self.cache_dict
+        for vehicle_number in self.subscriber_dict.pop(lane_number, ()) : 
+            cache_dict.pop(vehicle_number, None)
+
+
+    # 先のレーンにいる前の車と、その車までの距離（車長は引いていない）を返す
+    def find_leader(self, vehicle : Vehicle) -> tuple[Vehicle, float] : 
+        route_list = vehicle.route_list
+        route_index = vehicle.route_index
+
+        # キャッシュを作った後に車が進んでも、前の車のレーンより手前ならその先のレーンは変わっていない
+        leader_route_index = self.cache_dict.get(vehicle.number, -1)
+        if leader_route_index == -1 or (leader_route_index != None and leader_route_index <= route_index) : 
+            leader_route_index = self.search_leader_route_index(vehicle)
+
+        if leader_route_index == None : 
+            return None, None
+
+        leader = self.simulator.lane_dict[route_list[leader_route_index]].tail
+        route_distance_list = vehicle.route_distance_list
+        distance = vehicle.get_distance_next_intersection() + \
+                   (route_distance_list[leader_route_index] - route_distance_list[route_index + 1]) + \
+                   leader.lane_place
+        return leader, distance
+
+
+    # 経路の先で最初に車がいるレーンを探し、そこまでのレーンに登録する
+    def search_leader_route_index(self, vehicle : Vehicle) -> int : 
+        route_list = vehicle.route_list
+        lane_dict = self.simulator.lane_dict
+        subscriber_dict = self.subscriber_dict
+        leader_route_index = None
+        for index in range(vehicle.route_index + 1, len(route_list)) : 
+            lane_number = route_list[index]
+            subscriber_set = subscriber_dict.get(lane_number)
+            if subscriber_set == None : 
+                subscriber_dict[lane_number] = subscriber_set = set()
+            subscriber_set.add(vehicle.number)
+            if len(lane_dict[lane_number]) > 0 : 
+                leader_route_index = index
+                break
+        self.cache_dict[vehicle.number] = leader_route_index
+        return leader_route_index
@@ -1,88 +1,256 @@
-
-import os
-import pandas as pd
-from statistics import mean
+import csv, json, math, shutil
+from array import array
+import numpy as np
 from pathlib import Path
-import matplotlib.pyplot as plt
+from typing import Callable
+
+from profiler import merge_profile
+from metrics import MetricSeries, RunningStat, write_metrics
+from writer import AsyncWriter, submit_write
+
+# Vehicle::make_logの列（この順番でファイルに書き出す）
+VEHICLE_LOG_COLUMNS = [
+    "reward", "velocity", "accel", "jerk", "proper_front_vehicle_distance", "exist_front_vehicle", 
+    "front_vehicle_velocity", "front_vehicle_accel", "front_vehicle_distance", "distance_intersection", 
+    "is_goal", "is_collision", "ignore_signal", "BLUE", "YELLOW_TO_RED", "RED", "YELLOW_TO_BLUE", 
+    "remain_time", "lane_number", "lane_place"
+]
+BOOL_COLUMN_SET = {"exist_front_vehicle", "is_goal", "is_collision", "ignore_signal"}
+INT_COLUMN_SET = {"lane_number"}
+REWARD_WINDOW_SIZE = 100   # 報酬の推移の移動平均を何エピソードでとるか
 
+
+# vehicleのログは列毎のfloat64のバッファに溜め、flush_size行毎にファイルに追記する
+# ファイルは「行数(int64) + 列毎のデータ(float64 * 行数)」のブロックの繰り返しで、Noneはnanとして書く
 class EpisodeLogger : 
     def __init__(self, init_data : dict[str, any]) -> None:
         self.episode_path : Path = init_data["episode_path"]
         self.pos_episode = init_data["pos_episode"]
         self.log_interval = init_data["log_interval"]
+        self.flush_size = init_data.get("log_flush_size", 1000)   # 何行毎にファイルに書き出すか
+        self.log_csv = init_data.get("log_csv", True)   # エピソード終了時にcsvも書き出すか
+        self.writer : AsyncWriter = init_data.get("writer")   # あればファイルへの書き出しを別スレッドで行う
+
+        # 規定回数毎のみ記録する
+        self.is_active = self.pos_episode % self.log_interval == 0
+
+        self.column_buffer_dict : dict[int, list[array]] = {}
 
-        self.vehicle_log_dict : dict[int, list[dict[str, any]]] = {}
+        # ファイルには追記するので、前に同じエピソードを記録したログ（チェックポイントから再開した場合）を消しておく
+        if self.is_active : 
+            submit_write(self.writer, "vehicle_log_clear", shutil.rmtree, self.episode_path.joinpath("vehicle"), True)
 
 
     def register_vehicle_log(self, vehicle_number, vehicle_log : dict[int, any]) : 
-        if vehicle_number not in self.vehicle_log_dict : 
-            self.vehicle_log_dict[vehicle_number] = []
-        self.vehicle_log_dict[vehicle_number].append(vehicle_log)
+        if self.is_active == False : 
+            return
+        
+        if vehicle_number not in self.column_buffer_dict : 
+            self.column_buffer_dict[vehicle_number] = [array("d") for _ in VEHICLE_LOG_COLUMNS]
+        column_buffer_list = self.column_buffer_dict[vehicle_number]
+        for column_buffer, column in zip(column_buffer_list, VEHICLE_LOG_COLUMNS) : 
+            value = vehicle_log[column]
+            column_buffer.append(math.nan if value == None else value)
+        
+        if len(column_buffer_list[0]) >= self.flush_size : 
+            self.flush(vehicle_number)
+
+
+    # 取り除かれた車のバッファを書き出す
+    def flush_vehicle(self, vehicle_number) : 
+        if vehicle_number in self.column_buffer_dict : 
+            self.flush(vehicle_number)
 
 
     def write_log(self) : 
         # 規定回数毎のみ
-        if self.pos_episode % self.log_interval != 0 : 
+        if self.is_active == False : 
             return
 
-        # 結果用のディレクトリを作る
-        self.make_result_dir()
+        # 残っているバッファを書き出す
+        for vehicle_number in self.column_buffer_dict.keys() : 
+            self.flush(vehicle_number)
 
-        # vehicle
-        for vehicle_number, vehicle_log_list in self.vehicle_log_dict.items() : 
-            self.write_log_vehicle(vehicle_number, vehicle_log_list)
+        # 互換性のためにcsvも書き出す（書き出しは投入した順に行うので、binを書き終えた後に読む）
+        if self.log_csv : 
+            for vehicle_number in self.column_buffer_dict.keys() : 
+                submit_write(self.writer, "vehicle_log_csv", convert_vehicle_log_csv, self.get_vehicle_log_path(vehicle_number))
 
-    
-    def make_result_dir(self) : 
-        os.system("mkdir -p " + str(self.episode_path.joinpath("vehicle")))
+
+    def get_vehicle_log_path(self, vehicle_number) -> Path : 
+        return self.episode_path.joinpath("vehicle" + "/number_" + str(vehicle_number) + ".bin")
 
     
-    def write_log_vehicle(self, vehicle_number, vehicle_log_list : list[dict[str, any]]) : 
-        # 空だとバグる
-        if len(vehicle_log_list) == 0 : 
-            return 
-        
-        columns = vehicle_log_list[0].keys()
-        data_dict = {
-            col : [vehicle_log_list[i][col] for i in range(len(vehicle_log_list))] for col in columns
-        }
-        df = pd.DataFrame(data_dict)
-        df.to_csv(self.episode_path.joinpath("vehicle" + "/number_" + str(vehicle_number) + ".csv"))
+    # バッファは新しいものに取り替え、古いものをそのまま書き出しに渡す
+    def flush(self, vehicle_number) : 
+        column_buffer_list = self.column_buffer_dict[vehicle_number]
+        if len(column_buffer_list[0]) == 0 : 
+            return
+        self.column_buffer_dict[vehicle_number] = [array("d") for _ in VEHICLE_LOG_COLUMNS]
+        submit_write(self.writer, "vehicle_log", append_vehicle_log, self.get_vehicle_log_path(vehicle_number), column_buffer_list)
+
+
+# 1ブロックをvehicleのログに追記する
+def append_vehicle_log(path : Path, column_buffer_list : list[array]) -> None : 
+    vehicle_dir = path.parent
+    if vehicle_dir.exists() == False : 
+        vehicle_dir.mkdir(parents=True, exist_ok=True)
+        with open(vehicle_dir.joinpath("columns.json"), "w") as f : 
+            json.dump(VEHICLE_LOG_COLUMNS, f)
+
+    with open(path, "ab") as f : 
+        array("q", [len(column_buffer_list[0])]).tofile(f)
+        for column_buffer in column_buffer_list : 
+            column_buffer.tofile(f)
+
+
+def convert_vehicle_log_csv(path : Path) -> None : 
+    write_vehicle_log_csv(path.with_suffix(".csv"), read_vehicle_log(path))
+
+
+# EpisodeLoggerが書き出したvehicleのログを列毎の配列として読み込む
+def read_vehicle_log(path : Path) -> dict[str, np.ndarray] : 
+    data = np.fromfile(path, dtype=np.uint8)
+    block_list_dict = {column : [] for column in VEHICLE_LOG_COLUMNS}
+    offset = 0
+    while offset < len(data) : 
+        row_count = int(data[offset : offset + 8].view(np.int64)[0])
+        offset += 8
+        for column in VEHICLE_LOG_COLUMNS : 
+            block_list_dict[column].append(data[offset : offset + 8 * row_count].view(np.float64))
+            offset += 8 * row_count
+    return {column : np.concatenate(block_list) for column, block_list in block_list_dict.items()}
+
+
+def write_vehicle_log_csv(path : Path, column_dict : dict[str, np.ndarray]) -> None : 
+    with open(path, "w", newline="") as f : 
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow([""] + VEHICLE_LOG_COLUMNS)
+        row_count = len(column_dict[VEHICLE_LOG_COLUMNS[0]])
+        column_list = [(column, column_dict[column].tolist()) for column in VEHICLE_LOG_COLUMNS]
+        for index in range(row_count) : 
+            row = [index]
+            for column, value_list in column_list : 
+                value = value_list[index]
+                if math.isnan(value) : 
+                    row.append("")
+                elif column in BOOL_COLUMN_SET : 
+                    row.append(value != 0)
+                elif column in INT_COLUMN_SET : 
+                    row.append(int(value))
+                else : 
+                    row.append(value)
+            writer.writerow(row)
 
 
 class TotalLogger : 
-    def __init__(self, sim_path : Path) -> None:
+    def __init__(self, sim_path : Path, plot : bool = True, writer : AsyncWriter = None) -> None:
         self.sim_path : Path = sim_path
+        self.plot = plot   # write_resultでグラフを描画するか
+        self.writer = writer   # あればファイルへの書き出しを別スレッドで行う（EpisodeLogger, チェックポイントでも使う）
 
-        self.reward_record : dict[int, list[float]] = {}
+        # 報酬はエピソード毎に集計し、エピソードの平均をエピソードの順にreward_seriesに加える
+        # （並列実行では終わる順がずれるので、前のエピソードが終わるまで待たせる）
+        self.reward_series = MetricSeries(REWARD_WINDOW_SIZE)
+        self.episode_reward_dict : dict[int, RunningStat] = {}   # まだreward_seriesに加えていないエピソードの報酬
+        self.finished_episode_set : set[int] = set()
+        self.next_episode = 1   # 次にreward_seriesに加えるエピソード
+        self.profile_record : dict[int, dict[str, dict[str, float]]] = {}   # エピソード毎の各処理の時間
 
     def register_reward(self, episode, reward) -> None : 
-        if episode not in self.reward_record : 
-            self.reward_record[episode] = []
-        self.reward_record[episode].append(reward)
+        if episode not in self.episode_reward_dict : 
+            self.episode_reward_dict[episode] = RunningStat()
+        self.episode_reward_dict[episode].add(reward)
+
+    # workerで集計したエピソードの報酬を受け取る
+    def merge_episode_reward(self, episode : int, episode_reward : RunningStat) -> None : 
+        if episode not in self.episode_reward_dict : 
+            self.episode_reward_dict[episode] = RunningStat()
+        self.episode_reward_dict[episode].merge(episode_reward)
+
+    def pop_episode_reward(self, episode : int) -> RunningStat : 
+        return self.episode_reward_dict.pop(episode, RunningStat())
+
+    # エピソードの終了時に呼ぶ（報酬のないエピソードは推移に含めない）
+    def finish_episode(self, episode : int) -> None : 
+        self.finished_episode_set.add(episode)
+        while self.next_episode in self.finished_episode_set : 
+            self.finished_episode_set.remove(self.next_episode)
+            episode_reward = self.episode_reward_dict.pop(self.next_episode, None)
+            if episode_reward != None and episode_reward.count > 0 : 
+                self.reward_series.add(episode_reward.mean)
+            self.next_episode += 1
+
+    # チェックポイントに含める状態
+    def get_checkpoint(self) -> dict[str, any] : 
+        return {
+            "reward_series" : self.reward_series, 
+            "episode_reward_dict" : self.episode_reward_dict, 
+            "finished_episode_set" : self.finished_episode_set, 
+            "next_episode" : self.next_episode, 
+            "profile_record" : self.profile_record
+        }
+
+    # next_episodeから再開する（それ以降のエピソードはもう一度実行するので、途中までの集計は捨てる）
+    def load_checkpoint(self, checkpoint : dict[str, any], next_episode : int) -> None : 
+        self.reward_series = checkpoint["reward_series"]
+        self.episode_reward_dict = {episode : episode_reward for episode, episode_reward in checkpoint["episode_reward_dict"].items() if episode < next_episode}
+        self.finished_episode_set = {episode for episode in checkpoint["finished_episode_set"] if episode < next_episode}
+        self.next_episode = checkpoint["next_episode"]
+        self.profile_record = {episode : profile for episode, profile in checkpoint["profile_record"].items() if episode < next_episode}
 
+    def register_profile(self, episode, profile : dict[str, dict[str, float]]) -> None : 
+        self.profile_record[episode] = profile
+
+    # 書き出す内容はここで作り（スナップショット）、ファイルへの書き出しとグラフの描画はwriterで行う
     def write_result(self) -> None : 
-        # 得られた報酬の推移を描画
-        episode_list = self.reward_record.keys()
-        episode_list = sorted(episode_list)
-        meaned_reward_record = [mean(self.reward_record[i]) for i in episode_list]
-        normalized_reward_record = self.get_normalize_list(meaned_reward_record)
-        time_list = [i for i in range(len(normalized_reward_record))]
-        plt.plot(time_list, normalized_reward_record)
-        plt.xlabel("episode", fontsize = 14)
-        plt.ylabel("reward", fontsize = 14)
-        plt.xticks(fontsize = 12)
-        plt.yticks(fontsize = 12)
-        plt.grid()
-        plt.savefig(self.sim_path.joinpath("reward.png"), bbox_inches="tight")
-        plt.clf()
-
-    # 移動平均を計算
-    def get_normalize_list(self, target_list : list[float], size = 100) -> list[float] : 
-        ret = []
-        pos_sum = sum(target_list[: size])
-        for i in range(len(target_list) - size) : 
-            pos_sum = pos_sum - target_list[i] + target_list[i + size]
-            ret.append(pos_sum / size)
-        return ret
+        # 各処理の時間を書き出す
+        if len(self.profile_record) > 0 : 
+            submit_write(self.writer, "profile", write_profile, self.sim_path, dict(self.profile_record))
+
+        # 得られた報酬の推移を書き出す（間引いた推移だけなので、学習が長くなっても大きさは変わらない）
+        metrics_path = self.sim_path.joinpath("metrics.json")
+        submit_write(self.writer, "metrics", write_metrics, metrics_path, {"reward" : self.reward_series.to_dict()})
+        if self.plot : 
+            from report import plot_metrics   # matplotlibは描画するときだけ読み込む
+            submit_write(self.writer, "plot", plot_metrics, metrics_path)
+
+        # 書き出しが追いついているか（レポートはwriterのスレッドで、それまでの書き出しが終わってから作る）
+        if self.writer != None : 
+            submit_write(self.writer, "writer", write_writer_report, self.sim_path.joinpath("writer.json"), self.writer.get_report)
+
+
+    # writerの書き出しが全て終わるまで待ち、最後の状態のレポートを書き出す
+    def close(self) -> None : 
+        if self.writer == None : 
+            return
+        self.writer.close()
+        write_writer_report(self.sim_path.joinpath("writer.json"), self.writer.get_report)
+
+
+# エピソード毎の計測結果をjsonに、全エピソードの合計を表にして書き出す
+def write_profile(sim_path : Path, profile_record : dict[int, dict[str, dict[str, float]]]) -> None : 
+    with open(sim_path.joinpath("profile.json"), "w") as f : 
+        json.dump({str(episode) : profile for episode, profile in sorted(profile_record.items())}, f)
+
+    total_profile = merge_profile(list(profile_record.values()))
+    total_time = sum(value["time"] for name, value in total_profile.items() if "." not in name)   # optimize.*はoptimizeの内訳
+    line_list = [
+        "episodes : " + str(len(profile_record)), 
+        "name".ljust(28) + "time[s]".rjust(12) + "count".rjust(12) + "mean[ms]".rjust(12) + "share[%]".rjust(12)
+    ]
+    for name, value in sorted(total_profile.items(), key=lambda x : x[1]["time"], reverse=True) : 
+        line_list.append(
+            name.ljust(28) + 
+            ("%.3f" % value["time"]).rjust(12) + 
+            str(value["count"]).rjust(12) + 
+            ("%.4f" % (value["time"] / value["count"] * 1000)).rjust(12) + 
+            ("%.1f" % (value["time"] / total_time * 100 if total_time > 0 else 0)).rjust(12)
+        )
+    with open(sim_path.joinpath("profile.txt"), "w") as f : 
+        f.write("\n".join(line_list) + "\n")
+
 
+def write_writer_report(path : Path, get_report : Callable[[], dict[str, any]]) -> None : 
+    with open(path, "w") as f : 
+        json.dump(get_report(), f, indent=2)
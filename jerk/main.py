@@ -1,122 +1,140 @@
 import os, random
 from pathlib import Path
-import shutil
+import shutil, argparse
 
 from logger import TotalLogger
-from simulator import Simulator 
+from writer import AsyncWriter
 from DQN.DQN import DQN
+from world import World
+from parallel import run_parallel
+from vec_simulator import VecSimulator
+from checkpoint import save_checkpoint, load_checkpoint
 from const import ROOT_DIR
 
 RESULT_DIR = ROOT_DIR.joinpath("result")
 EPISODE_DIR = RESULT_DIR.joinpath("episode")
 MODEL_DIR = RESULT_DIR.joinpath("model")
 SIM_DIR = RESULT_DIR.joinpath("sim")
+CHECKPOINT_DIR = RESULT_DIR.joinpath("checkpoint")
 
 if __name__ == "__main__" : 
-    if RESULT_DIR.exists() : 
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--no-plots", action="store_true", help="グラフを描画しない（matplotlibを読み込まない）")
+    parser.add_argument("--resume", action="store_true", help="result/checkpointから学習を再開する（resultを消さない）")
+    args = parser.parse_args()
+
+    if RESULT_DIR.exists() and args.resume == False : 
         shutil.rmtree(RESULT_DIR)
-    RESULT_DIR.mkdir()
-    EPISODE_DIR.mkdir()
-    MODEL_DIR.mkdir()
-    SIM_DIR.mkdir()
+    RESULT_DIR.mkdir(exist_ok=True)
+    EPISODE_DIR.mkdir(exist_ok=True)
+    MODEL_DIR.mkdir(exist_ok=True)
+    SIM_DIR.mkdir(exist_ok=True)
 
     init_data = {
+        "scenario" : "single",   # 道路網と車の配置（scenario.pyのsingle, corridor, grid, grid_od）
+        "network_path" : None,   # 道路網をファイル（jsonかcsvのディレクトリ）から読み込む場合のパス
         "delta_t" : 0.1, 
         "state_columns" : ["accel", "velocity", "distance_intersection", "front_vehicle_velocity", "front_vehicle_distance", "proper_front_vehicle_distance"],
         "result_path" : RESULT_DIR,  
+        "episode_dir" : EPISODE_DIR, 
+        "sim_path" : SIM_DIR, 
+        "checkpoint_path" : CHECKPOINT_DIR, 
+        "checkpoint_interval" : 10,   # 何エピソード毎に学習の状態をcheckpoint_pathに書き出すか
         "learning_rate" : 0.0001, 
         "target_learning_rate" : 0.005, 
         "buffer_size" : 10000, 
         "jerk_cand" : [-1, 0, 1],
         "batch_size" : 128,
+        "train_frequency" : 1,   # 何ステップ毎に学習するか
+        "gradient_steps" : 1,   # 1回の学習で何回パラメータを更新するか
+        "learning_starts" : None,   # memoryがこの数を超えたら学習を始める（Noneならbatch_size * 10）
         "gamma" : 0.995, 
+        "prioritized_replay" : False,   # Trueにすると優先度付き経験再生（TD誤差の大きい経験を多く学習する）
+        "priority_alpha" : 0.6,   # 優先度をTD誤差の何乗にするか（0なら一様）
+        "priority_beta" : 0.4,   # 重要度サンプリングの補正の強さの初期値（max_episodeで1になる）
+        "inference_dtype" : "float32",   # 行動選択に使うnetworkの型（float32, float16, bfloat16, int8）
+        "inference_compile_mode" : None,   # 行動選択に使うnetworkのcompile（None, "script", "compile"）
+        "inference_sync_interval" : 1,   # 何回の更新毎に行動選択用のnetworkに重みを写すか（更新は毎ステップ。int8は量子化し直すので1回約1ms、int8でcompileは作り直すので大きくする）
         "max_episode" : 5000, 
         "log_interval" : 10, 
         "limit_velocity" : 15, 
         "limit_accel" : 1, 
         "limit_brake" : -3, 
-        "limit_step_count" : 500
+        "limit_step_count" : 500, 
+        "idm_parameter" : {},   # IDMの車のパラメータ（"v0", "T", "a", "b", "d", "s0"、省略したものはIDM.pyの値、v0はlimit_velocity）
+        "geometry_cell_size" : 150,   # 空間ハッシュの1マスの大きさ[m]
+        "route_cache_size" : 10000,   # ODから求めた経路をいくつまでキャッシュするか
+        "route_all_pairs" : False,   # Trueにすると全てのODの経路を最初に求める（小さな道路網のみ）
+        "inflow_init_data_list" : [],   # エピソードの途中で車を流入させる設定（spawner.pyのinflow_init_data）
+        "vectorize" : False,   # Trueにするとvehicleの運動をnumpy配列でまとめて計算する
+        "num_workers" : 0,   # 1以上にするとworkerプロセスでエピソードを並列に実行する
+        "num_envs" : 1,   # 2以上にすると1プロセス内で複数のエピソードを同時に進める
+        "sync_interval" : 1,   # 何エピソード毎にworkerの重みを更新するか
+        "plot" : args.no_plots == False, 
+        "async_write" : True,   # Trueにするとログ・結果・チェックポイントの書き出しを別スレッドで行う
+        "writer_queue_size" : 8,   # 書き出し待ちをいくつまで溜めるか（一杯になると学習を止めて待つ）
+        "profile" : False   # Trueにすると各処理の時間を計測してsim/profile.txtに書き出す
     }
 
+    # 書き出しを行うスレッドを初期化
+    writer = AsyncWriter(init_data["writer_queue_size"]) if init_data["async_write"] else None
+
     # totalLoggerを初期化
-    total_logger = TotalLogger(SIM_DIR)
+    total_logger = TotalLogger(SIM_DIR, init_data["plot"], writer)
 
     # dqnを初期化
-    dqn = DQN({
+    dqn_init_data = {
         "state_columns" : init_data["state_columns"], 
         "buffer_size" : init_data["buffer_size"], 
         "learning_rate" : init_data["learning_rate"],
         "target_learning_rate" : init_data["target_learning_rate"],
         "jerk_cand" : init_data["jerk_cand"], 
         "batch_size" : init_data["batch_size"], 
+        "train_frequency" : init_data["train_frequency"], 
+        "gradient_steps" : init_data["gradient_steps"], 
+        "learning_starts" : init_data["learning_starts"], 
         "gamma" : init_data["gamma"], 
+        "prioritized_replay" : init_data["prioritized_replay"], 
+        "priority_alpha" : init_data["priority_alpha"], 
+        "priority_beta" : init_data["priority_beta"], 
+        "inference_dtype" : init_data["inference_dtype"], 
+        "inference_compile_mode" : init_data["inference_compile_mode"], 
+        "inference_sync_interval" : init_data["inference_sync_interval"], 
         "max_episode" : init_data["max_episode"], 
-        "model_path" : MODEL_DIR
-    })
-
-    for pos_episode in range(1, init_data["max_episode"] + 1) : 
-        print()
-        print(pos_episode)
-
-        # signal
-        signal_init_data_list = []
-        init_data["signal_init_data_list"] = signal_init_data_list
+        "model_path" : MODEL_DIR, 
+        "plot" : init_data["plot"], 
+        "profile" : init_data["profile"]
+    }
+    dqn = DQN(dqn_init_data)
+    dqn.writer = writer   # dqn_init_dataはworkerに渡すので、writerは入れない
 
-        # intersection
-        intersection_init_data_list = [
-            {
-                "number" : 0, 
-                "y" : 0, 
-                "x" : 0, 
-                "signal_number" : None
-            }, 
-            {
-                "number" : 1, 
-                "y" : 0, 
-                "x" : 400, 
-                "signal_number" : None
-            }
-        ]
-        init_data["intersection_init_data_list"] = intersection_init_data_list
+    # 学習の状態をチェックポイントから戻す
+    init_data["start_episode"] = 1
+    if args.resume : 
+        init_data["start_episode"] = load_checkpoint(CHECKPOINT_DIR, dqn, total_logger)
+        print("resume from episode " + str(init_data["start_episode"]))
 
-        # lane
-        lane_init_data_list = []
-        for lane_number in range(1) : 
-            lane_init_data = {
-                "number" : lane_number, 
-                "from_intersection_number" : 0, 
-                "to_intersection_number" : 1
-            }
-            lane_init_data_list.append(lane_init_data)
-        init_data["lane_init_data_list"] = lane_init_data_list
+    if init_data["num_workers"] > 0 : 
+        run_parallel(init_data, dqn_init_data, dqn, total_logger)
+    elif init_data["num_envs"] > 1 : 
+        vec_simulator = VecSimulator(init_data, total_logger, dqn)
+        vec_simulator.start()
+    else : 
+        world = World(init_data, total_logger, dqn)
+        for pos_episode in range(init_data["start_episode"], init_data["max_episode"] + 1) : 
+            print()
+            print(pos_episode)
 
-        # vehicle
-        vehicle_init_data_list = []
-        for vehicle_number in range(2) : 
-            vehicle_init_data = {
-                "number" : vehicle_number, 
-                "length" : 4.4, 
-                "decide_action_way" : "DQN" if vehicle_number == 0 else "IDM", 
-                "velocity" : 2, 
-                "accel" : 0, 
-                "jerk" : 0, 
-                "lane_number" : 0, 
-                "lane_place" : 10 * vehicle_number,   # 適当
-                "route_list" : [0], 
-                "jerk_cand" : init_data["jerk_cand"], 
-                "limit_velocity" : init_data["limit_velocity"], 
-                "limit_accel" : init_data["limit_accel"], 
-                "limit_brake" : init_data["limit_brake"]
-            }
-            vehicle_init_data_list.append(vehicle_init_data)
-        init_data["vehicle_init_data_list"] = vehicle_init_data_list
+            dqn.pos_episode = pos_episode
+            simulator = world.reset(pos_episode)
+            simulator.start()
+            total_logger.finish_episode(pos_episode)
 
-        init_data["pos_episode"] = pos_episode
-        init_data["episode_path"] = EPISODE_DIR.joinpath("episode_" + str(pos_episode).zfill(4))
-        dqn.pos_episode = pos_episode
-        simulator = Simulator(init_data, total_logger, dqn)
-        simulator.start()
+            if pos_episode % 10 == 0 : 
+                total_logger.write_result()
+                dqn.write_result()
+            if pos_episode % init_data["checkpoint_interval"] == 0 : 
+                save_checkpoint(CHECKPOINT_DIR, dqn, total_logger, pos_episode + 1)
 
-        if pos_episode % 10 == 0 : 
-            total_logger.write_result()
-            dqn.write_result()
\ No newline at end of file
+    # 書き出しが全て終わるまで待つ
+    total_logger.close()
@@ -0,0 +1,140 @@
+import json, math
+from collections import deque
+from pathlib import Path
+
+
+# 値を1つずつ受け取り、全体を保存せずにO(1)で集計する
+# 書き出しはMetricSeries::to_dictのjson（描画はreport.pyで別に行う）
+
+
+# 平均・分散（Welfordの方法）、最小、最大
+class RunningStat : 
+    def __init__(self) -> None:
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0   # 平均との差の2乗和
+        self.min = math.inf
+        self.max = -math.inf
+
+
+    def add(self, value : float) -> None : 
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+
+    # 別に集計したもの（workerで集計したエピソードなど）をまとめる
+    def merge(self, other : "RunningStat") -> None : 
+        if other.count == 0 : 
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.mean += delta * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+
+    def get_variance(self) -> float : 
+        return self.m2 / self.count if self.count > 0 else 0.0
+
+
+    def to_dict(self) -> dict[str, float] : 
+        return {
+            "count" : self.count, 
+            "mean" : self.mean, 
+            "std" : math.sqrt(self.get_variance()), 
+            "min" : self.min if self.count > 0 else None, 
+            "max" : self.max if self.count > 0 else None
+        }
+
+
+# 直近size個の値の和（移動平均）
+class MovingWindow : 
+    def __init__(self, size : int) -> None:
+        self.size = size
+        self.value_queue : deque[float] = deque()
+        self.sum = 0.0
+
+
+    def add(self, value : float) -> None : 
+        self.value_queue.append(value)
+        self.sum += value
+        if len(self.value_queue) > self.size : 
+            self.sum -= self.value_queue.popleft()
+
+
+    def get_mean(self) -> float : 
+        return self.sum / len(self.value_queue) if len(self.value_queue) > 0 else 0.0
+
+
+# 推移をcapacity個以下の点に間引いて持つ
+# 各点はstride個の連続した値の平均で、点がcapacity個になったら隣り合う2点をまとめてstrideを2倍にする
+class Downsampler : 
+    def __init__(self, capacity : int) -> None:
+        self.capacity = capacity - capacity % 2   # 2点ずつまとめるので偶数にする
+        self.stride = 1
+        self.point_list : list[float] = []
+        self.bucket_sum = 0.0   # まだ点になっていない値の和
+        self.bucket_count = 0
+
+
+    def add(self, value : float) -> None : 
+        self.bucket_sum += value
+        self.bucket_count += 1
+        if self.bucket_count < self.stride : 
+            return
+        self.point_list.append(self.bucket_sum / self.bucket_count)
+        self.bucket_sum = 0.0
+        self.bucket_count = 0
+        if len(self.point_list) >= self.capacity : 
+            self.point_list = [(self.point_list[i] + self.point_list[i + 1]) / 2 for i in range(0, len(self.point_list), 2)]
+            self.stride *= 2
+
+
+    # 点の列（途中のbucketも最後の点として含める）
+    def get_point_list(self) -> list[float] : 
+        if self.bucket_count > 0 : 
+            return self.point_list + [self.bucket_sum / self.bucket_count]
+        return list(self.point_list)
+
+
+# 1系列の集計（全体の統計、移動平均、値と移動平均の間引いた推移）
+class MetricSeries : 
+    def __init__(self, window_size : int, capacity : int = 1000) -> None:
+        self.stat = RunningStat()
+        self.window = MovingWindow(window_size)
+        self.history = Downsampler(capacity)
+        self.smoothed_history = Downsampler(capacity)   # 移動平均の推移
+
+
+    def __len__(self) -> int : 
+        return self.stat.count
+
+
+    def add(self, value : float) -> None : 
+        self.stat.add(value)
+        self.window.add(value)
+        self.history.add(value)
+        self.smoothed_history.add(self.window.get_mean())
+
+
+    # 推移の点iは、i * stride番目からstride個の値の平均
+    def to_dict(self) -> dict[str, any] : 
+        return self.stat.to_dict() | {
+            "window_size" : self.window.size, 
+            "window_mean" : self.window.get_mean(), 
+            "stride" : self.history.stride, 
+            "history" : self.history.get_point_list(), 
+            "smoothed_history" : self.smoothed_history.get_point_list()
+        }
+
+
+# {系列の名前 : MetricSeries::to_dict}をjsonに書き出す
+def write_metrics(path : Path, metrics : dict[str, dict[str, any]]) -> None : 
+    with open(path, "w") as f : 
+        json.dump(metrics, f)
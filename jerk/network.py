@@ -0,0 +1,285 @@
+from typing import Callable
+import json, csv
+from pathlib import Path
+import numpy as np
+
+
+# 道路網（signal, intersection, lane）を配列で持つ
+# intersection, laneは番号順に並べ、番号 -> 位置はsearchsortedで求める
+# 各intersectionから出るlaneはCSR形式（out_offset[i] : out_offset[i + 1]の範囲のout_lane_index）で持つ
+# 信号がないintersectionのsignal_numberは-1
+#
+# ファイル形式
+# json : {"signal_list" : [...], "intersection_list" : [...], "lane_list" : [...]}
+#        各要素はsignal_init_data, intersection_init_data, lane_init_dataと同じキーを持つ
+# csv  : ディレクトリにsignal.csv, intersection.csv, lane.csvを置く（1行目はヘッダー）
+#        signal.csv       : number, first_time, blue, yellow_to_red, red, yellow_to_blue
+#        intersection.csv : number, y, x, signal_number（信号なしは-1）
+#        lane.csv         : number, from_intersection_number, to_intersection_number, length（lengthの列は省略可）
+SIGNAL_COLUMNS = ["number", "first_time", "blue", "yellow_to_red", "red", "yellow_to_blue"]
+INTERSECTION_COLUMNS = ["number", "y", "x", "signal_number"]
+LANE_COLUMNS = ["number", "from_intersection_number", "to_intersection_number", "length"]
+NO_SIGNAL = -1
+
+
+class RoadNetwork : 
+    def __init__(self, signal_init_data_list : list[dict[str, any]], 
+                 intersection_number : np.ndarray, intersection_y : np.ndarray, intersection_x : np.ndarray, intersection_signal_number : np.ndarray, 
+                 lane_number : np.ndarray, lane_from : np.ndarray, lane_to : np.ndarray, lane_length : np.ndarray = None) -> None:
+        # 信号は数が少ないのでinit_dataのまま持つ
+        self.signal_init_data_list = signal_init_data_list
+
+        # intersection（番号順）
+        order = np.argsort(intersection_number, kind="stable")
+        self.intersection_number = np.asarray(intersection_number, dtype=np.int64)[order]
+        self.intersection_y = np.asarray(intersection_y)[order]
+        self.intersection_x = np.asarray(intersection_x)[order]
+        self.intersection_signal_number = np.asarray(intersection_signal_number, dtype=np.int64)[order]
+        assert len(np.unique(self.intersection_number)) == len(self.intersection_number), "duplicated intersection number"
+
+        # lane（番号順）
+        order = np.argsort(lane_number, kind="stable")
+        self.lane_number = np.asarray(lane_number, dtype=np.int64)[order]
+        self.lane_from = np.asarray(lane_from, dtype=np.int64)[order]
+        self.lane_to = np.asarray(lane_to, dtype=np.int64)[order]
+        assert len(np.unique(self.lane_number)) == len(self.lane_number), "duplicated lane number"
+        self.lane_from_index = self.get_intersection_index(self.lane_from)
+        self.lane_to_index = self.get_intersection_index(self.lane_to)
+
+        # laneの長さ（与えられていなければ両端のintersectionの直線距離）
+        if lane_length is None : 
+            dy = self.intersection_y[self.lane_to_index] - self.intersection_y[self.lane_from_index]
+            dx = self.intersection_x[self.lane_to_index] - self.intersection_x[self.lane_from_index]
+            self.lane_length = np.hypot(dy, dx)
+        else : 
+            self.lane_length = np.asarray(lane_length, dtype=np.float64)[order]
+
+        # intersectionから出るlane（CSR）
+        self.out_lane_index = np.argsort(self.lane_from_index, kind="stable")
+        self.out_offset = np.zeros(len(self.intersection_number) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.lane_from_index, minlength=len(self.intersection_number)), out=self.out_offset[1 :])
+
+        # cell_size -> GeometryIndex（geometry.get_geometry_indexで最初に使うときに作る）
+        self.geometry_index_dict : dict[float, any] = {}
+
+
+    def get_intersection_size(self) -> int : 
+        return len(self.intersection_number)
+
+
+    def get_lane_size(self) -> int : 
+        return len(self.lane_number)
+
+
+    # 番号（スカラーでも配列でもよい） -> 配列上の位置
+    def get_intersection_index(self, number : any) -> any : 
+        index = np.searchsorted(self.intersection_number, number)
+        if np.any(index >= len(self.intersection_number)) or np.any(self.intersection_number[np.minimum(index, len(self.intersection_number) - 1)] != number) : 
+            raise KeyError("not found intersection number : " + str(number))
+        return index
+
+
+    def get_lane_index(self, number : any) -> any : 
+        index = np.searchsorted(self.lane_number, number)
+        if np.any(index >= len(self.lane_number)) or np.any(self.lane_number[np.minimum(index, len(self.lane_number) - 1)] != number) : 
+            raise KeyError("not found lane number : " + str(number))
+        return index
+
+
+    def has_intersection(self, number : int) -> bool : 
+        index = int(np.searchsorted(self.intersection_number, number))
+        return index < len(self.intersection_number) and self.intersection_number[index] == number
+
+
+    def has_lane(self, number : int) -> bool : 
+        index = int(np.searchsorted(self.lane_number, number))
+        return index < len(self.lane_number) and self.lane_number[index] == number
+
+
+    # Intersectionに渡すinit_data
+    def get_intersection_init_data(self, number : int) -> dict[str, any] : 
+        index = int(self.get_intersection_index(number))
+        signal_number = int(self.intersection_signal_number[index])
+        return {
+            "number" : number, 
+            "y" : self.intersection_y[index].item(), 
+            "x" : self.intersection_x[index].item(), 
+            "signal_number" : None if signal_number == NO_SIGNAL else signal_number
+        }
+
+
+    # Laneに渡すinit_data
+    def get_lane_init_data(self, number : int) -> dict[str, any] : 
+        index = int(self.get_lane_index(number))
+        return {
+            "number" : number, 
+            "from_intersection_number" : int(self.lane_from[index]), 
+            "to_intersection_number" : int(self.lane_to[index]), 
+            "length" : float(self.lane_length[index])
+        }
+
+
+    # intersectionから出るlaneの番号のリスト
+    def get_out_lane_number_list(self, intersection_number : int) -> list[int] : 
+        index = int(self.get_intersection_index(intersection_number))
+        return self.lane_number[self.out_lane_index[self.out_offset[index] : self.out_offset[index + 1]]].tolist()
+
+
+# init_dataのsignal, intersection, laneのリストから作る
+def make_network(init_data : dict[str, any]) -> RoadNetwork : 
+    intersection_init_data_list = init_data["intersection_init_data_list"]
+    lane_init_data_list = init_data["lane_init_data_list"]
+
+    # lengthが全てのlaneで与えられているときだけ使う
+    lane_length = None
+    if len(lane_init_data_list) > 0 and all("length" in lane_init_data for lane_init_data in lane_init_data_list) : 
+        lane_length = [lane_init_data["length"] for lane_init_data in lane_init_data_list]
+
+    return RoadNetwork(
+        init_data["signal_init_data_list"], 
+        [intersection_init_data["number"] for intersection_init_data in intersection_init_data_list], 
+        [intersection_init_data["y"] for intersection_init_data in intersection_init_data_list], 
+        [intersection_init_data["x"] for intersection_init_data in intersection_init_data_list], 
+        [NO_SIGNAL if intersection_init_data["signal_number"] == None else intersection_init_data["signal_number"] for intersection_init_data in intersection_init_data_list], 
+        [lane_init_data["number"] for lane_init_data in lane_init_data_list], 
+        [lane_init_data["from_intersection_number"] for lane_init_data in lane_init_data_list], 
+        [lane_init_data["to_intersection_number"] for lane_init_data in lane_init_data_list], 
+        lane_length
+    )
+
+
+# jsonファイルかcsvのディレクトリから読み込む
+def load_network(path : Path) -> RoadNetwork : 
+    path = Path(path)
+    if path.is_dir() : 
+        return load_network_csv(path)
+
+    with open(path, "r") as f : 
+        network_data = json.load(f)
+    return make_network({
+        "signal_init_data_list" : network_data.get("signal_list", []), 
+        "intersection_init_data_list" : network_data["intersection_list"], 
+        "lane_init_data_list" : network_data["lane_list"]
+    })
+
+
+# ヘッダーを読み、列名 -> 列の配列を返す
+def read_csv_column(path : Path) -> dict[str, np.ndarray] : 
+    with open(path, "r") as f : 
+        column_list = [column.strip() for column in f.readline().split(",")]
+    array = np.loadtxt(path, delimiter=",", skiprows=1, ndmin=2)
+    if array.size == 0 : 
+        array = np.zeros((0, len(column_list)))
+    return {column : array[:, index] for index, column in enumerate(column_list)}
+
+
+def load_network_csv(path : Path) -> RoadNetwork : 
+    signal_init_data_list = []
+    if path.joinpath("signal.csv").exists() : 
+        signal_column = read_csv_column(path.joinpath("signal.csv"))
+        for index in range(len(signal_column["number"])) : 
+            signal_init_data_list.append({
+                "number" : int(signal_column["number"][index]), 
+                "first_time" : signal_column["first_time"][index].item(), 
+                "interval_list" : [signal_column[column][index].item() for column in SIGNAL_COLUMNS[2 :]]
+            })
+
+    intersection_column = read_csv_column(path.joinpath("intersection.csv"))
+    lane_column = read_csv_column(path.joinpath("lane.csv"))
+    return RoadNetwork(
+        signal_init_data_list, 
+        intersection_column["number"].astype(np.int64), 
+        intersection_column["y"], 
+        intersection_column["x"], 
+        intersection_column["signal_number"].astype(np.int64), 
+        lane_column["number"].astype(np.int64), 
+        lane_column["from_intersection_number"].astype(np.int64), 
+        lane_column["to_intersection_number"].astype(np.int64), 
+        lane_column.get("length")
+    )
+
+
+# 拡張子が.jsonならjsonに、それ以外はディレクトリにcsvで書き出す
+def save_network(network : RoadNetwork, path : Path) -> None : 
+    path = Path(path)
+    if path.suffix == ".json" : 
+        intersection_list = [network.get_intersection_init_data(number) for number in network.intersection_number.tolist()]
+        lane_list = [network.get_lane_init_data(number) for number in network.lane_number.tolist()]
+        with open(path, "w") as f : 
+            json.dump({"signal_list" : network.signal_init_data_list, "intersection_list" : intersection_list, "lane_list" : lane_list}, f)
+        return
+
+    path.mkdir(parents=True, exist_ok=True)
+    with open(path.joinpath("signal.csv"), "w", newline="") as f : 
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(SIGNAL_COLUMNS)
+        for signal_init_data in network.signal_init_data_list : 
+            writer.writerow([signal_init_data["number"], signal_init_data["first_time"]] + list(signal_init_data["interval_list"]))
+    with open(path.joinpath("intersection.csv"), "w", newline="") as f : 
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(INTERSECTION_COLUMNS)
+        writer.writerows(zip(network.intersection_number.tolist(), network.intersection_y.tolist(), 
+                             network.intersection_x.tolist(), network.intersection_signal_number.tolist()))
+    with open(path.joinpath("lane.csv"), "w", newline="") as f : 
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(LANE_COLUMNS)
+        writer.writerows(zip(network.lane_number.tolist(), network.lane_from.tolist(), 
+                             network.lane_to.tolist(), network.lane_length.tolist()))
+
+
+# 番号 -> Lane, Intersectionなどのオブジェクトを、初めて参照されたときに作るdict
+# 大きな道路網でも車が通るlane, intersectionの分しかオブジェクトを作らない
+# keys, __iter__, __len__, __contains__は全ての番号を対象とし、
+# get_created_listは作成済みのオブジェクトだけを返す（作成されていないlaneには車がいない）
+class LazyObjectDict : 
+    def __init__(self, number_array : np.ndarray, factory : Callable[[int], any]) -> None:
+        self.number_array = number_array   # 番号順
+        self.factory = factory
+        self.object_dict : dict[int, any] = {}
+
+
+    def __getitem__(self, number : int) -> any : 
+        pos_object = self.object_dict.get(number)
+        if pos_object is None : 
+            if number not in self : 
+                raise KeyError(number)
+            pos_object = self.factory(number)
+            self.object_dict[number] = pos_object
+        return pos_object
+
+
+    def __contains__(self, number : int) -> bool : 
+        if number in self.object_dict : 
+            return True
+        index = int(np.searchsorted(self.number_array, number))
+        return index < len(self.number_array) and self.number_array[index] == number
+
+
+    def __len__(self) -> int : 
+        return len(self.number_array)
+
+
+    def __iter__(self) : 
+        return iter(self.number_array.tolist())
+
+
+    def keys(self) -> list[int] : 
+        return self.number_array.tolist()
+
+
+    # 全ての番号のオブジェクトを作って返す
+    def values(self) -> list[any] : 
+        return [self[number] for number in self.number_array.tolist()]
+
+
+    def items(self) -> list[tuple[int, any]] : 
+        return [(number, self[number]) for number in self.number_array.tolist()]
+
+
+    # 作成済みならそのオブジェクト、まだ作られていなければNone
+    def get_created(self, number : int) -> any : 
+        return self.object_dict.get(number)
+
+
+    def get_created_list(self) -> list[any] : 
+        return list(self.object_dict.values())
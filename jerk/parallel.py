@@ -0,0 +1,178 @@
+import multiprocessing as mp
+import queue
+import random
+import numpy as np
+import torch
+
+from logger import TotalLogger
+from writer import AsyncWriter
+from world import World
+from DQN.DQN import DQN
+from checkpoint import save_checkpoint
+from profiler import merge_profile
+
+
+# workerで行動決定だけを行うDQN（学習はlearnerが行う）
+# 経験はエピソードの終わりにまとめてlearnerに送る
+class RolloutDQN(DQN) : 
+    def __init__(self, init_data : dict[str, any]) -> None:
+        self.init_policy(init_data)   # workerでは学習しないので、target_network・optimizer・memoryは作らない
+        self.clear_transition()
+
+
+    def push_experience(self, state : dict[str, any], action, next_state : dict[str, any], reward, is_goal) : 
+        self.state_list.append(self.get_state_row(state))
+        self.action_list.append(action)
+        self.next_state_list.append(self.get_state_row(state) if is_goal else self.get_state_row(next_state))
+        self.reward_list.append(reward)
+        self.done_list.append(is_goal)
+
+
+    def optimize(self) : 
+        self.env_step_count += 1
+
+
+    def clear_transition(self) -> None : 
+        self.state_list = []
+        self.action_list = []
+        self.next_state_list = []
+        self.reward_list = []
+        self.done_list = []
+
+
+    # 溜まった経験を配列にして取り出す
+    def pop_transition(self) -> dict[str, np.ndarray] : 
+        transition = {
+            "state" : np.array(self.state_list, dtype=np.float32).reshape(-1, self.state_dimension), 
+            "action" : np.array(self.action_list, dtype=np.int64), 
+            "next_state" : np.array(self.next_state_list, dtype=np.float32).reshape(-1, self.state_dimension), 
+            "reward" : np.array(self.reward_list, dtype=np.float32), 
+            "done" : np.array(self.done_list, dtype=bool)
+        }
+        self.clear_transition()
+        return transition
+
+
+def rollout_worker(worker_number : int, init_data : dict[str, any], dqn_init_data : dict[str, any], 
+                   episode_queue : mp.Queue, result_queue : mp.Queue, weight_queue : mp.Queue) -> None : 
+    # 各workerはCPUを1コアだけ使う
+    torch.set_num_threads(1)
+    seed = init_data.get("seed", None)
+    if seed != None : 
+        random.seed(seed + worker_number)
+        torch.manual_seed(seed + worker_number)
+
+    dqn = RolloutDQN(dqn_init_data)
+    writer = AsyncWriter(init_data.get("writer_queue_size", 8)) if init_data.get("async_write", False) else None   # 車のログの書き出し用
+    total_logger = TotalLogger(init_data["sim_path"], writer=writer)   # rewardはlearnerに送るため、このloggerは書き出さない
+    world = World(init_data, total_logger, dqn)
+    
+    while True : 
+        pos_episode = episode_queue.get()
+        if pos_episode == None : 
+            break
+
+        # 最新の重みを反映する
+        state_dict = None
+        while True : 
+            try : 
+                state_dict = weight_queue.get_nowait()
+            except queue.Empty : 
+                break
+        if state_dict != None : 
+            dqn.network.load_state_dict(state_dict)
+            dqn.sync_inference_network(force=True)
+
+        dqn.pos_episode = pos_episode
+        step_count = dqn.env_step_count
+        simulator = world.reset(pos_episode)
+        simulator.start()
+
+        result_queue.put({
+            "pos_episode" : pos_episode, 
+            "step_count" : dqn.env_step_count - step_count, 
+            "transition" : dqn.pop_transition(), 
+            "reward" : total_logger.pop_episode_reward(pos_episode), 
+            "profile" : total_logger.profile_record.pop(pos_episode, None)
+        })
+    
+    if writer != None : 
+        writer.close()
+    result_queue.put(None)
+
+
+# num_workers個のプロセスでエピソードを実行し、このプロセス（learner）が経験を受け取って学習する
+def run_parallel(init_data : dict[str, any], dqn_init_data : dict[str, any], dqn : DQN, total_logger : TotalLogger) -> None : 
+    num_workers = init_data["num_workers"]
+    sync_interval = init_data.get("sync_interval", 1)   # 何エピソード毎に重みをworkerに送るか
+    context = mp.get_context("spawn")
+
+    start_episode = init_data.get("start_episode", 1)
+    checkpoint_path = init_data.get("checkpoint_path")
+    checkpoint_interval = init_data.get("checkpoint_interval", 10)
+
+    episode_queue = context.Queue()
+    for pos_episode in range(start_episode, init_data["max_episode"] + 1) : 
+        episode_queue.put(pos_episode)
+    for _ in range(num_workers) : 
+        episode_queue.put(None)
+
+    result_queue = context.Queue(maxsize=num_workers * 2)   # learnerが追いつかないときはworkerを待たせる
+    weight_queue_list = [context.Queue() for _ in range(num_workers)]
+    process_list = [
+        context.Process(target=rollout_worker, args=(worker_number, init_data, dqn_init_data, 
+                                                     episode_queue, result_queue, weight_queue_list[worker_number]))
+        for worker_number in range(num_workers)
+    ]
+    for process in process_list : 
+        process.start()
+    
+    share_weight(dqn, weight_queue_list)
+
+    finished_worker_count = 0
+    finished_episode_count = 0
+    finished_episode_set = set()
+    next_episode = start_episode   # まだ終わっていない最も前のエピソード（チェックポイントから再開する位置）
+    while finished_worker_count < num_workers : 
+        result = result_queue.get()
+        if result == None : 
+            finished_worker_count += 1
+            continue
+
+        pos_episode = result["pos_episode"]
+        print()
+        print(pos_episode)
+
+        # 経験を格納して、workerが進めたステップ数だけ学習する
+        dqn.memory.push_batch(**result["transition"])
+        total_logger.merge_episode_reward(pos_episode, result["reward"])
+        total_logger.finish_episode(pos_episode)
+        dqn.pos_episode = pos_episode
+        for _ in range(result["step_count"]) : 
+            dqn.optimize()
+
+        # workerの計測結果に、このエピソードの分の学習（learner）の計測結果を加える
+        if result["profile"] != None : 
+            total_logger.register_profile(pos_episode, merge_profile([result["profile"], dqn.profiler.pop()]))
+
+        finished_episode_count += 1
+        finished_episode_set.add(pos_episode)
+        while next_episode in finished_episode_set : 
+            finished_episode_set.remove(next_episode)
+            next_episode += 1
+        if finished_episode_count % sync_interval == 0 : 
+            share_weight(dqn, weight_queue_list)
+        if finished_episode_count % 10 == 0 : 
+            total_logger.write_result()
+            dqn.write_result()
+        if checkpoint_path != None and finished_episode_count % checkpoint_interval == 0 : 
+            save_checkpoint(checkpoint_path, dqn, total_logger, next_episode)
+
+    for process in process_list : 
+        process.join()
+
+
+def share_weight(dqn : DQN, weight_queue_list : list[mp.Queue]) -> None : 
+    state_dict = {key : value.cpu() for key, value in dqn.network.state_dict().items()}
+    for weight_queue in weight_queue_list : 
+        weight_queue.put(state_dict)
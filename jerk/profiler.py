@@ -0,0 +1,48 @@
+import time
+
+
+# 処理の区間毎の時間を計測する
+# start()の後、区間が終わる毎にlap(name)を呼ぶと、前回のstart/lapからの時間がnameに加算される
+# enabled == Falseのときは何もしないので、常に呼び出しておいてよい
+class Profiler : 
+    def __init__(self, enabled : bool = False) -> None:
+        self.enabled = enabled
+        self.time_dict : dict[str, float] = {}
+        self.count_dict : dict[str, int] = {}
+        self.last_time = 0.0
+
+
+    def start(self) -> None : 
+        if self.enabled : 
+            self.last_time = time.perf_counter()
+
+
+    def lap(self, name : str) -> None : 
+        if self.enabled == False : 
+            return
+        now = time.perf_counter()
+        self.time_dict[name] = self.time_dict.get(name, 0.0) + now - self.last_time
+        self.count_dict[name] = self.count_dict.get(name, 0) + 1
+        self.last_time = now
+
+
+    # 集計結果を取り出してリセットする
+    def pop(self) -> dict[str, dict[str, float]] : 
+        profile = {
+            name : {"time" : self.time_dict[name], "count" : self.count_dict[name]} for name in self.time_dict.keys()
+        }
+        self.time_dict = {}
+        self.count_dict = {}
+        return profile
+
+
+# 複数の集計結果を足し合わせる
+def merge_profile(profile_list : list[dict[str, dict[str, float]]]) -> dict[str, dict[str, float]] : 
+    merged_profile = {}
+    for profile in profile_list : 
+        for name, value in profile.items() : 
+            if name not in merged_profile : 
+                merged_profile[name] = {"time" : 0.0, "count" : 0}
+            merged_profile[name]["time"] += value["time"]
+            merged_profile[name]["count"] += value["count"]
+    return merged_profile
@@ -0,0 +1,62 @@
+import json, argparse
+from pathlib import Path
+
+# matplotlib, pandasは読み込みに時間がかかるため、描画・読み込みを実際に行うときだけimportする
+# （シミュレーションと学習だけを行うプロセスではimportされない）
+
+
+def get_pyplot() : 
+    import matplotlib
+    matplotlib.use("Agg")   # ファイルに保存するだけなので画面は使わない
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def read_csv(path : str) : 
+    import pandas as pd
+    return pd.read_csv(path)
+
+
+# metrics.jsonの系列毎の横軸の名前と、縦軸を対数にするか
+METRIC_PLOT_DICT = {
+    "reward" : ("episode", False), 
+    "loss" : ("opt times", True)
+}
+
+
+# 推移のグラフを描画して保存する
+def plot_series(path : Path, y_list : list[float], xlabel : str, ylabel : str, log_scale : bool = False, x_list : list[float] = None) -> None : 
+    plt = get_pyplot()
+    time_list = x_list if x_list != None else [i for i in range(len(y_list))]
+    plt.plot(time_list, y_list)
+    plt.xlabel(xlabel, fontsize = 14)
+    plt.ylabel(ylabel, fontsize = 14)
+    plt.xticks(fontsize = 12)
+    plt.yticks(fontsize = 12)
+    if log_scale : 
+        plt.yscale("log")
+    plt.grid()
+    plt.savefig(path, bbox_inches="tight")
+    plt.clf()
+
+
+# metrics.json（metrics.pyのwrite_metrics）の各系列の移動平均の推移を、同じディレクトリの<系列の名前>.pngに描画する
+def plot_metrics(metrics_path : Path) -> None : 
+    with open(metrics_path, "r") as f : 
+        metrics = json.load(f)
+    for name, series in metrics.items() : 
+        y_list = series["smoothed_history"]
+        if len(y_list) < 2 : 
+            continue
+        xlabel, log_scale = METRIC_PLOT_DICT.get(name, ("step", False))
+        x_list = [i * series["stride"] for i in range(len(y_list))]
+        plot_series(metrics_path.parent.joinpath(name + ".png"), y_list, xlabel, name, log_scale=log_scale and min(y_list) > 0, x_list=x_list)
+
+
+# 学習の後で描画する : python report.py result/sim/metrics.json result/model/metrics.json
+if __name__ == "__main__" : 
+    parser = argparse.ArgumentParser()
+    parser.add_argument("metrics_path", type=str, nargs="+", help="metrics.jsonのパス")
+    args = parser.parse_args()
+    for metrics_path in args.metrics_path : 
+        plot_metrics(Path(metrics_path))
@@ -0,0 +1,175 @@
+import heapq, math
+from collections import OrderedDict
+import numpy as np
+
+from network import RoadNetwork
+
+
+DEFAULT_ROUTE_CACHE_SIZE = 10000
+
+
+# laneを辺、intersectionを頂点とするグラフで、長さが最短の経路（laneの番号のリスト）を求める
+# 求めた経路はOD（出発・到着のintersection） -> 経路のLRUキャッシュに入れる
+# 小さな道路網ではprecompute_all_pairsで全てのODの経路を先に求めておける
+class Router : 
+    def __init__(self, network : RoadNetwork, cache_size : int = DEFAULT_ROUTE_CACHE_SIZE, use_astar : bool = True) -> None:
+        self.network = network
+        self.cache_size = cache_size
+
+        # 探索ではintersection, laneを配列上の位置で扱う（python listの方が要素の読み出しが速い）
+        self.out_offset : list[int] = network.out_offset.tolist()
+        self.out_lane_index : list[int] = network.out_lane_index.tolist()
+        self.lane_from_index : list[int] = network.lane_from_index.tolist()
+        self.lane_to_index : list[int] = network.lane_to_index.tolist()
+        self.lane_length : list[float] = network.lane_length.tolist()
+        self.lane_number : list[int] = network.lane_number.tolist()
+        self.intersection_y : list[float] = network.intersection_y.tolist()
+        self.intersection_x : list[float] = network.intersection_x.tolist()
+
+        # A*の距離の下限には直線距離を使うので、laneの長さが直線距離より短い道路網では使わない
+        self.use_astar = use_astar and self.is_length_at_least_euclidean()
+
+        self.route_cache : OrderedDict[tuple[int, int], list[int]] = OrderedDict()   # (origin, destination) -> 経路
+        self.next_lane_index : np.ndarray = None   # 全ODを求めた場合 [origin, destination] -> 最初のlane（なければ-1）
+        self.hit_count = 0
+        self.miss_count = 0
+
+
+    def is_length_at_least_euclidean(self) -> bool : 
+        network = self.network
+        dy = network.intersection_y[network.lane_to_index] - network.intersection_y[network.lane_from_index]
+        dx = network.intersection_x[network.lane_to_index] - network.intersection_x[network.lane_from_index]
+        return bool(np.all(network.lane_length >= np.hypot(dy, dx) - 1e-9))
+
+
+    # originからdestinationまでの経路（laneの番号のリスト）
+    # 到達できなければNone、origin == destinationなら空のリスト
+    def find_route(self, origin : int, destination : int) -> list[int] : 
+        key = (origin, destination)
+        route = self.route_cache.get(key)
+        if route != None or key in self.route_cache : 
+            self.route_cache.move_to_end(key)
+            self.hit_count += 1
+            return route
+
+        self.miss_count += 1
+        origin_index = int(self.network.get_intersection_index(origin))
+        destination_index = int(self.network.get_intersection_index(destination))
+        if self.next_lane_index is not None : 
+            route = self.trace_route(origin_index, destination_index)
+        else : 
+            route = self.search_route(origin_index, destination_index)
+
+        self.route_cache[key] = route
+        if len(self.route_cache) > self.cache_size : 
+            self.route_cache.popitem(last=False)
+        return route
+
+
+    # vehicleのinit_dataから経路を求める
+    # lane_numberがあればそのlaneから、なければoriginのintersectionからdestinationまで
+    def find_vehicle_route(self, init_data : dict[str, any]) -> list[int] : 
+        if "lane_number" in init_data : 
+            return self.find_route_from_lane(init_data["lane_number"], init_data["destination"])
+        else : 
+            return self.find_route(init_data["origin"], init_data["destination"])
+
+
+    # laneから出発してdestinationまで行く経路（最初のlaneを含む）
+    def find_route_from_lane(self, lane_number : int, destination : int) -> list[int] : 
+        to_intersection_number = int(self.network.lane_to[self.network.get_lane_index(lane_number)])
+        route = self.find_route(to_intersection_number, destination)
+        if route == None : 
+            return None
+        return [lane_number] + route
+
+
+    # Dijkstra（use_astarならA*）で探索する
+    def search_route(self, origin_index : int, destination_index : int) -> list[int] : 
+        out_offset, out_lane_index, lane_to_index, lane_length = self.out_offset, self.out_lane_index, self.lane_to_index, self.lane_length
+        intersection_y, intersection_x = self.intersection_y, self.intersection_x
+        destination_y, destination_x = intersection_y[destination_index], intersection_x[destination_index]
+        use_astar = self.use_astar
+
+        distance_dict = {origin_index : 0.0}
+        prev_lane_dict = {}   # intersection -> そこに入ったlane
+        heap = [(0.0, 0.0, origin_index)]   # (距離 + 下限, 距離, intersection)
+        while len(heap) > 0 : 
+            _, distance, index = heapq.heappop(heap)
+            if index == destination_index : 
+                break
+            if distance > distance_dict[index] : 
+                continue
+            for pos in range(out_offset[index], out_offset[index + 1]) : 
+                lane_index = out_lane_index[pos]
+                next_index = lane_to_index[lane_index]
+                next_distance = distance + lane_length[lane_index]
+                if next_distance < distance_dict.get(next_index, math.inf) : 
+                    distance_dict[next_index] = next_distance
+                    prev_lane_dict[next_index] = lane_index
+                    estimate = next_distance
+                    if use_astar : 
+                        estimate += math.hypot(intersection_y[next_index] - destination_y, intersection_x[next_index] - destination_x)
+                    heapq.heappush(heap, (estimate, next_distance, next_index))
+
+        if destination_index not in distance_dict : 
+            return None
+
+        # 到着点から逆にたどる
+        route = []
+        index = destination_index
+        while index != origin_index : 
+            lane_index = prev_lane_dict[index]
+            route.append(self.lane_number[lane_index])
+            index = self.lane_from_index[lane_index]
+        route.reverse()
+        return route
+
+
+    # 全てのoriginからDijkstraを行い、[origin, destination] -> 最初のlaneの表を作る
+    # 表はintersectionの数の2乗の大きさなので、小さな道路網だけで使う
+    def precompute_all_pairs(self) -> None : 
+        size = self.network.get_intersection_size()
+        next_lane_index = np.full((size, size), -1, dtype=np.int32)
+        for origin_index in range(size) : 
+            # originからの最短路木を作り、各頂点について最初のlaneを記録する
+            distance_list = [math.inf] * size
+            distance_list[origin_index] = 0.0
+            first_lane_list = [-1] * size
+            heap = [(0.0, origin_index)]
+            while len(heap) > 0 : 
+                distance, index = heapq.heappop(heap)
+                if distance > distance_list[index] : 
+                    continue
+                for pos in range(self.out_offset[index], self.out_offset[index + 1]) : 
+                    lane_index = self.out_lane_index[pos]
+                    next_index = self.lane_to_index[lane_index]
+                    next_distance = distance + self.lane_length[lane_index]
+                    if next_distance < distance_list[next_index] : 
+                        distance_list[next_index] = next_distance
+                        first_lane_list[next_index] = lane_index if index == origin_index else first_lane_list[index]
+                        heapq.heappush(heap, (next_distance, next_index))
+            next_lane_index[origin_index] = first_lane_list
+        self.next_lane_index = next_lane_index
+
+
+    # precompute_all_pairsの表から経路をたどる
+    def trace_route(self, origin_index : int, destination_index : int) -> list[int] : 
+        route = []
+        index = origin_index
+        while index != destination_index : 
+            lane_index = int(self.next_lane_index[index, destination_index])
+            if lane_index == -1 : 
+                return None
+            route.append(self.lane_number[lane_index])
+            index = self.lane_to_index[lane_index]
+        return route
+
+
+    # 経路の各laneの始点までの累積距離（最後の要素は経路の全長）
+    # 経路を決めたときに車が持つ（Vehicle::route_distance_list）ので、ここではキャッシュしない
+    def get_route_distance_list(self, route_list : list[int]) -> list[float] : 
+        route_distance_list = [0]
+        for lane_length in self.network.lane_length[self.network.get_lane_index(route_list)].tolist() : 
+            route_distance_list.append(route_distance_list[-1] + lane_length)
+        return route_distance_list
@@ -0,0 +1,275 @@
+import random
+from pathlib import Path
+
+from network import load_network
+
+
+# init_data["scenario"]で道路網と車の配置を選ぶ
+# single   : main.pyの元々の設定（1レーンに2台）
+# corridor : 一直線に並んだレーンに100台
+# grid     : 全ての交差点に信号がある格子状の道路網に1000台
+# grid_od  : gridと同じ道路網・出発位置で、経路は到着する交差点（OD）からRouterで求める
+CORRIDOR_LANE_SIZE = 40
+CORRIDOR_VEHICLE_SIZE = 100
+GRID_SIZE = 16   # 一辺の交差点の数
+GRID_DISTANCE = 200   # 交差点の間隔[m]
+GRID_VEHICLE_SIZE = 1000
+DQN_VEHICLE_INTERVAL = 10   # corridor, gridでは何台に1台をDQNで動かすか
+
+
+# 道路網（signal, intersection, lane）の初期値をinit_dataに設定する
+# init_data["network_path"]があれば道路網はファイル（network.pyの形式）から読み込む
+def set_network(init_data : dict[str, any]) -> None : 
+    if init_data.get("network_path") != None : 
+        init_data["network"] = load_network(init_data["network_path"])
+        return
+
+    scenario = init_data.get("scenario", "single")
+    if scenario == "single" : 
+        set_single_network(init_data)
+    elif scenario == "corridor" : 
+        set_corridor_network(init_data)
+    elif scenario == "grid" or scenario == "grid_od" : 
+        set_grid_network(init_data)
+    else : 
+        assert False, "unknown scenario : " + str(scenario)
+
+
+# エピソード毎に変わるvehicleの初期値とエピソードの情報をinit_dataに設定する
+def set_episode(init_data : dict[str, any], pos_episode : int) -> None : 
+    episode_dir : Path = init_data["episode_dir"]
+    init_data["pos_episode"] = pos_episode
+    init_data["episode_path"] = episode_dir.joinpath("episode_" + str(pos_episode).zfill(4))
+
+    scenario = init_data.get("scenario", "single")
+    if scenario == "single" : 
+        set_single_vehicle(init_data)
+    elif scenario == "corridor" : 
+        set_corridor_vehicle(init_data)
+    elif scenario == "grid" : 
+        set_grid_vehicle(init_data)
+    elif scenario == "grid_od" : 
+        set_grid_od_vehicle(init_data)
+    else : 
+        assert False, "unknown scenario : " + str(scenario)
+
+
+# route_listの代わりにdestination（到着する交差点）を渡すと、経路はRouterで求める
+def make_vehicle_init_data(init_data : dict[str, any], vehicle_number : int, decide_action_way : str, lane_number : int, 
+                           lane_place : float, route_list : list[int] = None, destination : int = None) -> dict[str, any] : 
+    vehicle_init_data = {
+        "number" : vehicle_number, 
+        "length" : 4.4, 
+        "decide_action_way" : decide_action_way, 
+        "velocity" : 2, 
+        "accel" : 0, 
+        "jerk" : 0, 
+        "lane_number" : lane_number, 
+        "lane_place" : lane_place, 
+        "jerk_cand" : init_data["jerk_cand"], 
+        "limit_velocity" : init_data["limit_velocity"], 
+        "limit_accel" : init_data["limit_accel"], 
+        "limit_brake" : init_data["limit_brake"], 
+        "idm_parameter" : init_data.get("idm_parameter")
+    }
+    if route_list != None : 
+        vehicle_init_data["route_list"] = route_list
+    else : 
+        vehicle_init_data["destination"] = destination
+    return vehicle_init_data
+
+
+def set_single_network(init_data : dict[str, any]) -> None : 
+    # signal
+    signal_init_data_list = []
+    init_data["signal_init_data_list"] = signal_init_data_list
+
+    # intersection
+    intersection_init_data_list = [
+        {
+            "number" : 0, 
+            "y" : 0, 
+            "x" : 0, 
+            "signal_number" : None
+        }, 
+        {
+            "number" : 1, 
+            "y" : 0, 
+            "x" : 400, 
+            "signal_number" : None
+        }
+    ]
+    init_data["intersection_init_data_list"] = intersection_init_data_list
+
+    # lane
+    lane_init_data_list = []
+    for lane_number in range(1) : 
+        lane_init_data = {
+            "number" : lane_number, 
+            "from_intersection_number" : 0, 
+            "to_intersection_number" : 1
+        }
+        lane_init_data_list.append(lane_init_data)
+    init_data["lane_init_data_list"] = lane_init_data_list
+
+
+def set_single_vehicle(init_data : dict[str, any]) -> None : 
+    vehicle_init_data_list = []
+    for vehicle_number in range(2) : 
+        vehicle_init_data = make_vehicle_init_data(
+            init_data, vehicle_number, "DQN" if vehicle_number == 0 else "IDM", 0, 
+            10 * vehicle_number,   # 適当
+            [0]
+        )
+        vehicle_init_data_list.append(vehicle_init_data)
+    init_data["vehicle_init_data_list"] = vehicle_init_data_list
+
+
+# 150m間隔の交差点をx軸上に並べ、隣り合う交差点をレーンで結ぶ（信号なし）
+def set_corridor_network(init_data : dict[str, any]) -> None : 
+    init_data["signal_init_data_list"] = []
+    init_data["intersection_init_data_list"] = [
+        {"number" : number, "y" : 0, "x" : 150 * number, "signal_number" : None} for number in range(CORRIDOR_LANE_SIZE + 1)
+    ]
+    init_data["lane_init_data_list"] = [
+        {"number" : number, "from_intersection_number" : number, "to_intersection_number" : number + 1}
+        for number in range(CORRIDOR_LANE_SIZE)
+    ]
+
+
+# 前半のレーンに等間隔に並べ、全ての車が最後のレーンまで走る
+def set_corridor_vehicle(init_data : dict[str, any]) -> None : 
+    start_lane_size = CORRIDOR_LANE_SIZE // 2
+    lane_vehicle_size = -(-CORRIDOR_VEHICLE_SIZE // start_lane_size)
+    vehicle_init_data_list = []
+    for vehicle_number in range(CORRIDOR_VEHICLE_SIZE) : 
+        lane_number = vehicle_number % start_lane_size
+        lane_place = 5 + (150 - 10) / lane_vehicle_size * (vehicle_number // start_lane_size)
+        vehicle_init_data_list.append(make_vehicle_init_data(
+            init_data, vehicle_number, "DQN" if vehicle_number % DQN_VEHICLE_INTERVAL == 0 else "IDM", 
+            lane_number, lane_place, list(range(lane_number, CORRIDOR_LANE_SIZE))
+        ))
+    init_data["vehicle_init_data_list"] = vehicle_init_data_list
+
+
+# 交差点(row, column)の番号
+def get_grid_intersection_number(row : int, column : int) -> int : 
+    return row * GRID_SIZE + column
+
+
+# (row, column)から東向き（columnが増える向き）のレーンの番号
+def get_grid_east_lane_number(row : int, column : int) -> int : 
+    return row * (GRID_SIZE - 1) + column
+
+
+# (row, column)から南向き（rowが増える向き）のレーンの番号
+def get_grid_south_lane_number(row : int, column : int) -> int : 
+    return GRID_SIZE * (GRID_SIZE - 1) + column * (GRID_SIZE - 1) + row
+
+
+# 格子状の交差点を東向き・南向きの一方通行のレーンで結ぶ
+# 全ての交差点に信号があり、位相を少しずつずらす
+def set_grid_network(init_data : dict[str, any]) -> None : 
+    interval_list = [20, 3, 15, 2]
+    signal_init_data_list = []
+    intersection_init_data_list = []
+    for row in range(GRID_SIZE) : 
+        for column in range(GRID_SIZE) : 
+            number = get_grid_intersection_number(row, column)
+            signal_init_data_list.append({
+                "number" : number, 
+                "first_time" : 5 * (row + column) % sum(interval_list), 
+                "interval_list" : interval_list
+            })
+            intersection_init_data_list.append({
+                "number" : number, 
+                "y" : GRID_DISTANCE * row, 
+                "x" : GRID_DISTANCE * column, 
+                "signal_number" : number
+            })
+    init_data["signal_init_data_list"] = signal_init_data_list
+    init_data["intersection_init_data_list"] = intersection_init_data_list
+
+    lane_init_data_list = []
+    for row in range(GRID_SIZE) : 
+        for column in range(GRID_SIZE - 1) : 
+            lane_init_data_list.append({
+                "number" : get_grid_east_lane_number(row, column), 
+                "from_intersection_number" : get_grid_intersection_number(row, column), 
+                "to_intersection_number" : get_grid_intersection_number(row, column + 1)
+            })
+    for column in range(GRID_SIZE) : 
+        for row in range(GRID_SIZE - 1) : 
+            lane_init_data_list.append({
+                "number" : get_grid_south_lane_number(row, column), 
+                "from_intersection_number" : get_grid_intersection_number(row, column), 
+                "to_intersection_number" : get_grid_intersection_number(row + 1, column)
+            })
+    init_data["lane_init_data_list"] = lane_init_data_list
+
+
+# 北西側半分のレーンから出発する
+# vehicle_number番目の車の出発するレーンの向き, row, columnとlane_placeのリストを返す
+def get_grid_start_list() -> list[tuple[str, int, int, float]] : 
+    half_size = GRID_SIZE // 2
+
+    # 出発するレーン（東向きはcolumn < half_size、南向きはrow < half_size）
+    lane_list = []
+    for row in range(GRID_SIZE) : 
+        for column in range(half_size) : 
+            lane_list.append(("east", row, column))
+    for column in range(GRID_SIZE) : 
+        for row in range(half_size) : 
+            lane_list.append(("south", row, column))
+    lane_vehicle_size = -(-GRID_VEHICLE_SIZE // len(lane_list))
+
+    start_list = []
+    for vehicle_number in range(GRID_VEHICLE_SIZE) : 
+        direction, row, column = lane_list[vehicle_number % len(lane_list)]
+        lane_place = 5 + (GRID_DISTANCE - 10) / lane_vehicle_size * (vehicle_number // len(lane_list))
+        start_list.append((direction, row, column, lane_place))
+    return start_list
+
+
+# 一度だけ曲がって南東側の端まで走る
+def set_grid_vehicle(init_data : dict[str, any]) -> None : 
+    half_size = GRID_SIZE // 2
+    vehicle_init_data_list = []
+    for vehicle_number, (direction, row, column, lane_place) in enumerate(get_grid_start_list()) : 
+        turn = half_size + vehicle_number % (GRID_SIZE - half_size)   # 曲がる交差点のcolumn（南向きならrow）
+        if direction == "east" : 
+            route_list = [get_grid_east_lane_number(row, pos_column) for pos_column in range(column, turn)]
+            route_list += [get_grid_south_lane_number(pos_row, turn) for pos_row in range(row, GRID_SIZE - 1)]
+        else : 
+            route_list = [get_grid_south_lane_number(pos_row, column) for pos_row in range(row, turn)]
+            route_list += [get_grid_east_lane_number(turn, pos_column) for pos_column in range(column, GRID_SIZE - 1)]
+
+        vehicle_init_data_list.append(make_vehicle_init_data(
+            init_data, vehicle_number, "DQN" if vehicle_number % DQN_VEHICLE_INTERVAL == 0 else "IDM", 
+            route_list[0], lane_place, route_list
+        ))
+    init_data["vehicle_init_data_list"] = vehicle_init_data_list
+
+
+# gridと同じ位置から出発し、エピソード毎にランダムに選んだ南端・東端の交差点まで最短経路で走る
+# 経路はvehicleを作るときにRouterで求める
+def set_grid_od_vehicle(init_data : dict[str, any]) -> None : 
+    rnd = random.Random(init_data["pos_episode"])   # エピソード毎に固定（シミュレーションの乱数には影響しない）
+    vehicle_init_data_list = []
+    for vehicle_number, (direction, row, column, lane_place) in enumerate(get_grid_start_list()) : 
+        if direction == "east" : 
+            lane_number = get_grid_east_lane_number(row, column)
+            column += 1
+        else : 
+            lane_number = get_grid_south_lane_number(row, column)
+            row += 1
+
+        # (row, column)から行ける南端・東端の交差点
+        destination_list = [get_grid_intersection_number(GRID_SIZE - 1, pos_column) for pos_column in range(column, GRID_SIZE)]
+        destination_list += [get_grid_intersection_number(pos_row, GRID_SIZE - 1) for pos_row in range(row, GRID_SIZE - 1)]
+
+        vehicle_init_data_list.append(make_vehicle_init_data(
+            init_data, vehicle_number, "DQN" if vehicle_number % DQN_VEHICLE_INTERVAL == 0 else "IDM", 
+            lane_number, lane_place, destination=rnd.choice(destination_list)
+        ))
+    init_data["vehicle_init_data_list"] = vehicle_init_data_list
@@ -5,7 +5,8 @@ if TYPE_CHECKING:
 
 from typing import Union
 from enum import Enum
-import math
+import math, bisect
+import numpy as np
 
 class Aspect(Enum) : 
     BLUE = 0 
@@ -37,28 +38,54 @@ class Signal :
 
         assert len(self.interval_list) == 4
 
-        self.update()   # 初期化しておく必要がある
-    
+        # 各表示が終わる位相[ms]を先に計算しておく
+        self.boundary_list = []
+        pos_sum = 0
+        for interval in self.interval_list : 
+            pos_sum += interval * 1000
+            self.boundary_list.append(pos_sum)
+
+        self.signal_array : SignalArray = None   # 全信号をまとめて計算する場合
+        self.array_index = None   # signal_array上の位置
+        self.state_step = None   # signal_aspectなどを計算した時のstep
+        # 表示は毎ステップ更新せず、get_signal_stateで問い合わせがあったときに計算する
+
+
+    # エピソードの開始時に計算済みの表示を捨てる
+    def reset(self) -> None : 
+        self.state_step = None
+        if self.signal_array != None : 
+            self.signal_array.state_step = None
+
 
-    def update(self) : 
+    # 表示を計算する時刻のstep
+    # 元々updateはstep_countを増やす前に呼ばれていたので、一つ前のstepの表示を使う
+    def get_signal_step(self) -> int : 
+        return max(self.simulator.step_count - 1, 0)
+
+
+    def calculate(self, step : int) -> None : 
         # 剰余の計算が入るため、秒からミリ秒に変えて計算する
-        pos_time = self.simulator.get_second()   # s
+        pos_time = self.simulator.delta_t * step   # s
         amari = int((self.first_time + pos_time) * 1000) % int(self.cycle * 1000) 
 
         self.signal_cos = math.cos(amari / self.cycle)
         self.signal_sin = math.sin(amari / self.cycle)
 
-        pos_sum = 0
-        for index in range(len(self.interval_list)) : 
-            pos_sum += self.interval_list[index] * 1000
-            if pos_sum > amari : 
-                self.signal_aspect : Aspect = convert_index_into_aspect(index)
-                self.remain_time = (pos_sum - amari) / 1000   # msに戻す
-                self.remain_time = round(self.remain_time, 3)   # 表示を綺麗にするため
-                return 
+        index = bisect.bisect_right(self.boundary_list, amari)
+        self.signal_aspect : Aspect = convert_index_into_aspect(index)
+        self.remain_time = (self.boundary_list[index] - amari) / 1000   # msに戻す
+        self.remain_time = round(self.remain_time, 3)   # 表示を綺麗にするため
+        self.state_step = step
             
 
     def get_signal_state(self) -> dict[str, Union(Aspect, float)] : 
+        if self.signal_array != None : 
+            return self.signal_array.get_signal_state(self)
+        
+        step = self.get_signal_step()
+        if self.state_step != step : 
+            self.calculate(step)
         return {
             "aspect" : self.signal_aspect, 
             "remain_time" : self.remain_time, 
@@ -66,8 +93,46 @@ class Signal :
             "signal_sin" : self.signal_sin
         }
 
-        
 
+# 全ての信号の表示を配列で一度に計算する
+# あるstepで最初に問い合わせがあったときに、全信号分をまとめて計算する
+class SignalArray : 
+    def __init__(self, signal_list : list[Signal], simulator : Simulator) -> None:
+        self.simulator = simulator
+        self.first_time = np.array([signal.first_time for signal in signal_list], dtype=np.float64)
+        self.cycle = np.array([signal.cycle for signal in signal_list], dtype=np.int64)
+        self.boundary = np.array([signal.boundary_list for signal in signal_list], dtype=np.int64)
+
+        for index, signal in enumerate(signal_list) : 
+            signal.signal_array = self
+            signal.array_index = index
+
+        self.state_step = None
+
+
+    def calculate(self, step : int) -> None : 
+        pos_time = self.simulator.delta_t * step   # s
+        amari = ((self.first_time + pos_time) * 1000).astype(np.int64) % (self.cycle * 1000)
 
+        self.signal_cos = np.cos(amari / self.cycle).tolist()
+        self.signal_sin = np.sin(amari / self.cycle).tolist()
 
+        aspect_index = (self.boundary <= amari[:, None]).sum(axis=1)
+        remain_time = (self.boundary[np.arange(len(amari)), aspect_index] - amari) / 1000
+        self.aspect_index = aspect_index.tolist()
+        self.remain_time = np.round(remain_time, 3).tolist()
+        self.state_step = step
 
+
+    def get_signal_state(self, signal : Signal) -> dict[str, Union(Aspect, float)] : 
+        step = signal.get_signal_step()
+        if self.state_step != step : 
+            self.calculate(step)
+
+        index = signal.array_index
+        return {
+            "aspect" : convert_index_into_aspect(self.aspect_index[index]), 
+            "remain_time" : self.remain_time[index], 
+            "signal_cos" : self.signal_cos[index], 
+            "signal_sin" : self.signal_sin[index]
+        }
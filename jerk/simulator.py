@@ -4,10 +4,18 @@ import math
 
 from logger import EpisodeLogger, TotalLogger
 from vehicle import Vehicle
-from signals import Signal, Aspect
+from IDM import IDMController
+from signals import Signal, SignalArray, Aspect
 from intersection import Intersection
 from lane import Lane
 from DQN.DQN import DQN
+from vehicle_engine import VehicleEngine
+from leader import LeaderFinder
+from profiler import Profiler, merge_profile
+from spawner import VehicleSpawner
+from geometry import GeometryIndex, DEFAULT_CELL_SIZE, get_geometry_index
+from network import RoadNetwork, LazyObjectDict, make_network
+from routing import Router, DEFAULT_ROUTE_CACHE_SIZE
 from util import calculate_euclidean_distance
 
 
@@ -17,98 +25,242 @@ BASIC_DISTANCE = 150
 class Simulator : 
     def __init__(self, init_data : dict[str, any], total_logger : TotalLogger, dqn : DQN) : 
         self.delta_t = init_data["delta_t"]
+        self.idm_controller = IDMController(self.delta_t)   # IDMの車の行動をまとめて決める
+
+        # 道路網（World::__init__で作っていなければinit_dataのリストから作る）
+        self.network : RoadNetwork = init_data.get("network")
+        if self.network == None : 
+            self.network = make_network(init_data)
+        network = self.network
+
+        # signalを初期化
+        signal_init_data_list : list[dict[str, any]] = network.signal_init_data_list
+        self.signal_dict : dict[int, Signal] = {
+            signal_init_data["number"] : Signal(signal_init_data, self) for signal_init_data in signal_init_data_list
+        }
+
+        # intersectionを初期化（参照されたときに作る）
+        self.intersection_dict : LazyObjectDict = LazyObjectDict(
+            network.intersection_number, lambda number : Intersection(network.get_intersection_init_data(number), self)
+        )
+
+        # intersectionの座標とlaneの線分の空間ハッシュ（最初に使うときに作り、同じ道路網のSimulatorで共有する）
+        self.geometry_cell_size = init_data.get("geometry_cell_size", DEFAULT_CELL_SIZE)
+
+        # 最短経路の探索（ODから経路を求めるvehicleのため）
+        self.router = Router(network, init_data.get("route_cache_size", DEFAULT_ROUTE_CACHE_SIZE))
+        if init_data.get("route_all_pairs", False) : 
+            self.router.precompute_all_pairs()
+
+        # 先のレーンの前の車を探すためのキャッシュ
+        self.leader_finder = LeaderFinder(self)
+
+        # laneを初期化（参照されたときに作るので、車が通らないlaneのオブジェクトは作られない）
+        self.lane_dict : LazyObjectDict = LazyObjectDict(
+            network.lane_number, lambda number : Lane(network.get_lane_init_data(number), self)
+        )
+
+        # vehicleの速度・位置の更新を配列でまとめて行う場合
+        # VecSimulatorと共有する場合はinit_data["vehicle_engine"]で渡される（updateはVecSimulatorが行う）
+        self.vehicle_engine : VehicleEngine = init_data.get("vehicle_engine")
+        self.signal_array = None
+        if self.vehicle_engine == None and init_data.get("vectorize", False) : 
+            self.vehicle_engine = VehicleEngine(self.delta_t, len(init_data["vehicle_init_data_list"]))
+            
+            # 信号の表示もまとめて計算する
+            if len(self.signal_dict) > 0 : 
+                self.signal_array = SignalArray(list(self.signal_dict.values()), self)
+
+        # 設定
+        self.limit_velocity = init_data["limit_velocity"]
+        self.limit_accel = init_data["limit_accel"]
+        self.limit_brake = init_data["limit_brake"]
+        self.limit_step_count = init_data["limit_step_count"]
+
+        self.total_logger = total_logger
+        self.dqn = dqn
+
+        # 各処理の時間の計測（エピソード毎にtotal_loggerに登録する）
+        self.profiler = Profiler(init_data.get("profile", False))
+
+        # エピソード途中の車の流入・取り除き
+        self.spawner = VehicleSpawner(self)
+
+        self.vehicle_dict : dict[int, Vehicle] = {}
+        self.reset(init_data)
+
+
+    # エピソード毎に変わる状態（vehicle, signalの表示, logger）だけを初期化する
+    # signal, intersection, laneの道路網はそのまま使う
+    def reset(self, init_data : dict[str, any]) -> None : 
         self.pos_episode = init_data["pos_episode"]
         self.step_count = 0 
         
         self.simulation_end_flag = False
 
+        # 前のエピソードの車を取り除く（オブジェクトはpoolに入れて使い回す）
+        self.clear_vehicle()
+        for lane in self.lane_dict.get_created_list() : 
+            lane.clear()
+        self.leader_finder.clear()
+
         # loggerを初期化
         self.episode_logger = EpisodeLogger({
             "log_interval" : init_data["log_interval"], 
             "episode_path" : init_data["episode_path"], 
-            "pos_episode" : init_data["pos_episode"]
+            "pos_episode" : init_data["pos_episode"], 
+            "log_flush_size" : init_data.get("log_flush_size", 1000), 
+            "log_csv" : init_data.get("log_csv", True), 
+            "writer" : self.total_logger.writer
         })
 
+        # signalの表示を初期化
+        for signal in self.signal_dict.values() : 
+            signal.reset()
+
         # vehicleを初期化
         vehicle_init_data_list : list[dict[str, any]] = init_data["vehicle_init_data_list"]
-        self.vehicle_dict : dict[int, Vehicle] = {
-            vehicle_init_data["number"] : Vehicle(vehicle_init_data, self) for vehicle_init_data in vehicle_init_data_list
-        }
+        for vehicle_init_data in vehicle_init_data_list : 
+            self.add_vehicle(vehicle_init_data)
 
-        # signalを初期化
-        signal_init_data_list : list[dict[str, any]] = init_data["signal_init_data_list"]
-        self.signal_dict : dict[int, Signal] = {
-            signal_init_data["number"] : Signal(signal_init_data, self) for signal_init_data in signal_init_data_list
-        }
+        # 流入の設定
+        self.spawner.reset(init_data)
 
-        # intersectionを初期化
-        intersection_init_data_list : list[dict[str, any]] = init_data["intersection_init_data_list"]
-        self.intersection_dict : dict[int, Intersection] = {
-            intersection_init_data["number"] : Intersection(intersection_init_data, self) for intersection_init_data in intersection_init_data_list
-        }
 
-        # laneを初期化
-        lane_init_data_list : list[dict[str, any]] = init_data["lane_init_data_list"]
-        self.lane_dict : dict[int, Lane] = {
-            lane_init_data["number"] : Lane(lane_init_data, self) for lane_init_data in lane_init_data_list
-        }
-        for lane in self.lane_dict.values() : 
-            lane.update(self.vehicle_dict)
+    # vehicleを作って（poolにあれば使い回して）レーンとvehicle_engineに登録する
+    def add_vehicle(self, vehicle_init_data : dict[str, any]) -> Vehicle : 
+        vehicle = self.spawner.get_vehicle(vehicle_init_data)
+        self.vehicle_dict[vehicle.number] = vehicle
+        if vehicle.is_goal == False : 
+            self.lane_dict[vehicle.lane_number].enter(vehicle)
+        if self.vehicle_engine != None : 
+            self.vehicle_engine.add(vehicle)
+        return vehicle
 
-        # 設定
-        self.limit_velocity = init_data["limit_velocity"]
-        self.limit_accel = init_data["limit_accel"]
-        self.limit_brake = init_data["limit_brake"]
-        self.limit_step_count = init_data["limit_step_count"]
 
-        self.total_logger = total_logger
-        self.dqn = dqn
+    # vehicleをvehicle_dictとvehicle_engineから取り除いてpoolに戻す
+    # レーンからは取り除かないので、ゴールした車かエピソードの終了後に使う
+    def remove_vehicle(self, vehicle : Vehicle) -> None : 
+        if vehicle.engine_slot != None : 
+            self.vehicle_engine.remove(vehicle)
+        self.leader_finder.forget(vehicle.number)
+        self.episode_logger.flush_vehicle(vehicle.number)
+        del self.vehicle_dict[vehicle.number]
+        self.spawner.release(vehicle)
+
+
+    def clear_vehicle(self) -> None : 
+        for vehicle in list(self.vehicle_dict.values()) : 
+            self.remove_vehicle(vehicle)
 
 
     def start(self) -> None : 
         while self.simulation_end_flag == False : 
             self.increment() 
         self.episode_logger.write_log()
+        self.register_profile()
 
 
     def increment(self) -> None : 
+        self.profiler.start()
+
         # 各vehicleが時刻tの状況を認識（内部の状態は変化しない）
-        for vehicle in self.vehicle_dict.values() : 
-            vehicle.recognize() 
+        self.recognize()
+        self.profiler.lap("recognize")
 
         # 各vehicleが意思決定（更新はまだしない）
-        for vehicle in self.vehicle_dict.values() : 
-            vehicle.decide_action() 
+        self.decide_action()
+        self.profiler.lap("decide_action")
 
         # 各vehicleの状態を更新する
+        self.update_vehicle()
+        self.profiler.lap("update_vehicle")
+
+        # 信号・レーンを更新し、時刻t+1の状況から経験を格納する
+        self.update_environment()
+
+        # NNを更新
+        self.profiler.start()
+        self.dqn.optimize()
+        self.profiler.lap("optimize")
+
+
+    # このエピソードの計測結果をtotal_loggerに登録する
+    def register_profile(self, profile_list : list[dict[str, dict[str, float]]] = None) -> None : 
+        if self.profiler.enabled : 
+            profile = merge_profile([self.profiler.pop(), self.dqn.profiler.pop()] + (profile_list or []))
+            self.total_logger.register_profile(self.pos_episode, profile)
+
+
+    def recognize(self) -> None : 
         for vehicle in self.vehicle_dict.values() : 
-            vehicle.update() 
+            vehicle.recognize() 
+
+
+    def decide_action(self) -> None : 
+        dqn_vehicle_list = self.decide_action_without_dqn()
+        decide_action_by_dqn(self.dqn, dqn_vehicle_list)
+
+
+    # DQN以外の車の行動を決め、DQNの車のリストを返す
+    # IDMの車はまとめて配列で計算する（Vehicle::decide_actionと同じ値になる）
+    def decide_action_without_dqn(self) -> list[Vehicle] : 
+        dqn_vehicle_list : list[Vehicle] = []
+        idm_vehicle_list : list[Vehicle] = []
+        for vehicle in self.vehicle_dict.values() : 
+            if vehicle.decide_action_way == "DQN" : 
+                dqn_vehicle_list.append(vehicle)
+            elif vehicle.decide_action_way == "IDM" : 
+                idm_vehicle_list.append(vehicle)
+            else : 
+                vehicle.decide_action()
+        if len(idm_vehicle_list) > 0 : 
+            for vehicle, jerk in zip(idm_vehicle_list, self.idm_controller.get_jerk_list(idm_vehicle_list)) : 
+                vehicle.jerk = jerk
+        return dqn_vehicle_list
+
+
+    def update_vehicle(self) -> None : 
+        if self.vehicle_engine == None : 
+            for vehicle in self.vehicle_dict.values() : 
+                vehicle.update() 
+        else : 
+            self.vehicle_engine.update()
 
-        # 各信号の状態を更新する
-        for signal in self.signal_dict.values() : 
-            signal.update()
 
-        # 各laneの状態を更新する
-        for lane in self.lane_dict.values() : 
-            lane.update(self.vehicle_dict)
+    def update_environment(self) -> None : 
+        self.profiler.start()
+
+        # 各信号の表示はSignal::get_signal_stateで問い合わせがあったときに計算される
+
+        # 各laneの状態を更新する（レーン間の移動はVehicle::move_next_laneで登録済み）
+        for lane in self.lane_dict.get_created_list() : 
+            lane.update()
+        self.profiler.lap("update_lane")
 
         # ステップ数を更新
         # 以降の処理では時刻がずれていることに注意する
         self.step_count += 1
 
         # 各vehicleが時刻t+1の状況を認識
-        for vehicle in self.vehicle_dict.values() : 
-            vehicle.recognize() 
+        self.recognize()
+        self.profiler.lap("recognize_next")
 
         # シミュレーションを終了するかの判断
         self.judge_simulation_end()
+        self.profiler.lap("judge_simulation_end")
 
         # 各vehicleが経験を格納
         for vehicle in self.vehicle_dict.values() : 
             vehicle.push_experience()
+        self.profiler.lap("push_experience")
 
-        # NNを更新
-        self.dqn.optimize()
+        # 流入がある場合は、ゴールした車を取り除き、新しい車を入れる
+        # 入った車は次のステップの最初に認識する（最初からいる車と同じ）
+        if self.spawner.is_active() and self.simulation_end_flag == False : 
+            self.spawner.despawn()
+            self.spawner.spawn()
+            self.profiler.lap("spawn")
 
 
     def judge_simulation_end(self) -> None : 
@@ -119,18 +271,21 @@ class Simulator :
             reason = "time over"
 
         # 一つの車がゴールしたら終了
+        # 全ての車がゴールしたら終了
+        # （流入がある場合、ゴールした車は取り除くだけで終了しない）
         one_vehicle_goal = False 
-        for vehicle in self.vehicle_dict.values() : 
-            one_vehicle_goal = one_vehicle_goal or vehicle.is_goal
-        if one_vehicle_goal : 
-            reason = "one vehicle goal"
+        all_vehicle_goal = False
+        if self.spawner.is_active() == False : 
+            for vehicle in self.vehicle_dict.values() : 
+                one_vehicle_goal = one_vehicle_goal or vehicle.is_goal
+            if one_vehicle_goal : 
+                reason = "one vehicle goal"
 
-        # 全ての車がゴールしたら終了
-        all_vehicle_goal = True
-        for vehicle in self.vehicle_dict.values() : 
-            all_vehicle_goal = all_vehicle_goal and vehicle.is_goal
-        if all_vehicle_goal : 
-            reason = "all vehicle goal"
+            all_vehicle_goal = True
+            for vehicle in self.vehicle_dict.values() : 
+                all_vehicle_goal = all_vehicle_goal and vehicle.is_goal
+            if all_vehicle_goal : 
+                reason = "all vehicle goal"
 
         # 衝突している車があったら終了
         collision = False 
@@ -147,21 +302,42 @@ class Simulator :
         if self.simulation_end_flag : 
             print(reason)
             for vehicle in self.vehicle_dict.values() : 
-                vehicle.is_goal = True
+                vehicle.set_goal()
 
 
     def get_lane_length(self, lane_index) -> int : 
         return self.lane_dict[lane_index].length
     
 
+    def get_geometry(self) -> GeometryIndex : 
+        return get_geometry_index(self.network, self.geometry_cell_size)
+
+
     def get_second(self) -> float : 
         return self.delta_t * self.step_count
     
 
-    def get_intersection_distance(self, inter_number_1, inter_number_2) -> int : 
-        place_1 = self.intersection_dict[inter_number_1].get_place()
-        place_2 = self.intersection_dict[inter_number_2].get_place()
-        return calculate_euclidean_distance(place_1, place_2)
+    def get_intersection_distance(self, inter_number_1, inter_number_2) -> float : 
+        return self.get_geometry().get_intersection_distance(inter_number_1, inter_number_2)
+
+
+    # vehicleの座標 (y, x)
+    def get_vehicle_place(self, vehicle : Vehicle) -> tuple[float, float] : 
+        return self.get_geometry().get_lane_place(vehicle.lane_number, vehicle.lane_place)
+
+
+    # placeから半径radius以内にいる（ゴールしていない）vehicleのリスト
+    def get_vehicle_list_in_radius(self, place : tuple[float, float], radius : float) -> list[Vehicle] : 
+        vehicle_list = []
+        for lane_number in self.get_geometry().find_lane_list_in_radius(place, radius) : 
+            lane : Lane = self.lane_dict.get_created(lane_number)
+            if lane == None :   # 作られていないlaneには車がいない
+                continue
+            for vehicle_number in lane.get_vehicle_number_list() : 
+                vehicle = self.vehicle_dict[vehicle_number]
+                if calculate_euclidean_distance(place, self.get_vehicle_place(vehicle)) <= radius : 
+                    vehicle_list.append(vehicle)
+        return vehicle_list
     
     
     def get_front_vehicle_info(self, vehicle : Vehicle) -> dict[str, any] : 
@@ -180,15 +356,9 @@ class Simulator :
             front_vehicle_distance = self.vehicle_dict[vehicle.number].get_distance_next_intersection() - \
                                         self.vehicle_dict[front_vehicle_number].get_distance_next_intersection()
         else : 
-            front_vehicle_distance = vehicle.get_distance_next_intersection()
-            futere_route_list = vehicle.get_future_route_list()
-            for lane_number in futere_route_list : 
-                front_vehicle_number = self.lane_dict[lane_number].get_back_vehicle_number()
-                if front_vehicle_number != None : 
-                    front_vehicle_distance += self.vehicle_dict[front_vehicle_number].get_distance_prev_intersection()
-                    break
-                else : 
-                    front_vehicle_distance += self.lane_dict[lane_number].length
+            front_vehicle, front_vehicle_distance = self.leader_finder.find_leader(vehicle)
+            if front_vehicle != None : 
+                front_vehicle_number = front_vehicle.number
         
         if front_vehicle_number == None : 
             return None
@@ -293,3 +463,14 @@ class Simulator :
         r = math.log(x) - mu
         return (1.0 / (x * math.sqrt(2.0 * math.pi * sigma_2))) * math.exp(-0.5 * (r * r) / sigma_2)
 
+
+# DQNの車の行動をまとめて一度のforwardで決める（複数のSimulatorの車が混ざっていてもよい）
+def decide_action_by_dqn(dqn : DQN, dqn_vehicle_list : list[Vehicle]) -> None : 
+    if len(dqn_vehicle_list) == 0 : 
+        return
+    
+    state_matrix = [dqn.get_state_row(vehicle.state) for vehicle in dqn_vehicle_list]
+    pos_episode_list = [vehicle.simulator.pos_episode for vehicle in dqn_vehicle_list]
+    action_list = dqn.decide_action_batch(state_matrix, pos_episode_list)
+    for vehicle, action in zip(dqn_vehicle_list, action_list) : 
+        vehicle.set_action(action)
@@ -0,0 +1,123 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from .simulator import Simulator
+
+from vehicle import Vehicle
+from vehicle_engine import EngineVehicle
+
+
+DEFAULT_MIN_GAP = 10   # 流入するレーンの最後尾の車との最小の間隔[m]
+MAX_QUEUE = 10   # レーンに入れずに待っている車の最大数
+
+
+# init_data["inflow_init_data_list"]に従ってエピソードの途中で車を流入させ、ゴールした車を取り除く
+# inflow_init_data : {
+#     "lane_number" : 流入するレーン, "rate" : 1秒あたりの台数, 
+#     "route_list" : 経路 または "destination" : 到着する交差点, 
+#     （省略可）"decide_action_way", "length", "velocity", "min_gap", "idm_parameter"
+# }
+# 取り除いたVehicleのオブジェクトはpoolに入れ、次に作る車に使い回す
+class VehicleSpawner : 
+    def __init__(self, simulator : Simulator) -> None:
+        self.simulator = simulator
+        self.pool : list[Vehicle] = []
+
+        self.inflow_list : list[dict[str, any]] = []
+        self.queue_list : list[float] = []   # 流入を待っている台数（小数部分は次のステップに持ち越す）
+        self.in_lane_list : list[list[int]] = []   # 各流入元のレーンに入ってくるレーンの番号のリスト
+        self.vehicle_init_data : dict[str, any] = {}   # 流入する車の共通の設定
+        self.next_vehicle_number = 0
+        self.spawn_count = 0
+        self.despawn_count = 0
+
+
+    # エピソードの開始時（最初からいる車を登録した後）に呼ぶ
+    def reset(self, init_data : dict[str, any]) -> None : 
+        self.inflow_list = init_data.get("inflow_init_data_list", [])
+        self.queue_list = [0.0] * len(self.inflow_list)
+        network = self.simulator.network
+        self.in_lane_list = []
+        for inflow in self.inflow_list : 
+            from_intersection_number = network.lane_from[network.get_lane_index(inflow["lane_number"])]
+            self.in_lane_list.append(network.lane_number[network.lane_to == from_intersection_number].tolist())
+        self.vehicle_init_data = {
+            "length" : 4.4, 
+            "decide_action_way" : "IDM", 
+            "velocity" : 0, 
+            "accel" : 0, 
+            "jerk" : 0, 
+            "lane_place" : 0, 
+            "jerk_cand" : init_data["jerk_cand"], 
+            "limit_velocity" : init_data["limit_velocity"], 
+            "limit_accel" : init_data["limit_accel"], 
+            "limit_brake" : init_data["limit_brake"], 
+            "idm_parameter" : init_data.get("idm_parameter")
+        }
+        self.next_vehicle_number = max(self.simulator.vehicle_dict.keys(), default=-1) + 1
+        self.spawn_count = 0
+        self.despawn_count = 0
+
+
+    # 流入がある場合は、ゴールした車を取り除き、エピソードは車のゴールでは終わらない
+    def is_active(self) -> bool : 
+        return len(self.inflow_list) > 0
+
+
+    # poolにあれば使い回し、なければ新しく作る
+    def get_vehicle(self, init_data : dict[str, any]) -> Vehicle : 
+        if len(self.pool) > 0 : 
+            vehicle = self.pool.pop()
+            vehicle.reset(init_data)
+            return vehicle
+        if self.simulator.vehicle_engine != None : 
+            return EngineVehicle(init_data, self.simulator)
+        return Vehicle(init_data, self.simulator)
+
+
+    def release(self, vehicle : Vehicle) -> None : 
+        self.pool.append(vehicle)
+
+
+    # ゴールした車を取り除く
+    def despawn(self) -> None : 
+        goal_vehicle_list = [vehicle for vehicle in self.simulator.vehicle_dict.values() if vehicle.is_goal]
+        for vehicle in goal_vehicle_list : 
+            self.simulator.remove_vehicle(vehicle)
+        self.despawn_count += len(goal_vehicle_list)
+
+
+    # 各流入元で、待っている車をレーンの入り口が空いていれば入れる
+    def spawn(self) -> None : 
+        delta_t = self.simulator.delta_t
+        for index, inflow in enumerate(self.inflow_list) : 
+            queue = min(self.queue_list[index] + inflow["rate"] * delta_t, MAX_QUEUE)
+            if queue >= 1 and self.can_enter(inflow, self.in_lane_list[index]) : 
+                self.simulator.add_vehicle(self.make_vehicle_init_data(inflow))
+                self.spawn_count += 1
+                queue -= 1
+            self.queue_list[index] = queue
+
+
+    # 最後尾の車がレーンの入り口から十分に離れていて、入ってくるレーンの先頭の車も出口から十分に離れているか
+    def can_enter(self, inflow : dict[str, any], in_lane_list : list[int]) -> bool : 
+        min_gap = inflow.get("min_gap", DEFAULT_MIN_GAP)
+        tail = self.simulator.lane_dict[inflow["lane_number"]].tail
+        if tail != None and tail.lane_place - tail.length < min_gap : 
+            return False
+        for lane_number in in_lane_list : 
+            lane = self.simulator.lane_dict.get_created(lane_number)
+            if lane != None and lane.head != None and lane.length - lane.head.lane_place < min_gap + inflow.get("length", self.vehicle_init_data["length"]) : 
+                return False
+        return True
+
+
+    def make_vehicle_init_data(self, inflow : dict[str, any]) -> dict[str, any] : 
+        vehicle_init_data = dict(self.vehicle_init_data)
+        for key in ["length", "decide_action_way", "velocity", "route_list", "destination", "idm_parameter"] : 
+            if key in inflow : 
+                vehicle_init_data[key] = inflow[key]
+        vehicle_init_data["number"] = self.next_vehicle_number
+        vehicle_init_data["lane_number"] = inflow["lane_number"]
+        self.next_vehicle_number += 1
+        return vehicle_init_data
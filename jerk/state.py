@@ -0,0 +1,19 @@
+# Vehicle::recognizeで得られる状態
+# dictの代わりに__slots__で属性を固定し、state["velocity"]のような参照もできるようにする
+class State : 
+    __slots__ = (
+        # 自身の状態
+        "accel", "velocity", "over_velocity", "over_accel", "over_brake", "distance_intersection", 
+        "is_stop", "is_goal", "ignore_signal", 
+        # 前の車の情報
+        "exist_front_vehicle", "front_vehicle_distance", "front_vehicle_velocity", "front_vehicle_accel", 
+        "is_collision", "proper_front_vehicle_distance", 
+        # 信号情報
+        "aspect", "BLUE", "YELLOW_TO_RED", "RED", "YELLOW_TO_BLUE", "remain_time", "signal_cos", "signal_sin"
+    )
+
+    def __getitem__(self, key : str) -> any : 
+        return getattr(self, key)
+
+    def __setitem__(self, key : str, value : any) -> None : 
+        setattr(self, key, value)
@@ -1,3 +1,5 @@
+import math
+
 
 def exit_failure(alert_sentence : str) -> None : 
     margin_size = 5
@@ -12,11 +14,13 @@ def exit_failure(alert_sentence : str) -> None :
     assert False
 
 
-def calculate_euclidean_distance(a : tuple[int, int], b : tuple[int, int]) -> int : 
+def calculate_euclidean_distance(a : tuple[float, float], b : tuple[float, float]) -> float : 
     assert len(a) == 2 and len(b) == 2   # 二次元しか考慮していない
-    assert a[0] == b[0] or a[1] == b[1]   # グリッドしか考慮していない
+    # 軸に平行な場合は差をそのまま返す（整数座標なら整数のまま）
     if a[0] == b[0] : 
         return abs(a[1] - b[1])
-    else : 
+    elif a[1] == b[1] : 
         return abs(a[0] - b[0])
+    else : 
+        return math.hypot(a[0] - b[0], a[1] - b[1])
     
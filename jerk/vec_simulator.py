@@ -0,0 +1,116 @@
+from logger import TotalLogger
+from simulator import Simulator, decide_action_by_dqn
+from world import World
+from vehicle_engine import VehicleEngine
+from profiler import Profiler
+from checkpoint import save_checkpoint
+from DQN.DQN import DQN
+
+
+# 複数のSimulatorを1プロセス内で同時に（ステップを揃えて）進める
+# recognize, DQNの行動決定, 運動の更新は全てのSimulatorの車をまとめて行う
+# 終了したSimulatorは次のエピソードにリセットする
+class VecSimulator :
+    def __init__(self, init_data : dict[str, any], total_logger : TotalLogger, dqn : DQN) -> None:
+        self.init_data = init_data
+        self.num_envs = init_data["num_envs"]
+        self.max_episode = init_data["max_episode"]
+
+        self.total_logger = total_logger
+        self.dqn = dqn
+
+        # まとめて行う処理の時間の計測（Simulator毎の処理はSimulatorのprofilerで計測する）
+        self.profiler = Profiler(init_data.get("profile", False))
+
+        # 全てのSimulatorの車の運動を一つのVehicleEngineで計算する
+        self.vehicle_engine = None
+        if init_data.get("vectorize", False) :
+            self.vehicle_engine = VehicleEngine(init_data["delta_t"])
+
+        # 道路網はSimulator毎に一度だけ作り、エピソード毎にはresetする
+        world_init_data = dict(init_data)
+        world_init_data["vectorize"] = False   # 運動はこのクラスのvehicle_engineでまとめて計算する
+        world_init_data["vehicle_engine"] = self.vehicle_engine   # 各Simulatorは車の登録・取り除きだけを行う
+        self.world_list = [World(world_init_data, total_logger, dqn) for _ in range(self.num_envs)]
+
+        self.next_pos_episode = init_data.get("start_episode", 1)
+        self.checkpoint_path = init_data.get("checkpoint_path")
+        self.checkpoint_interval = init_data.get("checkpoint_interval", 10)
+        self.finished_episode_count = 0
+        self.world_list = self.world_list[: max(0, self.max_episode - self.next_pos_episode + 1)]
+        self.simulator_list : list[Simulator] = [self.reset_world(world) for world in self.world_list]
+
+
+    def reset_world(self, world : World) -> Simulator :
+        pos_episode = self.next_pos_episode
+        self.next_pos_episode += 1
+        print()
+        print(pos_episode)
+
+        return world.reset(pos_episode)
+
+
+    def start(self) -> None :
+        while len(self.simulator_list) > 0 :
+            self.increment()
+
+
+    def increment(self) -> None :
+        self.profiler.start()
+
+        # 各vehicleが時刻tの状況を認識
+        for simulator in self.simulator_list :
+            simulator.recognize()
+        self.profiler.lap("recognize")
+
+        # 意思決定（DQNは全てのSimulatorの車をまとめて一度に決める）
+        dqn_vehicle_list = []
+        for simulator in self.simulator_list :
+            dqn_vehicle_list += simulator.decide_action_without_dqn()
+        decide_action_by_dqn(self.dqn, dqn_vehicle_list)
+        self.profiler.lap("decide_action")
+
+        # 各vehicleの状態を更新する
+        if self.vehicle_engine == None :
+            for simulator in self.simulator_list :
+                simulator.update_vehicle()
+        else :
+            self.vehicle_engine.update()
+        self.profiler.lap("update_vehicle")
+
+        # 各Simulatorを時刻t+1に進め、NNを更新する（学習のスケジュールはSimulator1つ分のステップ毎に数える）
+        for simulator in self.simulator_list :
+            simulator.update_environment()
+            self.profiler.start()
+            self.dqn.optimize()
+            self.profiler.lap("optimize")
+
+        # 終了したSimulatorを次のエピソードにリセットする
+        for index, simulator in enumerate(self.simulator_list) :
+            if simulator.simulation_end_flag :
+                self.finish_simulator(simulator)
+                if self.next_pos_episode <= self.max_episode :
+                    self.simulator_list[index] = self.reset_world(self.world_list[index])
+                else :
+                    self.simulator_list[index] = None
+                    self.world_list[index] = None
+        self.simulator_list = [simulator for simulator in self.simulator_list if simulator != None]
+        self.world_list = [world for world in self.world_list if world != None]
+
+
+    def finish_simulator(self, simulator : Simulator) -> None :
+        simulator.episode_logger.write_log()
+        simulator.register_profile([self.profiler.pop()])   # まとめて行った処理の時間は終了したエピソードに計上する
+        simulator.clear_vehicle()   # 共有しているvehicle_engineから取り除く
+        self.total_logger.finish_episode(simulator.pos_episode)
+
+        self.dqn.pos_episode = simulator.pos_episode
+        self.finished_episode_count += 1
+        if self.finished_episode_count % 10 == 0 :
+            self.total_logger.write_result()
+            self.dqn.write_result()
+
+        # 再開は実行中のエピソードのうち最も前のものから（実行中のエピソードはもう一度実行する）
+        if self.checkpoint_path != None and self.finished_episode_count % self.checkpoint_interval == 0 :
+            running_episode_list = [running.pos_episode for running in self.simulator_list if running != None and running is not simulator]
+            save_checkpoint(self.checkpoint_path, self.dqn, self.total_logger, min(running_episode_list + [self.next_pos_episode]))
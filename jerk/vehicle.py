@@ -4,14 +4,23 @@ if TYPE_CHECKING:
     from .simulator import Simulator
 
 from typing import Union 
-import copy 
 
 from util import exit_failure
-from IDM import get_jerk_by_IDM, get_proper_front_vehicle_distance
+from IDM import get_jerk_by_IDM, get_proper_front_vehicle_distance, get_idm_parameter
 from signals import Aspect
+from state import State
 
 class Vehicle : 
+    engine_slot = None   # VehicleEngineの配列上の位置（EngineVehicleのみ）
+
     def __init__(self, init_data : dict[str, Union[int, float, list[int]]], simulator : Simulator) -> None:
+        self.simulator : Simulator = simulator
+
+        self.reset(init_data)
+
+
+    # エピソードの開始時の状態に戻す（オブジェクトは使い回す）
+    def reset(self, init_data : dict[str, Union[int, float, list[int]]]) -> None : 
         # 属性
         self.number = init_data["number"]
         self.length = init_data["length"]
@@ -22,12 +31,17 @@ class Vehicle :
         self.accel = init_data["accel"]   # m/s^2 
         self.jerk = init_data["jerk"]   # m/s^3 
 
-        # 位置
-        self.lane_number = init_data["lane_number"] 
-        self.lane_place = init_data["lane_place"]
+        # 経路（route_listがなければdestinationまでの最短経路）
+        self.route_list : list[int] = init_data.get("route_list")
+        if self.route_list == None : 
+            self.route_list = self.simulator.router.find_vehicle_route(init_data)
+            if self.route_list == None or len(self.route_list) == 0 : 
+                exit_failure("not found route in Vehicle::reset")
+        self.route_distance_list : list[float] = self.simulator.router.get_route_distance_list(self.route_list)   # 各laneの始点までの累積距離（LeaderFinderで使う）
 
-        # 経路
-        self.route_list : list[int] = init_data["route_list"]
+        # 位置（lane_numberがなければ経路の最初のlane）
+        self.lane_number = init_data.get("lane_number", self.route_list[0]) 
+        self.lane_place = init_data["lane_place"]
 
         # jerk
         self.jerk_cand : list[int] = init_data["jerk_cand"]
@@ -36,10 +50,12 @@ class Vehicle :
         self.limit_velocity = init_data["limit_velocity"]
         self.limit_accel = init_data["limit_accel"]
         self.limit_brake = init_data["limit_brake"]
-        
-        self.simulator : Simulator = simulator
+        self.idm_parameter = get_idm_parameter(init_data.get("idm_parameter"), self.limit_velocity)   # IDMのパラメータ（v0, T, a, b, d, s0）
 
-        self.state_record = {}   # 各時刻での状態を記録
+        # 状態は時刻tとt+1の二つだけ持つ
+        self.state : State = None
+        self.prev_state : State = None
+        self.state_step = None   # stateを認識した時刻
 
         self.is_goal = False
         self.ignore_signal = False
@@ -48,23 +64,24 @@ class Vehicle :
     
     # 現在の状態を認識
     def recognize(self) -> None : 
-        # state_recordに記録があったら、計算時間の節約のためにそれを使う
-        if self.simulator.step_count in self.state_record.keys() : 
-            self.state = self.state_record[self.simulator.step_count]
+        # この時刻の状態を既に認識していたら、計算時間の節約のためにそれを使う
+        if self.state_step == self.simulator.step_count : 
             return
-
-        # 自身の状態
-        self.state = {
-            "accel" : self.accel, 
-            "velocity" : self.velocity, 
-            "over_velocity" : self.velocity > self.limit_velocity, 
-            "over_accel" : self.accel > self.limit_accel, 
-            "over_brake" : self.accel < self.limit_brake, 
-            "distance_intersection" : self.get_distance_next_intersection(), 
-            "is_stop" : self.velocity < 0.01, 
-            "is_goal" : self.is_goal, 
-            "ignore_signal" : self.ignore_signal
-        }
+        self.prev_state = self.state
+        self.state_step = self.simulator.step_count
+
+        # 自身の状態（EngineVehicleでは配列から読むので、一度だけ読む）
+        accel, velocity = self.accel, self.velocity
+        self.state = State()
+        self.state.accel = accel
+        self.state.velocity = velocity
+        self.state.over_velocity = velocity > self.limit_velocity
+        self.state.over_accel = accel > self.limit_accel
+        self.state.over_brake = accel < self.limit_brake
+        self.state.distance_intersection = self.get_distance_next_intersection()
+        self.state.is_stop = velocity < 0.01
+        self.state.is_goal = self.is_goal
+        self.state.ignore_signal = self.ignore_signal
 
         # 前の車の情報
         front_vehicle_info = self.simulator.get_front_vehicle_info(self)
@@ -107,27 +124,34 @@ class Vehicle :
 
         # 衝突したら終わり
         if self.state["is_collision"] : 
-            self.is_goal = True
+            self.set_goal()
 
         # 前の車がいなくなったら終わり
         if self.state["exist_front_vehicle"] == False : 
             pass
             # self.is_goal = True
 
-        # 記録結果をstate_recordにpush
-        self.state_record[self.simulator.step_count] = copy.deepcopy(self.state)
-
     
     # jerk決定
     def decide_action(self) -> None : 
         if self.decide_action_way == "DQN" : 
-            self.action = self.simulator.dqn.decide_action(self.state)
-            self.jerk = self.jerk_cand[self.action]
+            self.set_action(self.simulator.dqn.decide_action(self.state))
         elif self.decide_action_way == "IDM" : 
             self.jerk = get_jerk_by_IDM(self)
         else : 
             exit_failure("invalid Vehicle::decide_action")
 
+
+    # ゴールした（衝突した）車はこれ以降動かない
+    def set_goal(self) -> None : 
+        self.is_goal = True
+
+
+    # DQNで選んだ行動を反映する
+    def set_action(self, action : int) -> None : 
+        self.action = action
+        self.jerk = self.jerk_cand[action]
+
     
     def update(self) -> None : 
         if self.is_goal : 
@@ -156,33 +180,40 @@ class Vehicle :
         if self.lane_place + travel < pos_lane_length :   # tとt+1で同一レーン
             self.lane_place = self.lane_place + travel 
         else :   # t+1で違うレーンに移動
-            # 信号を守ったかチェック
-            self.ignore_signal = False
-            intersection_number = self.simulator.lane_dict[self.lane_number].to_intersection_number
-            signal_number = self.simulator.intersection_dict[intersection_number].signal_number
-            if signal_number == None : 
-                pass 
-            else : 
-                signal_state = self.simulator.signal_dict[signal_number].get_signal_state()
-                aspect : Aspect = signal_state["aspect"]
-                if aspect in [Aspect.RED, Aspect.YELLOW_TO_BLUE] : 
-                    self.ignore_signal = True
-
-            # レーン番号とレーン位置を修正   
-            self.route_index += 1 
-            if self.route_index == len(self.route_list) :   # ゴール
-                self.is_goal = True
-                self.lane_number = -1 
-                self.lane_place = 0 
-            else :   # レーン移動
-                self.lane_number = self.route_list[self.route_index]
-                self.lane_place = self.lane_place + travel - pos_lane_length
+            self.move_next_lane(travel, pos_lane_length)
+
+
+    # 交差点を通過して次のレーンに移動する（またはゴールする）
+    def move_next_lane(self, travel : float, pos_lane_length : float) -> None : 
+        # 信号を守ったかチェック
+        self.ignore_signal = False
+        intersection_number = self.simulator.lane_dict[self.lane_number].to_intersection_number
+        signal_number = self.simulator.intersection_dict[intersection_number].signal_number
+        if signal_number == None : 
+            pass 
+        else : 
+            signal_state = self.simulator.signal_dict[signal_number].get_signal_state()
+            aspect : Aspect = signal_state["aspect"]
+            if aspect in [Aspect.RED, Aspect.YELLOW_TO_BLUE] : 
+                self.ignore_signal = True
+
+        # レーン番号とレーン位置を修正   
+        self.simulator.lane_dict[self.lane_number].leave(self)
+        self.route_index += 1 
+        if self.route_index == len(self.route_list) :   # ゴール
+            self.set_goal()
+            self.lane_number = -1 
+            self.lane_place = 0 
+        else :   # レーン移動
+            self.lane_number = self.route_list[self.route_index]
+            self.lane_place = self.lane_place + travel - pos_lane_length
+            self.simulator.lane_dict[self.lane_number].enter(self)
 
 
     def push_experience(self) : 
         # このときのsimulatorの時刻はt+1であることに注意
-        state      = self.state_record[self.simulator.step_count - 1]
-        next_state = self.state_record[self.simulator.step_count]
+        state      = self.prev_state
+        next_state = self.state
         action = self.action if self.decide_action_way == "DQN" else None
         reward = self.simulator.calculate_reward(self, state, next_state) if self.decide_action_way == "DQN" else None
 
@@ -191,7 +222,8 @@ class Vehicle :
             self.simulator.total_logger.register_reward(self.simulator.pos_episode, reward)
 
         # 経験をloggerに登録
-        self.simulator.episode_logger.register_vehicle_log(self.number, self.make_log(state, reward))
+        if self.simulator.episode_logger.is_active : 
+            self.simulator.episode_logger.register_vehicle_log(self.number, self.make_log(state, reward))
 
 
     # 次の交差点までの距離を取得する
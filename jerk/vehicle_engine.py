@@ -0,0 +1,151 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from .simulator import Simulator
+
+import numpy as np
+
+from vehicle import Vehicle
+
+
+# EngineVehicleの運動状態のうち、VehicleEngineの配列に持つもの
+ENGINE_FIELD_LIST = ["velocity", "prev_velocity", "accel", "jerk", "lane_place"]
+
+
+# vehicleの運動状態を配列で持ち、速度・位置の更新をまとめて行う
+# Vehicle::update_velocity, Vehicle::update_place と同じ計算をする
+# 配列が運動状態の本体で、EngineVehicleの属性は配列を読み書きする
+# EngineVehicleは作られたときにslotを確保し、poolで使い回している間も同じslotを使う
+class VehicleEngine :
+    def __init__(self, delta_t : float, capacity : int = 16) -> None:
+        self.delta_t = delta_t
+
+        self.vehicle_list : list[EngineVehicle] = []   # slot -> vehicle
+
+        self.velocity = np.zeros(capacity)
+        self.prev_velocity = np.zeros(capacity)
+        self.accel = np.zeros(capacity)
+        self.jerk = np.zeros(capacity)
+        self.lane_number = np.full(capacity, -1, dtype=np.int64)
+        self.lane_place = np.zeros(capacity)
+        self.lane_length = np.zeros(capacity)
+        self.length = np.zeros(capacity)
+        self.limit_accel = np.zeros(capacity)
+        self.limit_brake = np.zeros(capacity)
+        self.is_goal = np.zeros(capacity, dtype=bool)
+        self.is_used = np.zeros(capacity, dtype=bool)   # Simulatorに登録されているか（poolにある車はFalse）
+
+
+    def __len__(self) -> int :
+        return int(np.count_nonzero(self.is_used))
+
+
+    # vehicleのslotを確保する（EngineVehicleを作るとき）
+    def reserve(self, vehicle : EngineVehicle) -> int :
+        slot = len(self.vehicle_list)
+        self.vehicle_list.append(vehicle)
+        if slot >= len(self.velocity) :
+            self.grow(2 * len(self.velocity))
+        return slot
+
+
+    # Simulatorに登録された車を更新の対象にする
+    def add(self, vehicle : EngineVehicle) -> None :
+        slot = vehicle.engine_slot
+        self.prev_velocity[slot] = self.velocity[slot]
+        self.length[slot] = vehicle.length
+        self.limit_accel[slot] = vehicle.limit_accel
+        self.limit_brake[slot] = vehicle.limit_brake
+        self.is_goal[slot] = vehicle.is_goal
+        self.is_used[slot] = True
+        self.load(vehicle)
+
+
+    def remove(self, vehicle : EngineVehicle) -> None :
+        self.is_used[vehicle.engine_slot] = False
+
+
+    # vehicleのレーンの値を配列に読み込む（登録時とレーンの移動時）
+    def load(self, vehicle : EngineVehicle) -> None :
+        slot = vehicle.engine_slot
+        self.lane_number[slot] = vehicle.lane_number
+        self.lane_length[slot] = 0 if vehicle.is_goal else vehicle.simulator.get_lane_length(vehicle.lane_number)
+
+
+    def grow(self, capacity : int) -> None :
+        for name in ["velocity", "prev_velocity", "accel", "jerk", "lane_number", "lane_place", "lane_length",
+                     "length", "limit_accel", "limit_brake", "is_goal", "is_used"] :
+            old_array = getattr(self, name)
+            new_array = np.zeros(capacity, dtype=old_array.dtype)
+            new_array[: len(old_array)] = old_array
+            setattr(self, name, new_array)
+
+
+    def update(self) -> None :
+        vehicle_list = self.vehicle_list
+        size = len(vehicle_list)
+        if size == 0 :
+            return
+
+        # jerkはdecide_actionで、ゴールはVehicle::set_goalで配列に書き込まれている
+        slot_array = np.flatnonzero(self.is_used[: size] & ~self.is_goal[: size])
+        if len(slot_array) == 0 :
+            return
+
+        delta_t = self.delta_t
+
+        # 速度を更新する（Vehicle::update_velocity）
+        accel = self.accel[slot_array] + self.jerk[slot_array] * delta_t
+        accel = np.minimum(self.limit_accel[slot_array], accel)
+        accel = np.maximum(self.limit_brake[slot_array], accel)
+        prev_velocity = self.velocity[slot_array]
+        velocity = prev_velocity + accel * delta_t
+        velocity = np.maximum(0, velocity)
+
+        # 場所を更新する（Vehicle::update_place）
+        travel = prev_velocity * delta_t + 0.5 * accel * (delta_t ** 2)
+        travel = np.maximum(travel, 0)
+        lane_length = self.lane_length[slot_array]
+        lane_place = self.lane_place[slot_array] + travel
+        same_lane = lane_place < lane_length
+
+        self.prev_velocity[slot_array] = prev_velocity
+        self.accel[slot_array] = accel
+        self.velocity[slot_array] = velocity
+        self.lane_place[slot_array[same_lane]] = lane_place[same_lane]
+
+        # レーンを移動する車だけVehicle::move_next_laneで処理する（数が少ない）
+        next_lane = ~same_lane
+        for slot, pos_travel, pos_lane_length in zip(slot_array[next_lane].tolist(), travel[next_lane].tolist(), lane_length[next_lane].tolist()) :
+            vehicle = vehicle_list[slot]
+            vehicle.move_next_lane(pos_travel, pos_lane_length)
+            self.load(vehicle)
+
+
+# 運動状態の属性（ENGINE_FIELD_LIST）をVehicleEngineの配列で読み書きする
+def make_engine_property(name : str) -> property :
+    def get_value(vehicle : EngineVehicle) -> float :
+        return getattr(vehicle.engine, name).item(vehicle.engine_slot)
+
+    def set_value(vehicle : EngineVehicle, value : float) -> None :
+        getattr(vehicle.engine, name)[vehicle.engine_slot] = value
+
+    return property(get_value, set_value)
+
+
+# VehicleEngineを使うSimulatorの車（Spawner::get_vehicleで作る）
+# ENGINE_FIELD_LISTの属性はクラスの定義の後にmake_engine_propertyで作る
+class EngineVehicle(Vehicle) :
+    def __init__(self, init_data : dict[str, any], simulator : Simulator) -> None:
+        self.engine : VehicleEngine = simulator.vehicle_engine
+        self.engine_slot = self.engine.reserve(self)
+        super().__init__(init_data, simulator)
+
+
+    def set_goal(self) -> None :
+        super().set_goal()
+        self.engine.is_goal[self.engine_slot] = True
+
+
+for name in ENGINE_FIELD_LIST :
+    setattr(EngineVehicle, name, make_engine_property(name))
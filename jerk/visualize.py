@@ -1,10 +1,10 @@
-import matplotlib.pyplot as plt
-import pandas as pd 
 import os
+from report import get_pyplot, read_csv
 
 def write_velocity_graph(vehicle_log_path : str, vehicle_number : int) -> None : 
+    plt = get_pyplot()
     delta_t = 0.2
-    vehicle_log = pd.read_csv(vehicle_log_path)
+    vehicle_log = read_csv(vehicle_log_path)
     velocity_list = vehicle_log["velocity"].to_list() 
     time_list = [t * delta_t for t in range(len(velocity_list))]
     plt.plot(time_list, velocity_list)
@@ -15,4 +15,3 @@ def write_velocity_graph(vehicle_log_path : str, vehicle_number : int) -> None :
     os.system("mkdir -p " + vehicle_log_path + "/../graph")
     plt.savefig(vehicle_log_path + "/../graph/number_" + str(vehicle_number))
     plt.clf()
-
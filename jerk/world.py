@@ -0,0 +1,28 @@
+from logger import TotalLogger
+from simulator import Simulator
+from scenario import set_network, set_episode
+from network import make_network
+from DQN.DQN import DQN
+
+
+# 道路網（signal, intersection, lane, 経路の距離）を一度だけ作り、
+# エピソード毎にはreset()でvehicleと信号の表示だけを初期化する
+class World : 
+    def __init__(self, init_data : dict[str, any], total_logger : TotalLogger, dqn : DQN) -> None:
+        self.init_data = dict(init_data)
+        set_network(self.init_data)
+        if self.init_data.get("network") == None : 
+            self.init_data["network"] = make_network(self.init_data)
+
+        self.total_logger = total_logger
+        self.dqn = dqn
+        self.simulator : Simulator = None
+
+
+    def reset(self, pos_episode : int) -> Simulator : 
+        set_episode(self.init_data, pos_episode)
+        if self.simulator == None : 
+            self.simulator = Simulator(self.init_data, self.total_logger, self.dqn)
+        else : 
+            self.simulator.reset(self.init_data)
+        return self.simulator
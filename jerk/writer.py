@@ -0,0 +1,99 @@
+import threading, queue, time
+from typing import Callable
+
+
+DEFAULT_QUEUE_SIZE = 8
+
+
+# ファイルの書き出し（ログ, グラフ, モデル, チェックポイント）を別スレッドで順に行う
+# submitには書き出す内容のスナップショット（この後で変更されないもの）を渡す
+# キューが一杯のときはsubmitが空くまで待つ（待った時間をbackpressureとして記録する）
+# 書き出しは投入した順に行うので、同じファイルへの追記や、書き出したファイルを読む処理の順序は保たれる
+class AsyncWriter : 
+    def __init__(self, queue_size : int = DEFAULT_QUEUE_SIZE) -> None:
+        self.queue_size = queue_size
+        self.task_queue : queue.Queue = queue.Queue(maxsize=queue_size)
+        self.error : BaseException = None   # スレッドで起きた例外（次のsubmit, flushで投げ直す）
+
+        # name -> {"count", "write_time" : 書き出しにかかった時間, "wait_time" : submitで待った時間, "wait_count"}
+        self.metrics_dict : dict[str, dict[str, float]] = {}
+        self.max_queue_length = 0
+        self.lock = threading.Lock()
+
+        self.thread = threading.Thread(target=self.run, name="AsyncWriter", daemon=True)
+        self.thread.start()
+
+
+    def run(self) -> None : 
+        while True : 
+            task = self.task_queue.get()
+            if task == None : 
+                self.task_queue.task_done()
+                break
+            name, function, args = task
+            start_time = time.perf_counter()
+            try : 
+                if self.error == None : 
+                    function(*args)
+            except BaseException as error : 
+                self.error = error
+            with self.lock : 
+                self.get_metrics(name)["write_time"] += time.perf_counter() - start_time
+            self.task_queue.task_done()
+
+
+    def get_metrics(self, name : str) -> dict[str, float] : 
+        if name not in self.metrics_dict : 
+            self.metrics_dict[name] = {"count" : 0, "write_time" : 0.0, "wait_time" : 0.0, "wait_count" : 0}
+        return self.metrics_dict[name]
+
+
+    def submit(self, name : str, function : Callable, *args : any) -> None : 
+        self.raise_error()
+        start_time = time.perf_counter()
+        wait = self.task_queue.full()
+        self.task_queue.put((name, function, args))
+        wait_time = time.perf_counter() - start_time
+        with self.lock : 
+            metrics = self.get_metrics(name)
+            metrics["count"] += 1
+            if wait : 
+                metrics["wait_count"] += 1
+                metrics["wait_time"] += wait_time
+            self.max_queue_length = max(self.max_queue_length, self.task_queue.qsize())
+
+
+    # 投入した書き出しが全て終わるまで待つ
+    def flush(self) -> None : 
+        self.task_queue.join()
+        self.raise_error()
+
+
+    def close(self) -> None : 
+        self.task_queue.put(None)
+        self.thread.join()
+        self.raise_error()
+
+
+    def raise_error(self) -> None : 
+        if self.error != None : 
+            raise RuntimeError("AsyncWriter failed") from self.error
+
+
+    # backpressureの指標（wait_timeが大きければ書き出しが学習に追いついていない）
+    def get_report(self) -> dict[str, any] : 
+        with self.lock : 
+            return {
+                "queue_size" : self.queue_size, 
+                "max_queue_length" : self.max_queue_length, 
+                "queue_length" : self.task_queue.qsize(), 
+                "task" : {name : dict(metrics) for name, metrics in self.metrics_dict.items()}
+            }
+
+
+# writerがあれば別スレッドで、なければその場で書き出す
+def submit_write(writer : AsyncWriter, name : str, function : Callable, *args : any) -> None : 
+    if writer == None : 
+        function(*args)
+    else : 
+        writer.submit(name, function, *args)